@@ -13,82 +13,179 @@
             - Web Search Integration: Search the web to supplement document-based answers
             - Web Scraping: Give a Web URL and then chat with its content
             - Save Content: Saves the generated content to the file system
+            - Token Streaming: Answers are rendered as the tokens are generated
+            - Bounded Context: The prompt is kept within a token budget, older turns are summarized and old tool outputs shortened
 '''
 
 '''
 Features need to add:
-  - To support token streaming
   - To use Graph RAG Technique for advanced document retrieval
   - To support multi-modal inputs (like image inputs)
   - To enhance chat history for the modal
 '''
 
-from langchain_ollama import ChatOllama
-from langchain_groq import ChatGroq
-from langchain_openai import AzureChatOpenAI
 from langgraph.graph import StateGraph, START, END
-from langgraph.checkpoint.memory import MemorySaver
-from langchain_core.messages import AnyMessage, HumanMessage, SystemMessage, ToolMessage
+from langgraph.graph.message import add_messages
+from langchain_core.messages import AnyMessage, AIMessage, AIMessageChunk, HumanMessage, SystemMessage, ToolMessage
 from typing import Annotated, TypedDict
 from dotenv import load_dotenv
 from tools import DocumentRetrieverTool, WebSearchTool, WebScraperTool, SaveContentTool
-import operator
 from langchain_community.chat_message_histories import SQLChatMessageHistory
-from utils.chat_util import _save_chat_session, _load_chat_session, _detect_document_query
+from utils.chat_util import _save_chat_session, _load_chat_session, _show_older_messages, _search_chat_sessions, _show_stats, _show_jobs, _detect_document_query, _document_query_prompt, document_fast_path, ThrottledMarkdown
+from utils.context_util import TokenCounter, ContextManager, system_prompt
+from utils.tracing import span
+from utils.llm_client import get_http_client, get_async_http_client, get_transport, get_async_transport
+from utils.checkpoint_util import get_checkpointer
 from rich import print as rprint
 from rich.console import Console
 from rich.markdown import Markdown
+from rich.live import Live
 from rich.prompt import Prompt
 import os
+import time
+import threading
+import contextvars
+import uuid
+from concurrent.futures import ThreadPoolExecutor
 from prompts.prompt import aida_v011_prompt
+from tools.RAG.Registry import warm_up
+from tools.RAG.Prefetch import prefetch, get_prefetcher
 
 class AgentState(TypedDict):
-  messages: Annotated[list[AnyMessage],operator.add]
+  # add_messages lets the context manager replace old tool results and remove summarized turns by id
+  messages: Annotated[list[AnyMessage],add_messages]
+  summary: str
+  prompt_tokens: int
+  # {"filepath", "query"} of a detected document query, answered by the router without a routing LLM call
+  document: dict
+
+def get_tool_concurrency(value: str) -> dict:
+  '''
+  Parses per tool concurrency limits of the form "DocumentRetrieval=1,SaveContent=1"
+  '''
+  limits = {}
+  for item in value.split(","):
+    if "=" in item:
+      name, limit = item.split("=", 1)
+      limits[name.strip()] = int(limit)
+  return limits
 
 class Agent:
-  def __init__(self, provider: str, model_name: str, system_prompt: str, tools: list):
-    self.checkpointer = MemorySaver()
+  def __init__(self, provider: str, model_name: str, system_prompt: str, tools: list, max_parallel_tools: int = None, tool_concurrency: dict = None, llm = None, checkpointer = None):
+    # Checkpoints are kept on disk and pruned per thread (AIDA_CHECKPOINTER), not in process memory
+    self.checkpointer = checkpointer if checkpointer is not None else get_checkpointer()
     self.system = system_prompt
     self.tools = {t.name: t for t in tools}
-    self.llm = self.get_llm(provider=provider, model_name=model_name).bind_tools(tools)
+    # Independent tool calls of one turn run concurrently, bounded overall and per tool (SaveContent
+    # always writes the same file). Document lookups are not limited, indexing is serialized per document.
+    self.max_parallel_tools = max_parallel_tools or int(os.getenv("AIDA_MAX_PARALLEL_TOOLS", "4"))
+    if tool_concurrency is None:
+      tool_concurrency = get_tool_concurrency(os.getenv("AIDA_TOOL_CONCURRENCY", "SaveContent=1"))
+    self.tool_limits = {name: threading.Semaphore(limit) for name, limit in tool_concurrency.items()}
+    self.tool_pool = ThreadPoolExecutor(max_workers=self.max_parallel_tools, thread_name_prefix="aida-tool")
+    # A chat model can be passed in directly, e.g. a local fake for the benchmarks
+    base_llm = llm if llm is not None else self.get_llm(provider=provider, model_name=model_name)
+    self.llm = base_llm.bind_tools(tools)
+    # Every prompt is kept within a token budget, old turns are summarized by the same model
+    self.token_counter = TokenCounter(provider, model_name)
+    self.context_manager = ContextManager(self.token_counter, llm=base_llm)
     graph = StateGraph(AgentState)
+    graph.add_node("router", self.router_node)
+    graph.add_node("context", self.context_node)
     graph.add_node("llm", self.llm_node)
     graph.add_node("tools", self.tool_node)
+    graph.add_edge("router", "context")
+    graph.add_edge("context", "llm")
     graph.add_conditional_edges("llm", self.conditional_edge, {True:"tools", False:END})
-    graph.add_edge("tools", "llm")
-    graph.set_entry_point("llm")
+    graph.add_edge("tools", "context")
+    graph.set_entry_point("router")
     self.graph = graph.compile(checkpointer=self.checkpointer)
 
   def get_llm(self, provider: str, model_name: str):
+    # Only the selected provider's client library is imported. All clients of a provider share one
+    # connection pool with its rate limits and retries, so the SDK's own retries are turned off.
+    # The async clients (ainvoke, astream) get the async transport, which shares the same limits.
     if provider == 'ollama':
-      return ChatOllama(model=model_name)
+      from langchain_ollama import ChatOllama
+      return ChatOllama(model=model_name, sync_client_kwargs={"transport": get_transport("ollama")},
+                        async_client_kwargs={"transport": get_async_transport("ollama")})
     elif provider == 'azure':
-      return AzureChatOpenAI(model=model_name, api_version='2024-05-01-preview')
+      from langchain_openai import AzureChatOpenAI
+      return AzureChatOpenAI(model=model_name, api_version='2024-05-01-preview', http_client=get_http_client("azure"),
+                             http_async_client=get_async_http_client("azure"), max_retries=0)
     else:
-      return ChatGroq(model=model_name)
+      from langchain_groq import ChatGroq
+      return ChatGroq(model=model_name, http_client=get_http_client("groq"), http_async_client=get_async_http_client("groq"), max_retries=0)
+
+  def router_node(self, state: AgentState):
+    # A detected document query calls DocumentRetrieval directly, the LLM is only called to answer.
+    # The call and its result are added as if the LLM had made it, so the history stays well formed.
+    document = state.get("document")
+    if not document or "DocumentRetrieval" not in self.tools:
+      return {"document": None}
+    with span("router", fast_path=True):
+      call = {"name": "DocumentRetrieval", "args": {"filepath": document["filepath"], "query": document["query"]}, "id": f"route_{uuid.uuid4().hex[:12]}", "type": "tool_call"}
+      result = self.run_tool(call)
+    return {"messages": [AIMessage(content="", tool_calls=[call]), result], "document": None}
+
+  def context_node(self, state: AgentState):
+    with span("context") as stage:
+      update = self.context_manager.manage(self.system, state.get("summary", ""), state["messages"])
+      stage.set("summarized", "summary" in update)
+      return update
 
   def llm_node(self, state: AgentState):
     messages = state["messages"]
-    if self.system:
-      messages = [SystemMessage(content=self.system)] + messages
-    response = self.llm.invoke(messages)
-    return {"messages":[response]}
+    system = system_prompt(self.system, state.get("summary", ""))
+    if system:
+      messages = [SystemMessage(content=system)] + messages
+    estimated = self.token_counter.count(messages)
+    with span("llm") as stage:
+      response = self.llm.invoke(messages)
+      # The provider's own count, when it reports one, also corrects later estimates
+      usage = response.usage_metadata or {}
+      actual = usage.get("input_tokens", 0)
+      stage.set("prompt_tokens", actual or estimated)
+      stage.set("output_tokens", usage.get("output_tokens", 0))
+      stage.set("tool_calls", len(response.tool_calls))
+    self.token_counter.calibrate(estimated, actual)
+    return {"messages":[response], "prompt_tokens": actual or estimated}
+
+  def run_tool(self, t: dict) -> ToolMessage:
+    if t["name"] == "DocumentRetrieval":
+      args = t["args"]
+      filepath = args["filepath"]
+      # A list of documents is passed through as it is
+      if isinstance(filepath, str):
+        t["args"]["filepath"] = filepath.strip()
+    rprint(f"[blue]Using Tool: {t['name']}[blue]")
+    limit = self.tool_limits.get(t["name"])
+    with span(f"tool.{t['name']}") as stage:
+      try:
+        if limit is not None:
+          with limit:
+            result = self.tools[t["name"]].invoke(t["args"])
+        else:
+          result = self.tools[t["name"]].invoke(t["args"])
+      except Exception as e:
+        rprint(f"[red]Tool {t['name']} failed: {str(e)}[red]")
+        result = f"Tool error: {str(e)}"
+        stage.set("failed", True)
+      stage.set("output_chars", len(str(result)))
+    return ToolMessage(content=str(result), tool_name=t["name"], tool_call_id = t["id"])
 
   def tool_node(self, state: AgentState):
     tool_calls = state["messages"][-1].tool_calls
-    results = []
-    for t in tool_calls:
-      if t["name"] in self.tools:
-        if t["name"] == "DocumentRetrieval":
-          args = t["args"]
-          filepath = args["filepath"]
-          filepath = str(filepath.strip())
-          t["args"]["filepath"] = filepath
-        rprint(f"[blue]Using Tool: {t["name"]}[blue]")
-        result = self.tools[t["name"]].invoke(t["args"])
-        results.append(ToolMessage(content=str(result), tool_name=t["name"], tool_call_id = t["id"]))
-      else:
-        rprint("[red]Requested Tool is not available[red]")
+    futures = []
+    with span("tool_node", tool_calls=len(tool_calls)):
+      for t in tool_calls:
+        if t["name"] in self.tools:
+          # Each tool runs in a copy of this context, so its spans are children of the tool node
+          futures.append(self.tool_pool.submit(contextvars.copy_context().run, self.run_tool, t))
+        else:
+          rprint("[red]Requested Tool is not available[red]")
+      # Results are collected in the order of the tool calls, whatever order they finish in
+      results = [future.result() for future in futures]
     rprint("[blue]Analysing...[blue]")
     return {"messages":results}
 
@@ -107,10 +204,82 @@ def get_model_name(provider: str, groq: str, ollama: str, azure: str)->str:
   else:
     return groq
 
+def turn_events(agent: Agent, messages: list, config: dict, document: dict = None):
+  '''
+  Runs one turn of the graph and yields its progress as (event, value) pairs:
+    ("token", text), ("output_tokens", n), ("prompt_tokens", n), ("tool_calls", [names]), ("tool_result", name)
+  A `document` {"filepath", "query"} is retrieved by the router before the first LLM call
+  '''
+  for mode, data in agent.graph.stream({"messages":messages, "document":document}, config=config, stream_mode=["messages", "updates"]):
+    if mode == "messages":
+      chunk, metadata = data
+      if metadata.get("langgraph_node") != "llm" or not isinstance(chunk, AIMessageChunk):
+        continue
+      if chunk.usage_metadata:
+        yield "output_tokens", chunk.usage_metadata.get("output_tokens", 0)
+      if chunk.content:
+        yield "token", chunk.content
+    elif mode == "updates":
+      for node, update in data.items():
+        # The context node reports the prompt tokens of its summary call, the llm node those of the agent's call
+        if node in ("context", "llm") and (update or {}).get("prompt_tokens"):
+          yield "prompt_tokens", update["prompt_tokens"]
+        for message in (update or {}).get("messages", []):
+          if node in ("llm", "router") and getattr(message, "tool_calls", None):
+            yield "tool_calls", [t["name"] for t in message.tool_calls]
+          elif node in ("tools", "router") and isinstance(message, ToolMessage):
+            yield "tool_result", getattr(message, "tool_name", None) or message.name
+
+def stream_turn(agent: Agent, messages: list, config: dict, console: Console, document: dict = None) -> str:
+  '''
+  Runs one turn of the graph, rendering LLM tokens as they arrive and tool progress in between
+  Output:
+    content : str - the final answer of the turn
+  '''
+  st = time.perf_counter()
+  first_token = None
+  tokens = 0
+  usage_tokens = 0
+  prompt_tokens = []
+  with span("turn") as turn, Live(Markdown(""), auto_refresh=False, console=console) as live:
+    renderer = ThrottledMarkdown(live)
+    for event, value in turn_events(agent, messages, config, document):
+      if event == "output_tokens":
+        usage_tokens += value
+      elif event == "token":
+        if first_token is None:
+          first_token = time.perf_counter()
+        tokens += 1
+        renderer.append(value)
+      elif event == "prompt_tokens":
+        prompt_tokens.append(value)
+      elif event == "tool_calls":
+        renderer.flush()
+        live.console.print(f"[blue]Calling: {', '.join(value)}[blue]")
+      elif event == "tool_result":
+        live.console.print(f"[blue]Finished: {value}[blue]")
+    renderer.flush()
+    turn.set("llm_calls", len(prompt_tokens))
+    turn.set("prompt_tokens", sum(prompt_tokens))
+    turn.set("output_tokens", usage_tokens or tokens)
+  et = time.perf_counter()
+
+  content = agent.graph.get_state(config).values["messages"][-1].content
+  if not renderer.text and content:
+    console.print(Markdown(content))
+  tokens = usage_tokens or tokens
+  if first_token is not None:
+    generation_time = max(et - first_token, 1e-9)
+    rprint(f"[dim]Time to first token: {first_token - st:.2f}s | {tokens / generation_time:.1f} tokens/sec | Total: {et - st:.2f}s[/dim]")
+  if prompt_tokens:
+    rprint(f"[dim]LLM calls: {len(prompt_tokens)}{' (document fast path)' if document else ''} | Prompt tokens: {' + '.join(str(n) for n in prompt_tokens)} (budget {agent.context_manager.budget})[/dim]")
+  return content
 
 def chat():
 
   load_dotenv()
+  # Load the embedding model in the background so the first document query is not the slow one
+  warm_up()
   groq_model_name = os.getenv('GROQ_MODEL_NAME')
   ollama_model_name = os.getenv('OLLAMA_MODEL_NAME')
   azure_model_name = os.getenv('AZURE_MODEL_NAME')
@@ -125,30 +294,56 @@ def chat():
   prompt = aida_v011_prompt
 
   agent = Agent(provider=default_provider, model_name=get_model_name(default_provider, groq_model_name, ollama_model_name, azure_model_name), system_prompt=prompt, tools = tools)
-  config = {"configurable":{"thread_id":"1"}}
+  # Every run of the chat starts a new thread, its checkpoints are deleted on exit
+  thread_id = f"chat-{uuid.uuid4().hex}"
+  config = {"configurable":{"thread_id":thread_id}}
   chat_history.add_message(SystemMessage(content=prompt))
   isChatLoaded = False
   rprint("[bold green]AiDA - CLI : AI Document Assistant V 0.1.1[/bold green]")
   rprint(f"[blue]LLM Provider: {default_provider} \nModel: {get_model_name(default_provider, groq_model_name, ollama_model_name, azure_model_name)}[blue]")
-  rprint("[italic]Type 'exit' to end conversation, '/save' to save, '/load' to load[/italic]\n")
+  rprint("[italic]Type 'exit' to end conversation, '/save' to save, '/load' to load, '/more' for older messages of a loaded chat, '/search <words>' to search saved chats, '/stats' for latency statistics, '/jobs' for background indexing, '/cancel' to stop it[/italic]\n")
 
   while True:
     user = Prompt.ask("[bold yellow]User[/bold yellow] ").strip()
 
-    doc_info = _detect_document_query(user)
+    doc_info = _detect_document_query(user) if not user.startswith("/") else None
+    document = None
 
     if doc_info:
       filepath, query = doc_info
-      document_query_prompt = f"Use the below filepath (use as such don't change anyting in the filepath) and query to call the DocumentRetriever Tool: filepath: {filepath} , query: {query}"
-      user = document_query_prompt
+      if document_fast_path():
+        document = {"filepath": filepath, "query": query}
+      else:
+        user = _document_query_prompt(filepath, query)
+      # Parsing and embedding start now and overlap with the LLM call that decides to use DocumentRetrieval
+      prefetch(filepath)
 
     if user == "exit":
+      get_prefetcher().cancel()
       chat_history.clear()
+      delete_thread = getattr(agent.checkpointer, "delete_thread", None)
+      if delete_thread is not None:
+        delete_thread(thread_id)
       break
 
+    elif user == "/jobs":
+      _show_jobs()
+
+    elif user == "/cancel":
+      rprint(f"[yellow]Cancelled {get_prefetcher().cancel()} background indexing jobs[/yellow]")
+
     elif user == "/save":
       _save_chat_session(chat_history=chat_history)
 
+    elif user == "/more":
+      _show_older_messages(chat_history=chat_history)
+
+    elif user == "/stats":
+      _show_stats()
+
+    elif user.startswith("/search"):
+      _search_chat_sessions(user[len("/search"):].strip())
+
     elif user == "/load":
       _load_chat_session(chat_history=chat_history)
       messages = chat_history.get_messages()
@@ -162,10 +357,9 @@ def chat():
         messages = [HumanMessage(content=user)]
 
       chat_history.add_user_message(user)
-      response = agent.graph.invoke({"messages":messages},config=config)
       rprint("[bold green]AiDA:[/bold green]")
-      chat_history.add_ai_message(response["messages"][-1].content)
-      console.print(Markdown(response["messages"][-1].content))
+      content = stream_turn(agent, messages, config, console, document)
+      chat_history.add_ai_message(content)
 
 if __name__ == "__main__":
   chat()
\ No newline at end of file
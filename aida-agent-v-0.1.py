@@ -35,7 +35,9 @@ from langchain.agents import AgentExecutor, create_tool_calling_agent
 from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
 from langchain_core.messages import SystemMessage
 from langchain_community.chat_message_histories import SQLChatMessageHistory
-from utils.chat_util import _process_input, _process_stream_chunk, _save_chat_session, _load_chat_session
+from utils.chat_util import _process_input, _process_stream_chunk, _save_chat_session, _load_chat_session, _show_older_messages, _search_chat_sessions, _show_stats, ThrottledMarkdown
+from utils.tracing import span
+from utils.llm_client import get_http_client, get_async_http_client, get_transport, get_async_transport
 from prompts.prompt import aida_v01_prompt
 
 # Importing RAG Tool
@@ -53,7 +55,7 @@ ollama_model_name = os.getenv('OLLAMA_MODEL_NAME')
 default_provider = os.getenv('DEFAULT_PROVIDER')
 console = Console()
 
-model = ChatOllama(model=ollama_model_name) if default_provider=='ollama' else ChatGroq(model=groq_model_name)
+model = ChatOllama(model=ollama_model_name, sync_client_kwargs={"transport": get_transport("ollama")}, async_client_kwargs={"transport": get_async_transport("ollama")}) if default_provider=='ollama' else ChatGroq(model=groq_model_name, http_client=get_http_client("groq"), http_async_client=get_async_http_client("groq"), max_retries=0)
 
 class AIDAAgent:
     def __init__(self):
@@ -92,7 +94,7 @@ class AIDAAgent:
     def chat(self):
         rprint("[bold green]AiDA - CLI : AI Document Assistant V 0.1[/bold green]")
         rprint(f"[blue]LLM Provider: {default_provider} \nModel: {ollama_model_name if default_provider == 'ollama' else groq_model_name}[blue]")
-        rprint("[italic]Type 'exit' to end conversation, '/save' to save, '/load' to load[/italic]\n")
+        rprint("[italic]Type 'exit' to end conversation, '/save' to save, '/load' to load, '/more' for older messages of a loaded chat, '/search <words>' to search saved chats, '/stats' for latency statistics[/italic]\n")
 
         while True:
             try:
@@ -108,17 +110,26 @@ class AIDAAgent:
                 elif user_input == "/load":
                     _load_chat_session(self.chat_history)
                     continue
+                elif user_input == "/more":
+                    _show_older_messages(self.chat_history)
+                    continue
+                elif user_input == "/stats":
+                    _show_stats()
+                    continue
+                elif user_input.startswith("/search"):
+                    _search_chat_sessions(user_input[len("/search"):].strip())
+                    continue
 
                 # Process normal input
                 processed = _process_input(user_input)
                 self.chat_history.add_user_message(user_input)
 
                 full_response = []
-                markdown_content = ""
                 final_output = ""
                 rprint("[bold green]AiDA:[/bold green]")
 
-                with Live(Markdown(markdown_content), auto_refresh=False, console=console) as live:
+                with span("turn"), Live(Markdown(""), auto_refresh=False, console=console) as live:
+                    renderer = ThrottledMarkdown(live)
                     for chunk in self.agent_executor.stream({
                         "input": processed["input"],
                         "chat_history": self.chat_history.messages
@@ -127,11 +138,11 @@ class AIDAAgent:
 
                         if chunk_content:
                             full_response.append(chunk_content)
-                            markdown_content += chunk_content
-                            live.update(Markdown(markdown_content), refresh=True)
+                            renderer.append(chunk_content)
 
                         if isinstance(chunk, dict) and "output" in chunk:
                             final_output = chunk["output"]
+                    renderer.flush()
 
                 # Update chat history
                 if final_output and not full_response:
@@ -0,0 +1,82 @@
+'''
+    AiDA Batch
+
+        Runs a set of queries through the AiDA Agent V 0.1.1 graph without the interactive chat, e.g. for
+        evaluation sets and nightly reports. Each query runs in its own conversation, several at a time.
+
+        The input is a JSONL file with one query per line:
+            {"id": "q1", "query": "What is the warranty period?", "filepath": "docs/manual.pdf"}
+        "filepath" and "id" are optional. Every result (answer or error, tool calls, token counts and stage
+        timings) is appended to the output JSONL file as soon as it is done. Re-running the same command
+        skips the queries that already succeeded, so an interrupted batch continues where it stopped.
+
+        Usage:
+            python batch.py queries.jsonl results.jsonl [--concurrency N] [--limit N] [--summary summary.json] [--verbose]
+'''
+
+import argparse
+import contextlib
+import importlib.util
+import json
+import os
+import sys
+from dotenv import load_dotenv
+from rich.console import Console
+
+AGENT_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "aida-agent-v-0.1.1.py")
+
+def _load_agent_module():
+  spec = importlib.util.spec_from_file_location("aida_agent_v011", AGENT_SCRIPT)
+  module = importlib.util.module_from_spec(spec)
+  spec.loader.exec_module(module)
+  return module
+
+if __name__ == "__main__":
+  parser = argparse.ArgumentParser(description="Run a JSONL file of queries through AiDA")
+  parser.add_argument("input", help="JSONL file of queries")
+  parser.add_argument("output", help="JSONL file the results are appended to")
+  parser.add_argument("--concurrency", type=int, default=4, help="number of queries run at the same time")
+  parser.add_argument("--limit", type=int, default=None, help="run at most this many queries")
+  parser.add_argument("--summary", default=None, help="also write the aggregate statistics to this JSON file")
+  parser.add_argument("--verbose", action="store_true", help="show the progress output of the tools")
+  args = parser.parse_args()
+  if args.concurrency < 1:
+    parser.error("--concurrency must be at least 1")
+
+  # Loaded before the agent and the tools are imported, some of their settings are read at import
+  load_dotenv()
+  # Progress goes to stderr, the tools' own output to stdout (discarded unless --verbose)
+  console = Console(file=sys.stderr)
+  agent_module = _load_agent_module()
+  from prompts.prompt import aida_v011_prompt
+  from tools import DocumentRetrieverTool, WebSearchTool, WebScraperTool, SaveContentTool
+  from tools.RAG.Registry import warm_up
+  from utils.batch_util import run_batch
+
+  warm_up()
+  provider = os.getenv("DEFAULT_PROVIDER")
+  model_name = agent_module.get_model_name(provider, os.getenv("GROQ_MODEL_NAME"), os.getenv("OLLAMA_MODEL_NAME"), os.getenv("AZURE_MODEL_NAME"))
+  # The tool pool is shared by all the queries in flight
+  agent = agent_module.Agent(provider=provider, model_name=model_name, system_prompt=aida_v011_prompt,
+                             tools=[DocumentRetrieverTool, WebScraperTool, WebSearchTool, SaveContentTool],
+                             max_parallel_tools=args.concurrency * int(os.getenv("AIDA_MAX_PARALLEL_TOOLS", "4")))
+  console.print(f"LLM Provider: {provider}, Model: {model_name}, Concurrency: {args.concurrency}", style="blue")
+
+  def progress(record: dict) -> None:
+    if record["status"] == "ok":
+      console.print(f"[green]ok[/green] {record['id']} ({record['latency']:.2f}s, {len(record['tool_calls'])} tool calls)")
+    else:
+      console.print(f"[red]error[/red] {record['id']} ({record['latency']:.2f}s): {record['error']}")
+
+  with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(sys.stdout if args.verbose else devnull):
+    stats = run_batch(agent, args.input, args.output, concurrency=args.concurrency, limit=args.limit, progress=progress)
+
+  console.print(f"Finished {stats['ok'] + stats['error']} queries in {stats['seconds']:.2f}s "
+                f"({stats['queries_per_sec']:.2f} queries/sec, {stats['output_tokens_per_sec']:.1f} output tokens/sec)", style="yellow")
+  console.print(f"Succeeded: {stats['ok']}, Failed: {stats['error']}, Skipped (already done): {stats['skipped']}", style="yellow")
+  console.print(f"Latency p50 {stats['latency_p50']:.2f}s, p95 {stats['latency_p95']:.2f}s, p99 {stats['latency_p99']:.2f}s | "
+                f"Tokens: {stats['prompt_tokens']} prompt, {stats['output_tokens']} output", style="yellow")
+  if args.summary:
+    with open(args.summary, "w", encoding="utf-8") as f:
+      json.dump(stats, f, indent=2)
+  sys.exit(1 if stats["error"] else 0)
@@ -0,0 +1,90 @@
+'''
+    Benchmark Comparison
+
+        Compares two result files of benchmarks.run (e.g. from the base commit and from a branch) and
+        lists every metric with its relative change. Exits with status 1 when a latency or memory size
+        grows or a throughput, hit rate or recall drops by more than the threshold.
+
+        Usage:
+            python -m benchmarks.compare base.json new.json [--threshold 0.10]
+'''
+
+import argparse
+import json
+import sys
+from rich.console import Console
+from rich.table import Table
+
+# Metrics where a larger value is better, every other timing is better when smaller
+HIGHER_IS_BETTER = ("per_sec", "hit_rate", "recall_at_5", "cosine_to_reference")
+LOWER_IS_BETTER = ("mean", "p50", "p95", "p99", "max", "seconds", "llm_calls_per_turn")
+
+def flatten(results: dict, prefix: str = "") -> dict:
+  metrics = {}
+  for key, value in results.items():
+    if key == "meta":
+      continue
+    name = f"{prefix}{key}"
+    if isinstance(value, dict):
+      metrics.update(flatten(value, f"{name}."))
+    elif isinstance(value, (int, float)) and not isinstance(value, bool):
+      metrics[name] = value
+  return metrics
+
+def direction(metric: str) -> int:
+  '''
+  1 if higher is better, -1 if lower is better, 0 for counts that are only informative
+  '''
+  leaf = metric.rsplit(".", 1)[-1]
+  if leaf.endswith(HIGHER_IS_BETTER):
+    return 1
+  if leaf in LOWER_IS_BETTER or leaf.endswith(("seconds", "_mb")):
+    return -1
+  return 0
+
+def compare(base: dict, new: dict, threshold: float) -> list:
+  '''
+  Output:
+    rows : list - (metric, base value, new value, relative change, regressed)
+  '''
+  base_metrics, new_metrics = flatten(base), flatten(new)
+  rows = []
+  for metric in base_metrics:
+    if metric not in new_metrics:
+      continue
+    old, current = base_metrics[metric], new_metrics[metric]
+    change = (current - old) / old if old else 0.0
+    regressed = direction(metric) != 0 and -direction(metric) * change > threshold
+    rows.append((metric, old, current, change, regressed))
+  return rows
+
+def main():
+  parser = argparse.ArgumentParser(description="Compare two AiDA benchmark result files")
+  parser.add_argument("base", help="results of the baseline")
+  parser.add_argument("new", help="results to check")
+  parser.add_argument("--threshold", type=float, default=0.10, help="relative change counted as a regression")
+  args = parser.parse_args()
+
+  with open(args.base, "r", encoding="utf-8") as f:
+    base = json.load(f)
+  with open(args.new, "r", encoding="utf-8") as f:
+    new = json.load(f)
+
+  console = Console()
+  rows = compare(base, new, args.threshold)
+  table = Table(title=f"{base.get('meta', {}).get('commit')} -> {new.get('meta', {}).get('commit')}")
+  for column in ("Metric", "Base", "New", "Change"):
+    table.add_column(column, justify="left" if column == "Metric" else "right")
+  for metric, old, current, change, regressed in rows:
+    style = "red" if regressed else ("green" if direction(metric) * change > args.threshold else None)
+    table.add_row(metric, f"{old:.4g}", f"{current:.4g}", f"{change:+.1%}", style=style)
+  console.print(table)
+
+  regressions = [row[0] for row in rows if row[4]]
+  if regressions:
+    console.print(f"{len(regressions)} regression(s) beyond {args.threshold:.0%}: {', '.join(regressions)}", style="red")
+    sys.exit(1)
+  console.print(f"No regression beyond {args.threshold:.0%}", style="green")
+
+if __name__ == "__main__":
+  main()
@@ -0,0 +1,128 @@
+'''
+    Synthetic document corpus for the benchmarks. Documents are generated from a seed, so the same
+    arguments always produce the same files. Every paragraph mentions a topic and carries a part
+    number, which gives both natural language and identifier queries with a known answer.
+'''
+
+import os
+import random
+import zipfile
+from xml.sax.saxutils import escape
+
+TOPICS = [
+  "battery", "cooling", "firmware", "network", "storage", "sensor", "display", "printer",
+  "scanner", "router", "camera", "speaker", "keyboard", "charger", "antenna", "gateway"
+]
+WORDS = [
+  "the", "unit", "must", "be", "checked", "before", "each", "shift", "and", "after", "maintenance",
+  "replace", "module", "when", "warning", "appears", "operator", "should", "record", "reading",
+  "calibrate", "system", "weekly", "voltage", "temperature", "level", "exceeds", "limit", "reset",
+  "cycle", "power", "supply", "inspect", "cable", "connector", "damage", "report", "service", "team"
+]
+
+def _paragraph(rng: random.Random, doc: int, index: int) -> tuple:
+  topic = TOPICS[(doc + index) % len(TOPICS)]
+  part = f"PN-{doc:03d}-{index:03d}"
+  words = [rng.choice(WORDS) for _ in range(rng.randint(40, 80))]
+  text = f"The {topic} procedure for part {part}: " + " ".join(words) + f". Contact the {topic} service team about {part}."
+  return text, topic, part
+
+def _write_md(path: str, title: str, paragraphs: list) -> None:
+  with open(path, "w", encoding="utf-8") as f:
+    f.write(f"# {title}\n\n")
+    for i, text in enumerate(paragraphs):
+      if i % 5 == 0:
+        f.write(f"## Section {i // 5 + 1}\n\n")
+      f.write(text + "\n\n")
+
+def _write_docx(path: str, title: str, paragraphs: list) -> None:
+  # The smallest package Word and Docling accept: content types, the package relation and the body
+  body = "".join(f"<w:p><w:r><w:t xml:space=\"preserve\">{escape(text)}</w:t></w:r></w:p>" for text in [title] + paragraphs)
+  with zipfile.ZipFile(path, "w", zipfile.ZIP_DEFLATED) as docx:
+    docx.writestr("[Content_Types].xml",
+      '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+      '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+      '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+      '<Default Extension="xml" ContentType="application/xml"/>'
+      '<Override PartName="/word/document.xml" ContentType="application/vnd.openxmlformats-officedocument.wordprocessingml.document.main+xml"/>'
+      '</Types>')
+    docx.writestr("_rels/.rels",
+      '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+      '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+      '<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" Target="word/document.xml"/>'
+      '</Relationships>')
+    docx.writestr("word/document.xml",
+      '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+      '<w:document xmlns:w="http://schemas.openxmlformats.org/wordprocessingml/2006/main">'
+      f'<w:body>{body}</w:body></w:document>')
+
+def _pdf_lines(text: str, width: int = 90) -> list:
+  lines, line = [], ""
+  for word in text.split():
+    if line and len(line) + len(word) + 1 > width:
+      lines.append(line)
+      line = word
+    else:
+      line = f"{line} {word}" if line else word
+  if line:
+    lines.append(line)
+  return lines
+
+def _write_pdf(path: str, title: str, paragraphs: list) -> None:
+  # Plain text PDF with the standard Helvetica font, 50 lines per page
+  lines = [title, ""]
+  for text in paragraphs:
+    lines.extend(_pdf_lines(text) + [""])
+  pages = [lines[i:i + 50] for i in range(0, len(lines), 50)]
+
+  objects = ["<< /Type /Catalog /Pages 2 0 R >>", None, "<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>"]
+  kids = []
+  for page in pages:
+    stream = "BT /F1 10 Tf 12 TL 50 780 Td " + " ".join(
+      "(" + line.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)") + ") Tj T*" for line in page
+    ) + " ET"
+    objects.append(f"<< /Length {len(stream.encode('latin-1'))} >>\nstream\n{stream}\nendstream")
+    objects.append(f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 842] /Resources << /Font << /F1 3 0 R >> >> /Contents {len(objects)} 0 R >>")
+    kids.append(f"{len(objects)} 0 R")
+  objects[1] = f"<< /Type /Pages /Kids [{' '.join(kids)}] /Count {len(kids)} >>"
+
+  out = bytearray(b"%PDF-1.4\n")
+  offsets = []
+  for number, obj in enumerate(objects, 1):
+    offsets.append(len(out))
+    out += f"{number} 0 obj\n{obj}\nendobj\n".encode("latin-1")
+  xref = len(out)
+  out += f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n".encode("latin-1")
+  out += "".join(f"{offset:010d} 00000 n \n" for offset in offsets).encode("latin-1")
+  out += f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n".encode("latin-1")
+  with open(path, "wb") as f:
+    f.write(out)
+
+WRITERS = {"md": _write_md, "docx": _write_docx, "pdf": _write_pdf}
+
+def generate_corpus(directory: str, documents: int = 20, paragraphs: int = 30, formats: tuple = ("md", "docx", "pdf"), seed: int = 0) -> dict:
+  '''
+  Writes a synthetic corpus and the queries with their expected answers
+  Arguments:
+    directory: str - where the documents are written
+    documents: int - number of documents, spread round robin over the formats
+    paragraphs: int - paragraphs per document
+    formats: tuple - any of "md", "docx" and "pdf"
+    seed: int - seed of the generated text
+  Output:
+    corpus : dict - {"files": [paths], "queries": [{"filepath", "query", "part", "kind"}]}
+  '''
+  rng = random.Random(seed)
+  os.makedirs(directory, exist_ok=True)
+  files, queries = [], []
+  for doc in range(documents):
+    extension = formats[doc % len(formats)]
+    path = os.path.join(directory, f"manual_{doc:03d}.{extension}")
+    generated = [_paragraph(rng, doc, index) for index in range(paragraphs)]
+    WRITERS[extension](path, f"Maintenance manual {doc}", [text for text, _, _ in generated])
+    files.append(path)
+    for index in rng.sample(range(paragraphs), min(2, paragraphs)):
+      _, topic, part = generated[index]
+      queries.append({"filepath": path, "query": part, "part": part, "kind": "identifier"})
+      queries.append({"filepath": path, "query": f"What is the {topic} procedure and who should be contacted?", "part": part, "kind": "semantic"})
+  return {"files": files, "queries": queries}
@@ -0,0 +1,139 @@
+'''
+    Deterministic local stand-ins for the LLM provider, the Tavily client and the embedding model,
+    so the benchmarks run offline and every run does the same work.
+'''
+
+import hashlib
+import json
+import re
+import time
+from langchain_core.embeddings import Embeddings
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, HumanMessage, ToolMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+
+URL_RE = re.compile(r"https?://\S+")
+PATH_RE = re.compile(r"(\S+\.(?:pdf|docx|pptx|txt|md))\b")
+
+class FakeChatModel(BaseChatModel):
+  '''
+  Tool calling chat model that picks tools from the last user message like the real agent would:
+  a document path calls DocumentRetrieval, a URL calls WebsiteScraper, anything else WebSearch.
+  Once the tool results are in, it answers with a fixed number of tokens. The latency of the first
+  token and of every following token can be simulated.
+  '''
+  ttft: float = 0.0
+  token_delay: float = 0.0
+  answer_tokens: int = 64
+  tool_names: list = []
+
+  @property
+  def _llm_type(self) -> str:
+    return "aida-fake"
+
+  def bind_tools(self, tools, **kwargs):
+    names = [getattr(t, "name", None) or t.get("name") for t in tools]
+    return self.model_copy(update={"tool_names": names})
+
+  def _respond(self, messages: list) -> AIMessage:
+    last = messages[-1]
+    prompt_tokens = sum(len(str(m.content)) for m in messages) // 4
+    if isinstance(last, HumanMessage) and self.tool_names and not last.content.startswith("Summarize"):
+      text = last.content
+      url, path = URL_RE.search(text), PATH_RE.search(text)
+      if path and "DocumentRetrieval" in self.tool_names:
+        call = {"name": "DocumentRetrieval", "args": {"filepath": path.group(1), "query": text.replace(path.group(1), "").strip()}}
+      elif url and "WebsiteScraper" in self.tool_names:
+        call = {"name": "WebsiteScraper", "args": {"url": url.group(0), "query": text}}
+      else:
+        call = {"name": "WebSearch", "args": {"query": text}}
+      call["id"] = "call_" + hashlib.sha1(text.encode("utf-8")).hexdigest()[:12]
+      return AIMessage(content="", tool_calls=[call], usage_metadata={"input_tokens": prompt_tokens, "output_tokens": 8, "total_tokens": prompt_tokens + 8})
+    context = " ".join(str(m.content) for m in messages if isinstance(m, ToolMessage))
+    words = (context.split() or ["answer"]) * self.answer_tokens
+    content = " ".join(words[:self.answer_tokens])
+    return AIMessage(content=content, usage_metadata={"input_tokens": prompt_tokens, "output_tokens": self.answer_tokens, "total_tokens": prompt_tokens + self.answer_tokens})
+
+  def _generate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+    message = self._respond(messages)
+    time.sleep(self.ttft + self.token_delay * (len(message.content.split()) if message.content else 0))
+    return ChatResult(generations=[ChatGeneration(message=message)])
+
+  def _stream(self, messages, stop=None, run_manager=None, **kwargs):
+    message = self._respond(messages)
+    time.sleep(self.ttft)
+    if message.tool_calls:
+      chunk = ChatGenerationChunk(message=AIMessageChunk(
+        content="",
+        tool_call_chunks=[{"name": t["name"], "args": json.dumps(t["args"]), "id": t["id"], "index": i} for i, t in enumerate(message.tool_calls)],
+        usage_metadata=message.usage_metadata
+      ))
+      if run_manager:
+        run_manager.on_llm_new_token("", chunk=chunk)
+      yield chunk
+      return
+    words = message.content.split(" ")
+    for i, word in enumerate(words):
+      if i:
+        time.sleep(self.token_delay)
+      # the usage is reported once, with the last chunk, like the providers do
+      chunk = ChatGenerationChunk(message=AIMessageChunk(
+        content=word + (" " if i < len(words) - 1 else ""),
+        usage_metadata=message.usage_metadata if i == len(words) - 1 else None
+      ))
+      if run_manager:
+        run_manager.on_llm_new_token(chunk.message.content, chunk=chunk)
+      yield chunk
+
+class FakeTavilyClient:
+  '''
+  Offline replacement of TavilyClient for the two calls the web tools make. Results are derived
+  from the query or URL, so repeated calls return the same content.
+  '''
+
+  def __init__(self, latency: float = 0.0, page_words: int = 800):
+    self.latency = latency
+    self.page_words = page_words
+    self.calls = 0
+
+  def _text(self, seed: str, words: int) -> str:
+    digest = hashlib.sha256(seed.encode("utf-8")).hexdigest()
+    vocabulary = [digest[i:i + 6] for i in range(0, 60, 6)]
+    return " ".join(vocabulary[i % len(vocabulary)] for i in range(words))
+
+  def get_search_context(self, query: str, max_tokens: int = 1000, max_results: int = 3, **kwargs) -> str:
+    self.calls += 1
+    time.sleep(self.latency)
+    results = [{"url": f"https://example.com/{i}", "content": self._text(f"{query}/{i}", max_tokens // (max_results * 2))} for i in range(max_results)]
+    return json.dumps(results)
+
+  def extract(self, urls: list, include_images: bool = False, **kwargs) -> dict:
+    self.calls += 1
+    time.sleep(self.latency)
+    return {"results": [{"url": url, "raw_content": self._text(url, self.page_words)} for url in urls], "failed_results": []}
+
+class FakeEmbeddings(Embeddings):
+  '''
+  Hash based bag-of-words embeddings: deterministic, fast, and texts sharing words get similar vectors,
+  so retrieval results are still meaningful
+  '''
+
+  def __init__(self, size: int = 384, latency_per_text: float = 0.0):
+    self.size = size
+    self.latency_per_text = latency_per_text
+
+  def _embed(self, text: str) -> list:
+    vector = [0.0] * self.size
+    for word in re.findall(r"\w+", text.lower()):
+      h = int(hashlib.md5(word.encode("utf-8")).hexdigest()[:8], 16)
+      vector[h % self.size] += 1.0 if h & 1 else -1.0
+    norm = sum(v * v for v in vector) ** 0.5 or 1.0
+    return [v / norm for v in vector]
+
+  def embed_documents(self, texts: list) -> list:
+    time.sleep(self.latency_per_text * len(texts))
+    return [self._embed(text) for text in texts]
+
+  def embed_query(self, text: str) -> list:
+    time.sleep(self.latency_per_text)
+    return self._embed(text)
@@ -0,0 +1,206 @@
+'''
+    LLM Provider Stub
+
+        A local OpenAI compatible chat completions endpoint (the API of Groq and Azure OpenAI) that injects
+        latency and 429 responses. It enforces its own requests per minute limit and also throttles a random
+        share of requests, answering with Retry-After like the real providers. Drives it with concurrent
+        callers through the shared provider transport of utils.llm_client (connection pool, client side rate
+        limits, retries with backoff) and once without it, and reports
+            - completed and failed requests, the 429s the stub sent and the retries of the client
+            - request latency (p50/p95/p99) including the rate limit waits and backoffs
+            - the request rate the stub actually received
+
+        With --serve only the stub is started, e.g. to run the agent against it:
+            GROQ_API_BASE=http://127.0.0.1:8090 python aida-agent-v-0.1.1.py
+
+        Usage:
+            python -m benchmarks.llm_stub [--requests N] [--concurrency N] [--latency S] [--throttle P]
+                                          [--stub-rpm N] [--rpm N] [--tpm N] [--json results.json]
+            python -m benchmarks.llm_stub --serve [--port 8090]
+'''
+
+import argparse
+import json
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from rich.console import Console
+from rich.table import Table
+
+class StubProvider(ThreadingHTTPServer):
+  daemon_threads = True
+
+  def __init__(self, address, latency: float = 0.05, throttle: float = 0.0, rpm: int = 0, retry_after: float = 1.0):
+    super().__init__(address, StubHandler)
+    self.latency = latency
+    self.throttle = throttle
+    self.rpm = rpm
+    self.retry_after = retry_after
+    self.lock = threading.Lock()
+    self.window: deque = deque()
+    self.received = 0
+    self.throttled = 0
+    self.connections = 0
+
+  def handle_error(self, request, client_address):
+    # Clients closing their keep-alive connections are not errors
+    pass
+
+  def admit(self) -> float:
+    '''
+    Returns None when the request is served, otherwise the Retry-After of the 429 it gets
+    '''
+    with self.lock:
+      now = time.monotonic()
+      self.received += 1
+      while self.window and now - self.window[0] > 60:
+        self.window.popleft()
+      if self.rpm and len(self.window) >= self.rpm:
+        self.throttled += 1
+        return 60 - (now - self.window[0])
+      if random.random() < self.throttle:
+        self.throttled += 1
+        return self.retry_after
+      self.window.append(now)
+      return None
+
+class StubHandler(BaseHTTPRequestHandler):
+  protocol_version = "HTTP/1.1"
+
+  def setup(self):
+    super().setup()
+    with self.server.lock:
+      self.server.connections += 1
+
+  def log_message(self, format, *args):
+    pass
+
+  def _send(self, status: int, body: dict, headers: dict = None) -> None:
+    data = json.dumps(body).encode("utf-8")
+    self.send_response(status)
+    self.send_header("Content-Type", "application/json")
+    self.send_header("Content-Length", str(len(data)))
+    for key, value in (headers or {}).items():
+      self.send_header(key, value)
+    self.end_headers()
+    self.wfile.write(data)
+
+  def do_POST(self):
+    body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+    if not self.path.endswith("/chat/completions"):
+      self._send(404, {"error": {"message": "Unknown endpoint"}})
+      return
+    delay = self.server.admit()
+    if delay is not None:
+      self._send(429, {"error": {"message": "Rate limit reached", "type": "tokens"}}, {"Retry-After": f"{delay:.2f}"})
+      return
+    time.sleep(self.server.latency)
+    content = "The stub provider answered."
+    self._send(200, {
+      "id": "chatcmpl-stub",
+      "object": "chat.completion",
+      "created": int(time.time()),
+      "model": body.get("model", "stub"),
+      "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+      "usage": {"prompt_tokens": len(json.dumps(body.get("messages", ""))) // 4, "completion_tokens": 6, "total_tokens": 0}
+    })
+
+def start_stub(port: int = 0, **kwargs) -> StubProvider:
+  stub = StubProvider(("127.0.0.1", port), **kwargs)
+  threading.Thread(target=stub.serve_forever, daemon=True).start()
+  return stub
+
+def _drive(url: str, transport, requests: int, concurrency: int) -> dict:
+  import httpx
+  from benchmarks.run import summarize
+  latencies, statuses = [], []
+  body = {"model": "stub-model", "messages": [{"role": "user", "content": "What is the warranty period? " * 20}], "max_tokens": 64}
+  with httpx.Client(transport=transport, timeout=120) as client:
+    def call(_):
+      st = time.perf_counter()
+      response = client.post(f"{url}/openai/v1/chat/completions", json=body)
+      latencies.append(time.perf_counter() - st)
+      statuses.append(response.status_code)
+    st = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+      list(pool.map(call, range(requests)))
+    seconds = time.perf_counter() - st
+  return {"seconds": seconds, "completed": statuses.count(200), "failed": len(statuses) - statuses.count(200), "latency": summarize(latencies)}
+
+def run(args) -> dict:
+  import httpx
+  from utils.llm_client import ProviderTransport
+  results = {}
+  modes = {
+    # What a provider SDK does without the shared layer: a connection pool per client and no retries here
+    "direct": lambda: httpx.HTTPTransport(),
+    "shared": lambda: ProviderTransport("stub", max_retries=args.max_retries, backoff_base=args.backoff_base,
+                                        backoff_max=args.backoff_max, requests_per_minute=args.rpm, tokens_per_minute=args.tpm, model_limits={})
+  }
+  for mode, make_transport in modes.items():
+    stub = start_stub(latency=args.latency, throttle=args.throttle, rpm=args.stub_rpm, retry_after=args.retry_after)
+    transport = make_transport()
+    try:
+      result = _drive(f"http://127.0.0.1:{stub.server_address[1]}", transport, args.requests, args.concurrency)
+    finally:
+      stub.shutdown()
+      stub.server_close()
+    result.update({
+      "stub_received": stub.received,
+      "stub_throttled": stub.throttled,
+      "connections": stub.connections,
+      "received_per_min": stub.received / result["seconds"] * 60
+    })
+    if isinstance(transport, ProviderTransport):
+      result["client"] = dict(transport.stats)
+    transport.close()
+    results[mode] = result
+  return results
+
+def print_results(results: dict, console: Console) -> None:
+  table = Table(title="LLM requests against the stub provider")
+  for column in ("Mode", "Completed", "Failed", "429s", "Retries", "Connections", "Received/min", "p50 ms", "p95 ms", "p99 ms"):
+    table.add_column(column, justify="left" if column == "Mode" else "right")
+  for mode, result in results.items():
+    latency = result["latency"]
+    table.add_row(mode, str(result["completed"]), str(result["failed"]), str(result["stub_throttled"]),
+                  str(result.get("client", {}).get("retries", 0)), str(result["connections"]), f"{result['received_per_min']:.0f}",
+                  *(f"{latency[p] * 1000:.1f}" for p in ("p50", "p95", "p99")))
+  console.print(table)
+
+def main():
+  parser = argparse.ArgumentParser(description="Stub LLM provider with injected latency and 429s")
+  parser.add_argument("--serve", action="store_true", help="only run the stub until interrupted")
+  parser.add_argument("--port", type=int, default=8090, help="port of the stub with --serve")
+  parser.add_argument("--requests", type=int, default=200, help="requests sent in each mode")
+  parser.add_argument("--concurrency", type=int, default=16, help="callers sending at the same time")
+  parser.add_argument("--latency", type=float, default=0.05, help="response latency of the stub (s)")
+  parser.add_argument("--throttle", type=float, default=0.1, help="share of requests answered with 429 at random")
+  parser.add_argument("--retry-after", type=float, default=0.5, help="Retry-After of the random 429s (s)")
+  parser.add_argument("--stub-rpm", type=int, default=1200, help="requests per minute the stub accepts, 0 is unlimited")
+  parser.add_argument("--rpm", type=int, default=1000, help="client side requests per minute limit, 0 is unlimited")
+  parser.add_argument("--tpm", type=int, default=0, help="client side tokens per minute limit, 0 is unlimited")
+  parser.add_argument("--max-retries", type=int, default=6, help="retries of the client")
+  parser.add_argument("--backoff-base", type=float, default=0.2, help="first backoff of the client (s)")
+  parser.add_argument("--backoff-max", type=float, default=10.0, help="longest backoff of the client (s)")
+  parser.add_argument("--json", default=None, help="write the results to this file")
+  args = parser.parse_args()
+
+  console = Console()
+  if args.serve:
+    stub = StubProvider(("127.0.0.1", args.port), latency=args.latency, throttle=args.throttle, rpm=args.stub_rpm, retry_after=args.retry_after)
+    console.print(f"Stub provider on http://127.0.0.1:{args.port}", style="green")
+    stub.serve_forever()
+    return
+  results = run(args)
+  print_results(results, console)
+  if args.json:
+    with open(args.json, "w", encoding="utf-8") as f:
+      json.dump(results, f, indent=2)
+    console.print(f"Results written to {args.json}", style="green")
+
+if __name__ == "__main__":
+  main()
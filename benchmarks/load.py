@@ -0,0 +1,177 @@
+'''
+    Server Load Test
+
+        Starts the AiDA server in this process with the fake LLM and fake web search (see benchmarks.fakes),
+        or targets a running server with --url, and drives it with concurrent clients. Every client opens a
+        session and sends its turns one after the other, over the HTTP stream or a WebSocket. Measures
+            - time to first token and turn latency (p50/p95/p99)
+            - turn throughput and streamed tokens/sec
+            - turns rejected with 503 (back pressure) and failed turns
+
+        Usage:
+            python -m benchmarks.load [--clients N] [--turns N] [--max-turns N] [--max-queued N] [--transport http|ws] [--json results.json]
+'''
+
+import argparse
+import asyncio
+import json
+import os
+import shutil
+import tempfile
+import time
+from rich.console import Console
+from rich.table import Table
+
+PROMPTS = [
+  "Search the web for {topic} maintenance intervals",
+  "Summarize https://example.com/{topic}",
+  "What should I check on the {topic} before a shift?"
+]
+TOPICS = ["battery", "cooling", "firmware", "network", "storage", "sensor", "display", "printer"]
+
+async def _http_turn(http, url: str, session_id: str, message: str) -> dict:
+  st = time.perf_counter()
+  first_token, tokens, result = None, 0, {}
+  async with http.post(f"{url}/sessions/{session_id}/messages", json={"message": message}) as response:
+    if response.status == 503:
+      return {"rejected": True}
+    response.raise_for_status()
+    async for line in response.content:
+      event = json.loads(line)
+      if event["type"] == "token":
+        tokens += 1
+        if first_token is None:
+          first_token = time.perf_counter() - st
+      elif event["type"] in ("done", "error"):
+        result = event
+  return {"latency": time.perf_counter() - st, "ttft": first_token, "tokens": tokens, "error": result.get("error") if result.get("type") != "done" else None}
+
+async def _ws_turn(ws, message: str) -> dict:
+  st = time.perf_counter()
+  first_token, tokens = None, 0
+  await ws.send_json({"message": message})
+  while True:
+    event = await ws.receive_json()
+    if event["type"] == "token":
+      tokens += 1
+      if first_token is None:
+        first_token = time.perf_counter() - st
+    elif event["type"] == "error" and event.get("status") == 503:
+      return {"rejected": True}
+    elif event["type"] in ("done", "error"):
+      return {"latency": time.perf_counter() - st, "ttft": first_token, "tokens": tokens, "error": event.get("error")}
+
+async def _client(http, url: str, index: int, turns: int, transport: str, results: list) -> None:
+  async with http.post(f"{url}/sessions") as response:
+    response.raise_for_status()
+    session_id = (await response.json())["session_id"]
+  ws = await http.ws_connect(f"{url}/sessions/{session_id}/ws") if transport == "ws" else None
+  try:
+    for turn in range(turns):
+      message = PROMPTS[(index + turn) % len(PROMPTS)].format(topic=TOPICS[index % len(TOPICS)])
+      while True:
+        result = await (_ws_turn(ws, message) if ws is not None else _http_turn(http, url, session_id, message))
+        results.append(result)
+        if not result.get("rejected"):
+          break
+        # Back off like a client honouring Retry-After, the rejected attempt is counted
+        await asyncio.sleep(0.5)
+  finally:
+    if ws is not None:
+      await ws.close()
+    async with http.delete(f"{url}/sessions/{session_id}"):
+      pass
+
+async def _load(url: str, clients: int, turns: int, transport: str) -> dict:
+  import aiohttp
+  from benchmarks.run import summarize
+  results: list = []
+  # One connection per client, the default pool of 100 would queue the clients on the client side
+  connector = aiohttp.TCPConnector(limit=clients * 2)
+  async with aiohttp.ClientSession(connector=connector, timeout=aiohttp.ClientTimeout(total=None)) as http:
+    st = time.perf_counter()
+    await asyncio.gather(*(_client(http, url, i, turns, transport, results) for i in range(clients)))
+    seconds = time.perf_counter() - st
+    async with http.get(f"{url}/stats") as response:
+      server_stats = await response.json()
+  completed = [r for r in results if not r.get("rejected")]
+  return {
+    "clients": clients,
+    "turns": len(completed),
+    "rejected": sum(1 for r in results if r.get("rejected")),
+    "failed": sum(1 for r in completed if r.get("error")),
+    "seconds": seconds,
+    "turns_per_sec": len(completed) / seconds,
+    "tokens_per_sec": sum(r["tokens"] for r in completed) / seconds,
+    "ttft": summarize([r["ttft"] for r in completed if r.get("ttft") is not None]),
+    "latency": summarize([r["latency"] for r in completed]),
+    "server": {key: server_stats[key] for key in ("sessions", "turns", "rejected", "max_turns", "max_queued")}
+  }
+
+async def _serve_and_load(args) -> dict:
+  from aiohttp import web
+  from server import create_server
+  server = create_server(fake=True, max_turns=args.max_turns, max_queued=args.max_queued,
+                         llm_ttft=args.llm_ttft, llm_token_delay=args.llm_token_delay)
+  runner = web.AppRunner(server.app())
+  await runner.setup()
+  site = web.TCPSite(runner, "127.0.0.1", 0)
+  await site.start()
+  port = site._server.sockets[0].getsockname()[1]
+  try:
+    return await _load(f"http://127.0.0.1:{port}", args.clients, args.turns, args.transport)
+  finally:
+    await runner.cleanup()
+
+def run(args) -> dict:
+  if args.url:
+    return asyncio.run(_load(args.url.rstrip("/"), args.clients, args.turns, args.transport))
+  scratch = tempfile.mkdtemp(prefix="aida-load-")
+  # Set before the tools are imported, the index and cache locations are read at import
+  os.environ["RAG_DB_DIR"] = os.path.join(scratch, "db")
+  os.environ["WEB_CACHE_PATH"] = os.path.join(scratch, "web_cache.db")
+  os.environ["AIDA_TRACE_FILE"] = os.path.join(scratch, "trace.jsonl")
+  os.environ["AIDA_CHECKPOINT_DB"] = os.path.join(scratch, "checkpoints.db")
+  from benchmarks.run import quiet
+  try:
+    with quiet():
+      return asyncio.run(_serve_and_load(args))
+  finally:
+    shutil.rmtree(scratch, ignore_errors=True)
+
+def print_results(results: dict, console: Console) -> None:
+  console.print(f"{results['clients']} clients: {results['turns']} turns in {results['seconds']:.2f}s "
+                f"({results['turns_per_sec']:.2f} turns/sec, {results['tokens_per_sec']:.1f} tokens/sec), "
+                f"rejected {results['rejected']}, failed {results['failed']}", style="yellow")
+  table = Table(title="AiDA server latency (ms)")
+  for column in ("Metric", "n", "p50", "p95", "p99", "max"):
+    table.add_column(column, justify="left" if column == "Metric" else "right")
+  for name in ("ttft", "latency"):
+    stats = results[name]
+    if stats.get("count"):
+      table.add_row(name, str(stats["count"]), *(f"{stats[p] * 1000:.1f}" for p in ("p50", "p95", "p99", "max")))
+  console.print(table)
+
+def main():
+  parser = argparse.ArgumentParser(description="Load test of the AiDA server")
+  parser.add_argument("--url", default=None, help="target a running server instead of starting one with the fake LLM")
+  parser.add_argument("--clients", type=int, default=32, help="concurrent clients, one session each")
+  parser.add_argument("--turns", type=int, default=5, help="turns per client")
+  parser.add_argument("--transport", choices=["http", "ws"], default="http", help="NDJSON over HTTP or WebSocket")
+  parser.add_argument("--max-turns", type=int, default=8, help="turns the server runs at the same time")
+  parser.add_argument("--max-queued", type=int, default=16, help="turns waiting for a slot before the server answers 503")
+  parser.add_argument("--llm-ttft", type=float, default=0.2, help="simulated time to first token of the fake LLM (s)")
+  parser.add_argument("--llm-token-delay", type=float, default=0.005, help="simulated delay between tokens of the fake LLM (s)")
+  parser.add_argument("--json", default=None, help="write the results to this file")
+  args = parser.parse_args()
+
+  console = Console()
+  results = run(args)
+  print_results(results, console)
+  if args.json:
+    with open(args.json, "w", encoding="utf-8") as f:
+      json.dump(results, f, indent=2)
+    console.print(f"Results written to {args.json}", style="green")
+
+if __name__ == "__main__":
+  main()
@@ -0,0 +1,426 @@
+'''
+    End-to-end Benchmark
+
+        Runs offline against a generated corpus, with a fake chat model, a fake Tavily client and (by
+        default) fake embeddings, and measures
+            - ingest throughput (documents/sec and chunks/sec)
+            - retrieval latency (p50/p95/p99) and hit rate, for identifier and natural language queries
+            - DocumentRetrieval latency without and with the retrieval cache
+            - recall@5 against exact search, latency, memory and disk size of each vector backend
+            - chunks/sec of each embedding backend and its agreement with the first one (needs the real models)
+            - tool node latency of a turn calling DocumentRetrieval, WebSearch and WebsiteScraper
+            - full Agent.graph turn latency
+        The index, web cache and corpus are created in a scratch directory, the repository is not touched.
+        Results are written as JSON and can be compared between commits with benchmarks.compare.
+
+        Usage:
+            python -m benchmarks.run [--documents N] [--paragraphs N] [--formats md,docx,pdf] [--turns N]
+                                     [--vector-backends chroma,mmap-int8,mmap-float16,mmap-ivf]
+                                     [--embedding-backends torch,onnx,onnx-int8] [--json results.json]
+'''
+
+import argparse
+import contextlib
+import importlib.util
+import io
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import tempfile
+import time
+from datetime import datetime, timezone
+from rich.console import Console
+from rich.table import Table
+from utils.tracing import percentile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+AGENT_SCRIPT = os.path.join(ROOT, "aida-agent-v-0.1.1.py")
+
+def summarize(samples: list) -> dict:
+  '''
+  Latency summary in seconds: count, mean, p50, p95, p99 and max
+  '''
+  if not samples:
+    return {"count": 0}
+  ordered = sorted(samples)
+  return {
+    "count": len(ordered),
+    "mean": statistics.fmean(ordered),
+    "p50": percentile(ordered, 50),
+    "p95": percentile(ordered, 95),
+    "p99": percentile(ordered, 99),
+    "max": ordered[-1]
+  }
+
+@contextlib.contextmanager
+def quiet():
+  # The tools report their progress on stdout, which would drown the results
+  with contextlib.redirect_stdout(io.StringIO()):
+    yield
+
+def _git_commit() -> str:
+  try:
+    return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True, text=True).stdout.strip() or None
+  except OSError:
+    return None
+
+def _load_agent_module():
+  spec = importlib.util.spec_from_file_location("aida_agent_v011", AGENT_SCRIPT)
+  module = importlib.util.module_from_spec(spec)
+  spec.loader.exec_module(module)
+  return module
+
+def bench_ingest(corpus_dir: str, workers: int, batch_size: int) -> dict:
+  from tools.RAG.Ingest import ingest
+  st = time.perf_counter()
+  with quiet():
+    stats = ingest(corpus_dir, workers=workers, batch_size=batch_size)
+  seconds = time.perf_counter() - st
+  # A second run over the unchanged corpus only hashes the files
+  st = time.perf_counter()
+  with quiet():
+    ingest(corpus_dir, workers=workers, batch_size=batch_size)
+  unchanged = time.perf_counter() - st
+  return {
+    **stats,
+    "seconds": seconds,
+    "documents_per_sec": stats["documents"] / seconds,
+    "chunks_per_sec": stats["chunks"] / seconds,
+    "unchanged_seconds": unchanged
+  }
+
+def bench_retrieval(queries: list) -> dict:
+  from tools.RAG.Retrieve import RetrieveChunks
+  from tools.RAG.BM25 import is_identifier_query
+  results = {}
+  for kind in ("identifier", "semantic"):
+    samples, hits = [], 0
+    for item in (q for q in queries if q["kind"] == kind):
+      with quiet():
+        st = time.perf_counter()
+        retrieve = RetrieveChunks(item["filepath"], item["query"])
+        vector = None if is_identifier_query(item["query"]) else retrieve.embedQuery()
+        chunks = retrieve.retrieveChunks(vector=vector)
+        samples.append(time.perf_counter() - st)
+      hits += any(item["part"] in chunk for chunk in chunks)
+    results[kind] = {**summarize(samples), "hit_rate": hits / len(samples) if samples else 0.0}
+  return results
+
+def _rss_bytes() -> int:
+  # Resident set size, which unlike tracemalloc also counts native allocations and mapped pages
+  try:
+    with open("/proc/self/statm", "r") as f:
+      return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+  except (OSError, ValueError, AttributeError):
+    try:
+      import resource
+      # Peak instead of current size, ru_maxrss is in kilobytes on Linux and in bytes on macOS
+      maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+      return maxrss if platform.system() == "Darwin" else maxrss * 1024
+    except ImportError:
+      return 0
+
+def _directory_bytes(path: str) -> int:
+  return sum(os.path.getsize(os.path.join(root, name)) for root, _, names in os.walk(path) for name in names)
+
+# name -> (backend, MmapCorpusStore options)
+VECTOR_BACKENDS = {
+  "chroma": ("chroma", {}),
+  "mmap-int8": ("mmap", {"dtype": "int8", "ivf_min_rows": 10 ** 9}),
+  "mmap-float16": ("mmap", {"dtype": "float16", "ivf_min_rows": 10 ** 9}),
+  # Clustered from the first write, so the IVF path is measured even on a small corpus
+  "mmap-ivf": ("mmap", {"dtype": "int8", "ivf_min_rows": 1})
+}
+
+def bench_vector_backends(scratch: str, queries: list, backends: list, k: int = 5) -> dict:
+  '''
+  Copies the ingested chunks with their embeddings into a fresh store of every backend and measures
+  recall@k against an exact float32 search, search latency, resident memory growth and disk size
+  '''
+  import numpy as np
+  from langchain_core.documents import Document
+  from tools.RAG.Corpus import get_corpus_store, ChromaCorpusStore
+  from tools.RAG.MmapStore import MmapCorpusStore
+  from tools.RAG.Index import list_manifests
+  from tools.RAG.Registry import get_embeddings
+
+  source = get_corpus_store()
+  chunks: dict = {}
+  for manifest in list_manifests():
+    chunks.update(source.chunks_of(manifest["doc_id"]))
+  ids = list(chunks)
+  if not ids:
+    return {}
+  docs = [Document(page_content=chunks[chunk_id], metadata={"doc_id": chunk_id.split(":", 1)[0]}) for chunk_id in ids]
+  embeddings = get_embeddings()
+  vectors = np.asarray(embeddings.embed_documents([doc.page_content for doc in docs]), dtype=np.float32)
+  vectors /= np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+  query_vectors = [embeddings.embed_query(item["query"]) for item in queries]
+  truth = []
+  for vector in query_vectors:
+    vector = np.asarray(vector, dtype=np.float32)
+    scores = vectors @ (vector / max(float(np.linalg.norm(vector)), 1e-12))
+    truth.append({ids[i] for i in np.argsort(-scores)[:k]})
+
+  results = {}
+  for name in backends:
+    directory = os.path.join(scratch, "vector_bench", name)
+    backend, options = VECTOR_BACKENDS[name]
+    rss = _rss_bytes()
+    st = time.perf_counter()
+    with quiet():
+      store = ChromaCorpusStore(directory=directory) if backend == "chroma" else MmapCorpusStore(directory=directory, **options)
+      for start in range(0, len(ids), 512):
+        store.upsert(docs[start:start + 512], ids[start:start + 512], vectors[start:start + 512].tolist())
+    build = time.perf_counter() - st
+    samples, found = [], 0
+    for vector, expected in zip(query_vectors, truth):
+      with quiet():
+        st = time.perf_counter()
+        top = store.search(vector=vector, k=k)
+        samples.append(time.perf_counter() - st)
+      found += len(expected & {doc.id for doc in top})
+    results[name] = {
+      **summarize(samples),
+      "recall_at_5": found / (k * len(truth)) if truth else 0.0,
+      "chunks": len(ids),
+      "build_seconds": build,
+      "rss_mb": max(_rss_bytes() - rss, 0) / 2 ** 20,
+      "disk_mb": _directory_bytes(directory) / 2 ** 20
+    }
+  return results
+
+# Same names as tools.RAG.Embedders, which is not imported before the scratch index location is set
+EMBEDDING_BACKENDS = ("torch", "onnx", "onnx-int8")
+
+def bench_embedding_backends(backends: list, batch_size: int = None, threads: int = None) -> dict:
+  '''
+  Embeds the ingested chunks with every embedding backend and measures load time, chunks/sec and the
+  mean cosine similarity of its vectors with those of the first backend. The embedding cache is bypassed.
+  '''
+  import numpy as np
+  from tools.RAG.Corpus import get_corpus_store
+  from tools.RAG.Index import list_manifests
+  from tools.RAG.Registry import DEFAULT_EMBEDDING_MODEL
+  from tools.RAG.Embedders import load_embeddings
+
+  source = get_corpus_store()
+  texts = []
+  for manifest in list_manifests():
+    texts.extend(source.chunks_of(manifest["doc_id"]).values())
+  if not texts or not backends:
+    return {}
+  results, reference = {}, None
+  for name in backends:
+    st = time.perf_counter()
+    with quiet():
+      model = load_embeddings(DEFAULT_EMBEDDING_MODEL, backend=name, batch_size=batch_size, threads=threads)
+      model.embed_documents(texts[:8])
+    load = time.perf_counter() - st
+    st = time.perf_counter()
+    with quiet():
+      vectors = np.asarray(model.embed_documents(texts), dtype=np.float32)
+    seconds = time.perf_counter() - st
+    vectors /= np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+    if reference is None:
+      reference = vectors
+    results[name] = {
+      "chunks": len(texts),
+      "seconds": seconds,
+      "chunks_per_sec": len(texts) / seconds if seconds else 0.0,
+      "load_seconds": load,
+      "cosine_to_reference": float(np.mean(np.sum(vectors * reference, axis=1))) if vectors.shape == reference.shape else 0.0
+    }
+  return results
+
+def bench_rag(queries: list) -> dict:
+  from tools.RAG.RAG import RAG
+  cold, cached = [], []
+  for item in queries:
+    for samples in (cold, cached):
+      with quiet():
+        st = time.perf_counter()
+        RAG(item["filepath"], item["query"])
+        samples.append(time.perf_counter() - st)
+  return {"uncached": summarize(cold), "cached": summarize(cached)}
+
+def bench_tool_node(agent, queries: list, turns: int) -> dict:
+  from langchain_core.messages import AIMessage
+  samples = []
+  for i in range(turns):
+    item = queries[i % len(queries)]
+    message = AIMessage(content="", tool_calls=[
+      {"name": "DocumentRetrieval", "args": {"filepath": item["filepath"], "query": item["query"]}, "id": f"doc{i}"},
+      {"name": "WebSearch", "args": {"query": item["query"]}, "id": f"search{i}"},
+      {"name": "WebsiteScraper", "args": {"url": f"https://example.com/page/{i % 5}", "query": item["query"]}, "id": f"scrape{i}"}
+    ])
+    with quiet():
+      st = time.perf_counter()
+      agent.tool_node({"messages": [message]})
+      samples.append(time.perf_counter() - st)
+  return summarize(samples)
+
+def bench_graph(agent, queries: list, turns: int) -> dict:
+  from langchain_core.messages import HumanMessage
+  from utils.chat_util import _detect_document_query, document_fast_path
+  from utils.tracing import collect_spans, LLM_SPANS
+  samples, prompts, llm_calls = [], [], []
+  for i in range(turns):
+    item = queries[i % len(queries)]
+    prompts.append([
+      f"{item['filepath']} {item['query']}",
+      f"Search the web for {item['query']}",
+      f"Summarize https://example.com/page/{i % 5}"
+    ][i % 3])
+  # Every turn continues the same conversation, as in the chat loop
+  config = {"configurable": {"thread_id": "benchmark"}}
+  rss = _rss_bytes()
+  for prompt in prompts:
+    # Document queries take the router's fast path, as in the chat loop
+    doc_info = _detect_document_query(prompt) if document_fast_path() else None
+    document = {"filepath": doc_info[0], "query": doc_info[1]} if doc_info else None
+    with quiet(), collect_spans() as spans:
+      st = time.perf_counter()
+      agent.graph.invoke({"messages": [HumanMessage(content=prompt)], "document": document}, config=config)
+      samples.append(time.perf_counter() - st)
+    llm_calls.append(sum(1 for s in spans if s.name in LLM_SPANS))
+  # Peak memory growth over the turns, flat when the checkpoints are kept on disk and pruned
+  return {**summarize(samples), "llm_calls_per_turn": statistics.fmean(llm_calls) if llm_calls else 0.0,
+          "rss_mb": max(_rss_bytes() - rss, 0) / 2 ** 20}
+
+def run(args) -> dict:
+  scratch = tempfile.mkdtemp(prefix="aida-bench-")
+  # Set before the tools are imported, the index location is read at import
+  os.environ["RAG_DB_DIR"] = os.path.join(scratch, "db")
+  os.environ["WEB_CACHE_PATH"] = os.path.join(scratch, "web_cache.db")
+  os.environ["AIDA_TRACE_FILE"] = os.path.join(scratch, "trace.jsonl")
+  os.environ["AIDA_CHECKPOINT_DB"] = os.path.join(scratch, "checkpoints.db")
+  try:
+    from benchmarks.corpus import generate_corpus
+    from benchmarks.fakes import FakeChatModel, FakeTavilyClient, FakeEmbeddings
+    from utils.tavily_util import set_tavily_client
+    from tools.RAG.Registry import set_embeddings
+
+    corpus = generate_corpus(os.path.join(scratch, "corpus"), args.documents, args.paragraphs, tuple(args.formats.split(",")), args.seed)
+    queries = corpus["queries"][:args.queries] if args.queries else corpus["queries"]
+    set_tavily_client(FakeTavilyClient(latency=args.search_latency))
+    if args.embeddings == "fake":
+      set_embeddings(FakeEmbeddings())
+
+    results = {
+      "meta": {
+        "commit": _git_commit(),
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "config": vars(args)
+      }
+    }
+    results["ingest"] = bench_ingest(os.path.join(scratch, "corpus"), args.workers, args.batch_size)
+    results["retrieval"] = bench_retrieval(queries)
+    results["rag"] = bench_rag(queries)
+    results["vector_backends"] = bench_vector_backends(scratch, queries, [b for b in args.vector_backends.split(",") if b])
+    results["embedding_backends"] = bench_embedding_backends([b for b in args.embedding_backends.split(",") if b],
+                                                             args.embedding_batch_size, args.embedding_threads)
+
+    agent_module = _load_agent_module()
+    from tools import DocumentRetrieverTool, WebSearchTool, WebScraperTool, SaveContentTool
+    llm = FakeChatModel(ttft=args.llm_ttft, token_delay=args.llm_token_delay)
+    agent = agent_module.Agent(provider="groq", model_name="fake", system_prompt="You are AiDA.",
+                               tools=[DocumentRetrieverTool, WebScraperTool, WebSearchTool, SaveContentTool], llm=llm)
+    results["tool_node"] = bench_tool_node(agent, queries, args.turns)
+    results["graph_turn"] = bench_graph(agent, queries, args.turns)
+    return results
+  finally:
+    if args.keep:
+      print(f"Scratch directory kept at {scratch}")
+    else:
+      shutil.rmtree(scratch, ignore_errors=True)
+
+def print_results(results: dict, console: Console) -> None:
+  ingest = results["ingest"]
+  console.print(f"Ingest: {ingest['documents']} documents, {ingest['chunks']} chunks in {ingest['seconds']:.2f}s "
+                f"({ingest['documents_per_sec']:.2f} docs/sec, {ingest['chunks_per_sec']:.1f} chunks/sec), "
+                f"unchanged re-run {ingest['unchanged_seconds']:.2f}s, failed {ingest['failed']}", style="yellow")
+  table = Table(title="AiDA latency (ms)")
+  for column in ("Stage", "n", "p50", "p95", "p99", "max", "hit rate"):
+    table.add_column(column, justify="left" if column == "Stage" else "right")
+  rows = [
+    ("retrieval identifier", results["retrieval"]["identifier"]),
+    ("retrieval semantic", results["retrieval"]["semantic"]),
+    ("DocumentRetrieval uncached", results["rag"]["uncached"]),
+    ("DocumentRetrieval cached", results["rag"]["cached"]),
+    ("tool node", results["tool_node"]),
+    ("graph turn", results["graph_turn"])
+  ]
+  for name, stats in rows:
+    if not stats.get("count"):
+      continue
+    hit_rate = f"{stats['hit_rate']:.0%}" if "hit_rate" in stats else ""
+    table.add_row(name, str(stats["count"]), *(f"{stats[p] * 1000:.1f}" for p in ("p50", "p95", "p99", "max")), hit_rate)
+  console.print(table)
+  if "llm_calls_per_turn" in results["graph_turn"]:
+    console.print(f"LLM calls per graph turn: {results['graph_turn']['llm_calls_per_turn']:.2f}, "
+                  f"memory growth over the turns: {results['graph_turn'].get('rss_mb', 0.0):.1f} MB", style="yellow")
+
+  if results.get("vector_backends"):
+    table = Table(title="Vector backends")
+    for column in ("Backend", "chunks", "recall@5", "p50 (ms)", "p95 (ms)", "build (s)", "RSS (MB)", "disk (MB)"):
+      table.add_column(column, justify="left" if column == "Backend" else "right")
+    for name, stats in results["vector_backends"].items():
+      table.add_row(name, str(stats["chunks"]), f"{stats['recall_at_5']:.1%}", f"{stats['p50'] * 1000:.2f}", f"{stats['p95'] * 1000:.2f}",
+                    f"{stats['build_seconds']:.2f}", f"{stats['rss_mb']:.1f}", f"{stats['disk_mb']:.1f}")
+    console.print(table)
+
+  if results.get("embedding_backends"):
+    reference = next(iter(results["embedding_backends"]))
+    table = Table(title="Embedding backends")
+    for column in ("Backend", "chunks", "chunks/sec", "load (s)", f"cosine to {reference}"):
+      table.add_column(column, justify="left" if column == "Backend" else "right")
+    for name, stats in results["embedding_backends"].items():
+      table.add_row(name, str(stats["chunks"]), f"{stats['chunks_per_sec']:.1f}", f"{stats['load_seconds']:.2f}", f"{stats['cosine_to_reference']:.4f}")
+    console.print(table)
+
+def main():
+  parser = argparse.ArgumentParser(description="Offline end-to-end benchmark of AiDA")
+  parser.add_argument("--documents", type=int, default=12, help="number of generated documents")
+  parser.add_argument("--paragraphs", type=int, default=30, help="paragraphs per document")
+  parser.add_argument("--formats", default="md,docx,pdf", help="comma separated document formats")
+  parser.add_argument("--queries", type=int, default=0, help="limit the number of retrieval queries (0: all)")
+  parser.add_argument("--turns", type=int, default=15, help="number of tool node and graph turns")
+  parser.add_argument("--workers", type=int, default=None, help="ingest parsing processes")
+  parser.add_argument("--batch-size", type=int, default=256, help="ingest embedding batch size")
+  parser.add_argument("--vector-backends", default=",".join(VECTOR_BACKENDS),
+                      help=f"comma separated vector backends to compare ({', '.join(VECTOR_BACKENDS)}), empty to skip")
+  parser.add_argument("--embedding-backends", default="",
+                      help=f"comma separated embedding backends to compare ({', '.join(EMBEDDING_BACKENDS)}), the first is the reference")
+  parser.add_argument("--embedding-batch-size", type=int, default=None, help="batch size of the compared embedding backends")
+  parser.add_argument("--embedding-threads", type=int, default=None, help="CPU threads of the compared embedding backends, 0 for the default")
+  parser.add_argument("--embeddings", choices=["fake", "real"], default="fake", help="fake hash embeddings or the real HuggingFace model")
+  parser.add_argument("--llm-ttft", type=float, default=0.0, help="simulated time to first token of the fake LLM (s)")
+  parser.add_argument("--llm-token-delay", type=float, default=0.0, help="simulated delay between tokens of the fake LLM (s)")
+  parser.add_argument("--search-latency", type=float, default=0.0, help="simulated latency of the fake Tavily client (s)")
+  parser.add_argument("--seed", type=int, default=0, help="seed of the generated corpus")
+  parser.add_argument("--keep", action="store_true", help="keep the scratch directory")
+  parser.add_argument("--json", default=None, help="write the results to this file")
+  args = parser.parse_args()
+  unknown = [b for b in args.vector_backends.split(",") if b and b not in VECTOR_BACKENDS]
+  if unknown:
+    parser.error(f"unknown vector backend(s): {', '.join(unknown)}")
+  unknown = [b for b in args.embedding_backends.split(",") if b and b not in EMBEDDING_BACKENDS]
+  if unknown:
+    parser.error(f"unknown embedding backend(s): {', '.join(unknown)}")
+
+  console = Console()
+  results = run(args)
+  print_results(results, console)
+  if args.json:
+    with open(args.json, "w", encoding="utf-8") as f:
+      json.dump(results, f, indent=2)
+    console.print(f"Results written to {args.json}", style="green")
+
+if __name__ == "__main__":
+  main()
@@ -0,0 +1,108 @@
+'''
+    Startup Benchmark
+
+        Measures, each in a fresh interpreter, the import time of the tool and utility modules and the
+        time until the AiDA Agent V 0.1.1 chat loop shows its first prompt. Exits with status 1 when the
+        time-to-prompt exceeds the budget.
+
+        Usage:
+            python -m benchmarks.startup [--budget SECONDS] [--runs N] [--json results.json]
+'''
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+from rich.console import Console
+from rich.table import Table
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+AGENT_SCRIPT = os.path.join(ROOT, "aida-agent-v-0.1.1.py")
+
+MODULES = [
+  "tools",
+  "tools.RAG.RAG",
+  "tools.WebSearch.websearchtool",
+  "tools.WebsiteScraper.website_scraper",
+  "tools.ContentSaver.contentSaverTool",
+  "utils.chat_util",
+  "langgraph.graph",
+]
+
+IMPORT_SNIPPET = '''
+import time, importlib
+st = time.perf_counter()
+importlib.import_module({module!r})
+print(time.perf_counter() - st)
+'''
+
+# Replaces the first Prompt.ask of the chat loop with a probe that reports the elapsed time and exits
+PROMPT_SNIPPET = '''
+import time
+st = time.perf_counter()
+import runpy, sys, rich.prompt
+def ask(*args, **kwargs):
+  print(time.perf_counter() - st)
+  sys.stdout.flush()
+  import os
+  os._exit(0)
+rich.prompt.Prompt.ask = ask
+sys.argv = [{script!r}]
+runpy.run_path({script!r}, run_name="__main__")
+'''
+
+def _run(code: str, env: dict) -> float:
+  # Run outside the repository so the chat history database of the probe does not end up in it
+  with tempfile.TemporaryDirectory() as cwd:
+    result = subprocess.run([sys.executable, "-c", code], cwd=cwd, env=env, capture_output=True, text=True)
+  lines = result.stdout.strip().splitlines()
+  if result.returncode != 0 or not lines:
+    raise RuntimeError(result.stderr.strip().splitlines()[-1] if result.stderr.strip() else "no output")
+  return float(lines[-1])
+
+def measure(runs: int = 3) -> dict:
+  env = dict(os.environ)
+  env["PYTHONPATH"] = os.pathsep.join(p for p in [ROOT, env.get("PYTHONPATH")] if p)
+  # The provider clients only need a key to be constructed, no request is made before the prompt
+  env.setdefault("GROQ_API_KEY", "startup-benchmark")
+  env.setdefault("DEFAULT_PROVIDER", "groq")
+  env.setdefault("GROQ_MODEL_NAME", "llama-3.3-70b-versatile")
+
+  results = {"imports": {}, "time_to_prompt": None}
+  for module in MODULES:
+    results["imports"][module] = statistics.median(_run(IMPORT_SNIPPET.format(module=module), env) for _ in range(runs))
+  results["time_to_prompt"] = statistics.median(_run(PROMPT_SNIPPET.format(script=AGENT_SCRIPT), env) for _ in range(runs))
+  return results
+
+def main():
+  parser = argparse.ArgumentParser(description="Measure AiDA import time and time-to-prompt")
+  parser.add_argument("--budget", type=float, default=float(os.getenv("AIDA_STARTUP_BUDGET", "3.0")), help="time-to-prompt budget in seconds")
+  parser.add_argument("--runs", type=int, default=3, help="runs per measurement, the median is reported")
+  parser.add_argument("--json", default=None, help="write the results to this file")
+  args = parser.parse_args()
+
+  console = Console()
+  results = measure(args.runs)
+  table = Table(title="AiDA startup")
+  table.add_column("Module")
+  table.add_column("Import time (s)", justify="right")
+  for module, seconds in results["imports"].items():
+    table.add_row(module, f"{seconds:.3f}")
+  table.add_row("[bold]time to prompt[/bold]", f"[bold]{results['time_to_prompt']:.3f}[/bold]")
+  console.print(table)
+
+  results["budget"] = args.budget
+  results["within_budget"] = results["time_to_prompt"] <= args.budget
+  if args.json:
+    with open(args.json, "w", encoding="utf-8") as f:
+      json.dump(results, f, indent=2)
+  if not results["within_budget"]:
+    console.print(f"Time to prompt {results['time_to_prompt']:.3f}s exceeds the budget of {args.budget:.3f}s", style="red")
+    sys.exit(1)
+  console.print(f"Time to prompt is within the budget of {args.budget:.3f}s", style="green")
+
+if __name__ == "__main__":
+  main()
@@ -0,0 +1,34 @@
+'''
+    AiDA Ingest
+
+        Pre-builds the document indexes used by the DocumentRetrieval tool, so that the first question
+        about a document does not pay for parsing and embedding it. Safe to re-run: documents whose
+        content has not changed since they were indexed are skipped.
+
+        All documents are stored in one corpus (tools/RAG/db/corpus), so a question can be asked across
+        several of them. Indexes built by older versions (one directory per document) are moved into the
+        corpus with --migrate, without parsing or embedding the documents again.
+
+        Usage:
+            python ingest.py <document | directory | "glob/**/*.pdf"> [--workers N] [--batch-size N]
+            python ingest.py --migrate
+'''
+
+import argparse
+from dotenv import load_dotenv
+from tools.RAG.Ingest import ingest, migrate_legacy_indexes
+
+if __name__ == "__main__":
+  parser = argparse.ArgumentParser(description="Index documents for AiDA")
+  parser.add_argument("target", nargs="?", help="a document, a directory or a glob pattern")
+  parser.add_argument("--workers", type=int, default=None, help="number of parsing processes (default: CPU count)")
+  parser.add_argument("--batch-size", type=int, default=256, help="number of chunks per embedding batch")
+  parser.add_argument("--migrate", action="store_true", help="move the per-document indexes of older versions into the corpus")
+  args = parser.parse_args()
+  if not args.migrate and not args.target:
+    parser.error("a target is required unless --migrate is given")
+  load_dotenv()
+  if args.migrate:
+    migrate_legacy_indexes()
+  if args.target:
+    ingest(args.target, workers=args.workers, batch_size=args.batch_size)
@@ -0,0 +1,84 @@
+'''
+    AiDA Server
+
+        Serves the AiDA Agent V 0.1.1 to many users at once. One process shares the compiled agent graph,
+        the warm embedding model and the open vector stores across all sessions, each session is its own
+        conversation thread.
+
+        Endpoints:
+            POST   /sessions                          -> {"session_id"}
+            POST   /sessions/{session_id}/messages    {"message", "filepath"?} -> NDJSON stream of events
+            GET    /sessions/{session_id}/ws          WebSocket, one turn per {"message", "filepath"?} message
+            DELETE /sessions/{session_id}
+            GET    /stats, GET /health
+
+        The events of a turn are start, token, tool_calls, tool_result and finally done (with the answer,
+        latency and token counts) or error. At most --max-turns turns run at once and --max-queued wait,
+        further turns get 503 with Retry-After. --fake serves a fake LLM and web search, for load tests.
+
+        Usage:
+            python server.py [--host 127.0.0.1] [--port 8080] [--max-turns N] [--max-queued N] [--fake]
+'''
+
+import argparse
+import importlib.util
+import os
+from dotenv import load_dotenv
+
+AGENT_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "aida-agent-v-0.1.1.py")
+
+def _load_agent_module():
+  spec = importlib.util.spec_from_file_location("aida_agent_v011", AGENT_SCRIPT)
+  module = importlib.util.module_from_spec(spec)
+  spec.loader.exec_module(module)
+  return module
+
+def create_server(fake: bool = False, max_turns: int = None, max_queued: int = None, llm_ttft: float = 0.0, llm_token_delay: float = 0.0):
+  '''
+  Builds the shared agent and the server around it
+  Arguments:
+    fake: bool - use the fake chat model and Tavily client of the benchmarks instead of the real providers
+    llm_ttft, llm_token_delay: float - simulated latencies of the fake chat model (s)
+  Output:
+    server : AidaServer
+  '''
+  agent_module = _load_agent_module()
+  from prompts.prompt import aida_v011_prompt
+  from tools import DocumentRetrieverTool, WebSearchTool, WebScraperTool, SaveContentTool
+  from tools.RAG.Registry import warm_up
+  from utils.server_util import AidaServer
+
+  llm = None
+  if fake:
+    from benchmarks.fakes import FakeChatModel, FakeTavilyClient
+    from utils.tavily_util import set_tavily_client
+    set_tavily_client(FakeTavilyClient())
+    llm = FakeChatModel(ttft=llm_ttft, token_delay=llm_token_delay)
+  else:
+    warm_up()
+  provider = os.getenv("DEFAULT_PROVIDER")
+  model_name = "fake" if fake else agent_module.get_model_name(provider, os.getenv("GROQ_MODEL_NAME"), os.getenv("OLLAMA_MODEL_NAME"), os.getenv("AZURE_MODEL_NAME"))
+  max_turns = max_turns or int(os.getenv("AIDA_SERVER_MAX_TURNS", "8"))
+  # Every running turn may run its tools in parallel, the tool pool is shared by all of them
+  agent = agent_module.Agent(provider=provider, model_name=model_name, system_prompt=aida_v011_prompt,
+                             tools=[DocumentRetrieverTool, WebScraperTool, WebSearchTool, SaveContentTool], llm=llm,
+                             max_parallel_tools=max_turns * int(os.getenv("AIDA_MAX_PARALLEL_TOOLS", "4")))
+  server = AidaServer(agent, agent_module.turn_events, max_turns=max_turns, max_queued=max_queued)
+  return server
+
+if __name__ == "__main__":
+  parser = argparse.ArgumentParser(description="Serve AiDA over HTTP and WebSocket")
+  parser.add_argument("--host", default="127.0.0.1", help="address to listen on")
+  parser.add_argument("--port", type=int, default=8080, help="port to listen on")
+  parser.add_argument("--max-turns", type=int, default=None, help="turns running at the same time (AIDA_SERVER_MAX_TURNS)")
+  parser.add_argument("--max-queued", type=int, default=None, help="turns waiting for a slot before new ones get 503 (AIDA_SERVER_MAX_QUEUED)")
+  parser.add_argument("--fake", action="store_true", help="use a fake LLM and web search, for local load tests")
+  parser.add_argument("--llm-ttft", type=float, default=0.5, help="simulated time to first token of the fake LLM (s)")
+  parser.add_argument("--llm-token-delay", type=float, default=0.02, help="simulated delay between tokens of the fake LLM (s)")
+  args = parser.parse_args()
+
+  # Loaded before the agent and the tools are imported, some of their settings are read at import
+  load_dotenv()
+  from aiohttp import web
+  server = create_server(args.fake, args.max_turns, args.max_queued, args.llm_ttft, args.llm_token_delay)
+  web.run_app(server.app(), host=args.host, port=args.port)
@@ -0,0 +1,51 @@
+'''
+    Test setup: the index, caches, traces and checkpoints go to a scratch directory, set before the
+    tools are imported (the index location is read at import), and the embedding model is the fake
+    of the benchmarks, so the tests run offline and never touch the repository's databases.
+'''
+
+import atexit
+import os
+import shutil
+import sys
+import tempfile
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+  sys.path.insert(0, ROOT)
+
+SCRATCH = tempfile.mkdtemp(prefix="aida-tests-")
+atexit.register(shutil.rmtree, SCRATCH, ignore_errors=True)
+os.environ.update({
+  "RAG_DB_DIR": os.path.join(SCRATCH, "db"),
+  "RAG_VECTOR_BACKEND": "mmap",
+  "RAG_PREFETCH": "false",
+  "WEB_CACHE_PATH": os.path.join(SCRATCH, "web_cache.db"),
+  "AIDA_TRACE_FILE": os.path.join(SCRATCH, "trace.jsonl"),
+  "AIDA_CHECKPOINT_DB": os.path.join(SCRATCH, "checkpoints.db"),
+  "AIDA_SESSION_DB": os.path.join(SCRATCH, "sessions.db")
+})
+
+@pytest.fixture(autouse=True, scope="session")
+def fake_embeddings():
+  from benchmarks.fakes import FakeEmbeddings
+  from tools.RAG.Registry import set_embeddings
+  embeddings = FakeEmbeddings()
+  set_embeddings(embeddings)
+  return embeddings
+
+@pytest.fixture(scope="session")
+def agent():
+  '''
+  The agent of aida-agent-v-0.1.1 with the fake chat model and Tavily client of the benchmarks
+  '''
+  from benchmarks.fakes import FakeChatModel, FakeTavilyClient
+  from benchmarks.run import _load_agent_module
+  from utils.tavily_util import set_tavily_client
+  from tools import DocumentRetrieverTool, WebSearchTool, WebScraperTool, SaveContentTool
+  set_tavily_client(FakeTavilyClient())
+  module = _load_agent_module()
+  return module.Agent(provider="groq", model_name="fake", system_prompt="You are AiDA.",
+                      tools=[DocumentRetrieverTool, WebScraperTool, WebSearchTool, SaveContentTool], llm=FakeChatModel())
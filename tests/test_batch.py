@@ -0,0 +1,54 @@
+def test_fast_path_document_query_records_one_llm_call(agent, tmp_path, monkeypatch):
+  from utils.batch_util import run_query
+
+  document = tmp_path / "pump.md"
+  document.write_text("# Pump\n\nIts warranty lasts 24 months from the date of purchase.\n", encoding="utf-8")
+  monkeypatch.setenv("AIDA_DOCUMENT_FAST_PATH", "true")
+  record = run_query(agent, {"id": "fast", "query": "How long is the warranty?", "filepath": str(document)})
+
+  assert record["status"] == "ok"
+  assert record["tool_calls"][0]["name"] == "DocumentRetrieval"
+  assert record["llm_calls"] == 1
+  assert record["prompt_tokens"] > 0
+
+def test_routed_document_query_records_two_llm_calls(agent, tmp_path, monkeypatch):
+  from utils.batch_util import run_query
+
+  document = tmp_path / "valve.md"
+  document.write_text("# Valve\n\nThe valve closes at 6 bar.\n", encoding="utf-8")
+  monkeypatch.setenv("AIDA_DOCUMENT_FAST_PATH", "false")
+  record = run_query(agent, {"id": "routed", "query": "When does the valve close?", "filepath": str(document)})
+
+  assert record["status"] == "ok"
+  assert record["llm_calls"] == 2
+
+def test_summary_call_is_counted_with_the_turn(agent, monkeypatch):
+  from langchain_core.messages import HumanMessage
+  from utils.batch_util import run_query
+  from benchmarks.run import _load_agent_module
+
+  # A budget this small folds every earlier turn into the rolling summary
+  monkeypatch.setattr(agent.context_manager, "budget", 50)
+  monkeypatch.setattr(agent.context_manager, "strategy", "summarize")
+  summaries = []
+  summarize = agent.context_manager.summarize
+  def recording_summarize(summary, messages):
+    result = summarize(summary, messages)
+    summaries.append(result[1])
+    return result
+  monkeypatch.setattr(agent.context_manager, "summarize", recording_summarize)
+
+  turn_events = _load_agent_module().turn_events
+  config = {"configurable": {"thread_id": "summary-events"}}
+  list(turn_events(agent, [HumanMessage(content="Search the web for pump warranties")], config))
+  events = list(turn_events(agent, [HumanMessage(content="Search the web for valve pressure")], config))
+  # The summary, the tool call and the answer, as counted by the chat loop and the server
+  prompt_tokens = [value for event, value in events if event == "prompt_tokens"]
+  assert len(prompt_tokens) == 3
+  assert prompt_tokens[0] == summaries[-1]
+
+  agent.graph.invoke({"messages": [HumanMessage(content="Search the web for pump warranties")]}, config={"configurable": {"thread_id": "batch-summary"}})
+  record = run_query(agent, {"id": "summary", "query": "Search the web for valve pressure"})
+  assert record["llm_calls"] == 3
+  assert record["stages"]["llm.summary"]["count"] == 1
+  assert record["prompt_tokens"] > summaries[-1]
@@ -0,0 +1,65 @@
+from tools.RAG.BM25 import BM25Index, tokenize, is_identifier_query, search_bm25, reciprocal_rank_fusion, load_bm25, update_bm25, delete_bm25
+from langchain_core.documents import Document
+
+CHUNKS = {
+  "c1": "The pump reports ERR-1042 when the inlet pressure drops below the limit.",
+  "c2": "Warranty: the pump is covered for 24 months from the date of purchase.",
+  "c3": "Firmware v2.3.1 fixes the pressure sensor calibration of the pump.",
+  "c4": "Clean the inlet filter every month to keep the pressure stable."
+}
+
+def build(chunks: dict) -> BM25Index:
+  index = BM25Index()
+  for chunk_id, text in chunks.items():
+    index.add(chunk_id, text)
+  return index
+
+def test_identifiers_are_kept_whole_and_split():
+  assert tokenize("ERR-1042 in v2.3.1") == ["err-1042", "err", "1042", "in", "v2.3.1", "v2", "3", "1"]
+  assert is_identifier_query("ERR-1042")
+  assert is_identifier_query("MAX_RETRIES")
+  assert not is_identifier_query("how long is the warranty")
+
+def test_rare_terms_rank_first():
+  index = build(CHUNKS)
+  assert index.search("ERR-1042", k=1)[0][0] == "c1"
+  assert index.search("warranty months", k=1)[0][0] == "c2"
+  # "pump" is in three chunks, "filter" in one, so the filter chunk wins
+  assert index.search("pump filter")[0][0] == "c4"
+  assert index.search("nothing matches this") == []
+
+def test_remove_and_readd_keep_the_statistics():
+  index = build(CHUNKS)
+  expected = index.search("inlet pressure")
+  index.remove("c3")
+  assert all(chunk_id != "c3" for chunk_id, _ in index.search("firmware"))
+  index.add("c3", CHUNKS["c3"])
+  assert index.search("inlet pressure") == expected
+  assert index.total_length == sum(index.lengths.values())
+
+def test_union_of_indexes_scores_like_one_index():
+  first = build({k: v for k, v in CHUNKS.items() if k in ("c1", "c2")})
+  second = build({k: v for k, v in CHUNKS.items() if k in ("c3", "c4")})
+  union = search_bm25([first, second], "inlet pressure pump", k=4)
+  single = build(CHUNKS).search("inlet pressure pump", k=4)
+  assert [chunk_id for chunk_id, _ in union] == [chunk_id for chunk_id, _ in single]
+  for (_, a), (_, b) in zip(union, single):
+    assert abs(a - b) < 1e-9
+
+def test_saved_index_is_updated_incrementally():
+  docs = [Document(page_content=text) for text in CHUNKS.values()]
+  update_bm25("bm25-test", docs, list(CHUNKS), [])
+  update_bm25("bm25-test", [Document(page_content="Replacement text about valves")], ["c5"], ["c1"])
+  index = load_bm25("bm25-test")
+  assert sorted(index.docs) == ["c2", "c3", "c4", "c5"]
+  assert index.search("valves")[0][0] == "c5"
+  delete_bm25("bm25-test")
+  assert load_bm25("bm25-test").docs == {}
+
+def test_reciprocal_rank_fusion():
+  dense = ["a", "b", "c"]
+  lexical = ["c", "a", "d"]
+  # "a" is near the top of both rankings, "d" only in one
+  assert reciprocal_rank_fusion([dense, lexical]) == ["a", "c", "b", "d"]
+  assert reciprocal_rank_fusion([dense]) == dense
+  assert reciprocal_rank_fusion([]) == []
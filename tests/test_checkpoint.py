@@ -0,0 +1,136 @@
+import operator
+import sqlite3
+import os
+from typing import Annotated, TypedDict
+
+from langgraph.checkpoint.base import empty_checkpoint
+from langgraph.graph import StateGraph
+
+from utils.checkpoint_util import SqliteCheckpointer, MAX_DELTA_CHAIN
+
+class CounterState(TypedDict):
+  steps: Annotated[list, operator.add]
+
+def build_graph(checkpointer):
+  graph = StateGraph(CounterState)
+  graph.add_node("step", lambda state: {"steps": [len(state["steps"])]})
+  graph.set_entry_point("step")
+  graph.set_finish_point("step")
+  return graph.compile(checkpointer=checkpointer)
+
+def put_checkpoint(saver: SqliteCheckpointer, thread_id: str, parent: dict = None) -> dict:
+  config = parent or {"configurable": {"thread_id": thread_id, "checkpoint_ns": ""}}
+  return saver.put(config, empty_checkpoint(), {"source": "loop", "step": 0}, {})
+
+def test_resume_after_restart(tmp_path):
+  path = str(tmp_path / "checkpoints.db")
+  config = {"configurable": {"thread_id": "chat"}}
+  graph = build_graph(SqliteCheckpointer(path=path))
+  for _ in range(3):
+    graph.invoke({"steps": []}, config=config)
+
+  # A new process opens the same database and continues the thread
+  resumed = build_graph(SqliteCheckpointer(path=path))
+  assert resumed.get_state(config).values == {"steps": [0, 1, 2]}
+  resumed.invoke({"steps": []}, config=config)
+  assert resumed.get_state(config).values == {"steps": [0, 1, 2, 3]}
+
+def test_keeps_last_checkpoints_with_their_pending_writes(tmp_path):
+  saver = SqliteCheckpointer(path=str(tmp_path / "checkpoints.db"), keep=2)
+  config = None
+  ids = []
+  for i in range(5):
+    config = put_checkpoint(saver, "t", config)
+    saver.put_writes(config, [("steps", i)], task_id=f"task-{i}")
+    ids.append(config["configurable"]["checkpoint_id"])
+
+  kept = [item.config["configurable"]["checkpoint_id"] for item in saver.list({"configurable": {"thread_id": "t"}})]
+  assert kept == ids[:-3:-1]
+  latest = saver.get_tuple({"configurable": {"thread_id": "t"}})
+  assert latest.pending_writes == [("task-4", "steps", 4)]
+  assert saver.get_tuple({"configurable": {"thread_id": "t", "checkpoint_id": ids[0]}}) is None
+  # The writes of the deleted checkpoints are deleted with them
+  with sqlite3.connect(saver.path) as conn:
+    assert {row[0] for row in conn.execute("SELECT checkpoint_id FROM writes")} == set(ids[-2:])
+  assert saver.stats()["checkpoints"] == 2
+  assert saver.stats()["pruned"] == 3
+
+def test_idle_threads_expire_at_vacuum(tmp_path):
+  saver = SqliteCheckpointer(path=str(tmp_path / "checkpoints.db"), ttl=60, vacuum_interval=3600)
+  put_checkpoint(saver, "idle")
+  put_checkpoint(saver, "active")
+  with saver.conn:
+    saver.conn.execute("UPDATE checkpoints SET updated_at = updated_at - 120 WHERE thread_id = 'idle'")
+
+  saver.vacuum()
+  assert saver.get_tuple({"configurable": {"thread_id": "idle"}}) is None
+  assert saver.get_tuple({"configurable": {"thread_id": "active"}}) is not None
+
+def test_large_values_are_compressed(tmp_path):
+  saver = SqliteCheckpointer(path=str(tmp_path / "checkpoints.db"))
+  config = {"configurable": {"thread_id": "big"}}
+  graph = StateGraph(CounterState)
+  graph.add_node("step", lambda state: {"steps": ["scraped page " * 1000]})
+  graph.set_entry_point("step")
+  graph.set_finish_point("step")
+  graph = graph.compile(checkpointer=saver)
+  graph.invoke({"steps": []}, config=config)
+
+  assert graph.get_state(config).values["steps"] == ["scraped page " * 1000]
+  with sqlite3.connect(saver.path) as conn:
+    assert any(kind.endswith("+zlib") for (kind,) in conn.execute("SELECT type FROM blobs"))
+
+def blob_rows(saver: SqliteCheckpointer, channel: str) -> list:
+  with sqlite3.connect(saver.path) as conn:
+    return conn.execute("SELECT version, LENGTH(value), base_version, depth FROM blobs WHERE channel = ? ORDER BY version", (channel,)).fetchall()
+
+def test_steps_store_only_the_appended_items(tmp_path):
+  path = str(tmp_path / "checkpoints.db")
+  config = {"configurable": {"thread_id": "long"}}
+  graph = build_graph(SqliteCheckpointer(path=path, keep=2))
+  for _ in range(30):
+    graph.invoke({"steps": [os.urandom(1024).hex()]}, config=config)
+
+  steps = graph.get_state(config).values["steps"]
+  assert len(steps) == 60
+  # The history is 120 KB, the latest version of the list only holds the items of the last step
+  version, size, base_version, depth = blob_rows(graph.checkpointer, "steps")[-1]
+  assert base_version is not None and 0 < depth <= MAX_DELTA_CHAIN
+  assert size < 4096
+
+  # A restarted process continues the chain from the latest checkpoint and still reads the whole history
+  resumed = build_graph(SqliteCheckpointer(path=path, keep=2))
+  assert resumed.get_state(config).values["steps"] == steps
+  resumed.invoke({"steps": ["after restart"]}, config=config)
+  assert resumed.get_state(config).values["steps"][:60] == steps
+  assert blob_rows(resumed.checkpointer, "steps")[-1][2] is not None
+
+def test_delta_chains_are_rebased_and_pruned(tmp_path):
+  saver = SqliteCheckpointer(path=str(tmp_path / "checkpoints.db"), keep=2)
+  config = {"configurable": {"thread_id": "chain"}}
+  graph = build_graph(saver)
+  for _ in range(MAX_DELTA_CHAIN + 10):
+    graph.invoke({"steps": []}, config=config)
+
+  assert graph.get_state(config).values["steps"] == list(range(MAX_DELTA_CHAIN + 10))
+  rows = blob_rows(saver, "steps")
+  # Only the chain of the kept checkpoints is left, and it starts at a base written after MAX_DELTA_CHAIN deltas
+  assert len(rows) < MAX_DELTA_CHAIN
+  assert max(depth for *_, depth in rows) <= MAX_DELTA_CHAIN
+  assert sum(1 for _, _, base_version, _ in rows if base_version is None) == 1
+
+def put_steps(saver: SqliteCheckpointer, version: str, steps: list) -> None:
+  checkpoint = {**empty_checkpoint(), "channel_values": {"steps": steps}, "channel_versions": {"steps": version}}
+  saver.put({"configurable": {"thread_id": "t"}}, checkpoint, {}, {"steps": version})
+
+def test_replaced_items_are_deltas_and_removed_items_a_new_base(tmp_path):
+  saver = SqliteCheckpointer(path=str(tmp_path / "checkpoints.db"))
+  put_steps(saver, "1", ["a", "b", "c"])
+  # The context manager replaces old tool results with digests in place
+  put_steps(saver, "2", ["a", "digest of b", "c", "d"])
+  # and removes the turns it folds into the summary
+  put_steps(saver, "3", ["digest of b", "c", "d"])
+  put_steps(saver, "4", ["digest of b", "c", "d", "e"])
+  assert [(version, base_version) for version, _, base_version, _ in blob_rows(saver, "steps")] == [("1", None), ("2", "1"), ("3", None), ("4", "3")]
+  history = [item.checkpoint["channel_values"]["steps"] for item in saver.list({"configurable": {"thread_id": "t"}})]
+  assert history == [["digest of b", "c", "d", "e"], ["digest of b", "c", "d"], ["a", "digest of b", "c", "d"], ["a", "b", "c"]]
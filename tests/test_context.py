@@ -0,0 +1,67 @@
+from langchain_core.messages import AIMessage, HumanMessage, RemoveMessage, ToolMessage
+
+from utils.context_util import ContextManager, TokenCounter, split_turns
+
+def turn(i: int, tool_chars: int = 2000) -> list:
+  return [
+    HumanMessage(content=f"question {i}", id=f"h{i}"),
+    AIMessage(content="", id=f"a{i}", tool_calls=[{"name": "WebSearch", "args": {"query": f"q{i}"}, "id": f"call{i}"}]),
+    ToolMessage(content="result " * (tool_chars // 7), id=f"t{i}", tool_call_id=f"call{i}", name="WebSearch"),
+    AIMessage(content=f"answer {i}", id=f"r{i}")
+  ]
+
+class FakeSummarizer:
+  def __init__(self):
+    self.prompts = []
+
+  def invoke(self, messages, config=None):
+    self.prompts.append(messages[0].content)
+    return AIMessage(content="summary of the earlier turns")
+
+def test_turns_start_at_each_question():
+  messages = turn(0) + turn(1)
+  assert [len(t) for t in split_turns(messages)] == [4, 4]
+
+def test_old_tool_results_become_digests():
+  manager = ContextManager(TokenCounter("groq", "fake"), budget=100000, strategy="trim", digest_chars=100)
+  update = manager.manage("system", "", turn(0) + turn(1)[:3])
+  # Only the tool result of the earlier turn is replaced, the current one is still needed
+  assert [m.id for m in update["messages"]] == ["t0"]
+  digest = update["messages"][0]
+  assert digest.additional_kwargs["digest"]
+  assert len(digest.content) < 200
+  assert "summary" not in update
+
+def test_trim_drops_the_oldest_turns_within_budget():
+  counter = TokenCounter("groq", "fake")
+  manager = ContextManager(counter, budget=300, strategy="trim", keep_turns=1, digest_chars=100)
+  messages = [m for i in range(6) for m in turn(i)] + [HumanMessage(content="question 6", id="h6")]
+  update = manager.manage("system", "", messages)
+  removed = {m.id for m in update["messages"] if isinstance(m, RemoveMessage)}
+  assert {"h0", "t0", "r0"} <= removed
+  assert "h5" not in removed and "h6" not in removed
+  replaced = {m.id: m for m in update["messages"]}
+  remaining = [replaced.get(m.id, m) for m in messages if m.id not in removed]
+  assert manager.prompt_tokens("system", update["summary"], remaining) <= 300
+
+def test_summarize_folds_the_dropped_turns():
+  summarizer = FakeSummarizer()
+  manager = ContextManager(TokenCounter("groq", "fake"), llm=summarizer, budget=300, strategy="summarize", keep_turns=1, digest_chars=100)
+  messages = [m for i in range(6) for m in turn(i)] + [HumanMessage(content="question 6", id="h6")]
+  update = manager.manage("system", "earlier summary", messages)
+  assert update["summary"] == "summary of the earlier turns"
+  assert "earlier summary" in summarizer.prompts[0] and "question 0" in summarizer.prompts[0]
+
+def test_current_turn_tool_results_are_cut_to_fit():
+  manager = ContextManager(TokenCounter("groq", "fake"), budget=500, strategy="trim", digest_chars=100)
+  messages = turn(0, tool_chars=20000)[:3]
+  update = manager.manage("system", "", messages)
+  cut = update["messages"][0]
+  assert cut.id == "t0" and cut.content.endswith("[output cut to fit the context budget]")
+  assert manager.prompt_tokens("system", "", messages[:2] + [cut]) <= 500
+
+def test_zero_digest_chars_keeps_only_the_size():
+  manager = ContextManager(TokenCounter("groq", "fake"), budget=100000, strategy="trim", digest_chars=0)
+  update = manager.manage("system", "", turn(0) + turn(1)[:1])
+  digest = update["messages"][0]
+  assert digest.content.startswith("[WebSearch output shortened from")
@@ -0,0 +1,61 @@
+import time
+
+from tools.RAG.EmbeddingCache import EmbeddingCache, CachedEmbeddings, text_hash
+
+# A float16 vector of the fake embeddings
+VECTOR_BYTES = 384 * 2
+
+class CountingEmbeddings:
+  def __init__(self, embeddings):
+    self.embeddings = embeddings
+    self.embedded = []
+
+  def embed_documents(self, texts: list) -> list:
+    self.embedded.extend(texts)
+    return self.embeddings.embed_documents(texts)
+
+  def embed_query(self, text: str) -> list:
+    return self.embeddings.embed_query(text)
+
+def test_only_new_chunks_are_embedded(tmp_path, fake_embeddings):
+  model = CountingEmbeddings(fake_embeddings)
+  embeddings = CachedEmbeddings(model, "fake", cache=EmbeddingCache(str(tmp_path / "cache.db")))
+  first = embeddings.embed_documents(["alpha", "beta", "alpha"])
+  # Duplicates within a batch are embedded once
+  assert model.embedded == ["alpha", "beta"]
+  second = embeddings.embed_documents(["beta", "alpha", "gamma"])
+  assert model.embedded == ["alpha", "beta", "gamma"]
+  # A cached vector is returned exactly as it was the first time
+  assert second[0] == first[1] and second[1] == first[0]
+  assert embeddings.cache.stats()["hits"] == 3
+
+def test_vectors_are_cached_per_model(tmp_path, fake_embeddings):
+  cache = EmbeddingCache(str(tmp_path / "cache.db"))
+  cache.put_many("model-a", {text_hash("alpha"): fake_embeddings.embed_query("alpha")})
+  assert list(cache.get_many("model-a", [text_hash("alpha")])) == [text_hash("alpha")]
+  assert cache.get_many("model-b", [text_hash("alpha")]) == {}
+
+def test_least_recently_used_vectors_are_evicted(tmp_path, fake_embeddings):
+  cache = EmbeddingCache(str(tmp_path / "cache.db"), max_bytes=12 * VECTOR_BYTES)
+  old = [f"old {i}" for i in range(10)]
+  cache.put_many("fake", {text_hash(text): fake_embeddings.embed_query(text) for text in old})
+  time.sleep(0.01)
+  cache.get_many("fake", [text_hash(text) for text in old[:2]])
+  time.sleep(0.01)
+  new = [f"new {i}" for i in range(5)]
+  cache.put_many("fake", {text_hash(text): fake_embeddings.embed_query(text) for text in new})
+
+  # Over the bound the cache shrinks to 90% of it, evicting the old vectors that were not read again
+  kept = cache.get_many("fake", [text_hash(text) for text in old + new])
+  assert len(kept) == 10
+  assert {text_hash(text) for text in old[:2] + new} <= set(kept)
+  assert cache.size == 10 * VECTOR_BYTES
+  # The size is read back from the database when the cache is reopened
+  assert EmbeddingCache(str(tmp_path / "cache.db")).size == cache.size
+
+def test_zero_size_keeps_no_vectors(tmp_path, fake_embeddings):
+  model = CountingEmbeddings(fake_embeddings)
+  embeddings = CachedEmbeddings(model, "fake", cache=EmbeddingCache(str(tmp_path / "cache.db"), max_bytes=0))
+  assert embeddings.embed_documents(["alpha"]) == embeddings.embed_documents(["alpha"])
+  assert model.embedded == ["alpha", "alpha"]
+  assert embeddings.cache.size == 0
@@ -0,0 +1,25 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+def test_concurrent_lookups_index_a_document_once(tmp_path, monkeypatch):
+  from tools.RAG.Chunking import ChunkDocument
+  from tools.RAG.RAG import RAG
+
+  document = tmp_path / "pump.md"
+  document.write_text("# Pump\n\nThe pump is rated for a maximum pressure of 8 bar.\n\nIts warranty lasts 24 months.\n", encoding="utf-8")
+  ingests = []
+  lock = threading.Lock()
+  store_embeddings = ChunkDocument.storeEmbeddings
+
+  def counted(self):
+    with lock:
+      ingests.append(self.doc_id)
+    return store_embeddings(self)
+
+  monkeypatch.setattr(ChunkDocument, "storeEmbeddings", counted)
+  queries = ["What is the maximum pressure?", "How long is the warranty?"] * 4
+  with ThreadPoolExecutor(max_workers=len(queries)) as pool:
+    contexts = list(pool.map(lambda q: RAG(str(document), q), queries))
+
+  assert all(context for context in contexts)
+  assert len(ingests) == 1
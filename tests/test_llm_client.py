@@ -0,0 +1,45 @@
+import asyncio
+
+import httpx
+import pytest
+
+from benchmarks.llm_stub import start_stub
+from utils.llm_client import AsyncProviderTransport, ProviderTransport, RateLimiter
+
+BODY = {"model": "stub-model", "messages": [{"role": "user", "content": "What is the warranty period?"}], "max_tokens": 16}
+
+@pytest.fixture
+def stub():
+  # Every third request is throttled with a short Retry-After
+  server = start_stub(latency=0.0, throttle=0.3, retry_after=0.01)
+  yield f"http://127.0.0.1:{server.server_address[1]}/openai/v1/chat/completions"
+  server.shutdown()
+  server.server_close()
+
+def make_transport() -> ProviderTransport:
+  return ProviderTransport("stub", max_retries=10, backoff_base=0.01, backoff_max=0.05,
+                           requests_per_minute=0, tokens_per_minute=0, model_limits={})
+
+def test_sync_transport_retries_throttled_requests(stub):
+  transport = make_transport()
+  with httpx.Client(transport=transport) as client:
+    statuses = [client.post(stub, json=BODY).status_code for _ in range(20)]
+  assert statuses == [200] * 20
+  assert transport.stats["retries"] == transport.stats["throttled"]
+
+def test_async_transport_shares_limits_and_stats(stub):
+  shared = make_transport()
+
+  async def run() -> list:
+    async with httpx.AsyncClient(transport=AsyncProviderTransport(shared)) as client:
+      responses = await asyncio.gather(*(client.post(stub, json=BODY) for _ in range(20)))
+    return [r.status_code for r in responses]
+
+  assert asyncio.run(run()) == [200] * 20
+  assert shared.stats["requests"] == 20 + shared.stats["retries"]
+
+def test_rate_limiter_reserves_without_blocking():
+  limiter = RateLimiter(requests_per_minute=60)
+  waits = [limiter.reserve(1) for _ in range(61)]
+  assert waits[0] == 0.0
+  assert waits[-1] == pytest.approx(1.0, abs=0.05)
@@ -0,0 +1,84 @@
+import os
+import sys
+import types
+import uuid
+
+from benchmarks.fakes import FakeEmbeddings
+
+class FakeCollection:
+  name = "baseline"
+
+  def __init__(self, ids: list, documents: list, metadatas: list, embeddings: list):
+    self.rows = list(zip(ids, documents, metadatas, embeddings))
+
+  def get(self, limit: int = None, offset: int = 0, include: list = None) -> dict:
+    rows = self.rows[offset:offset + limit if limit else None]
+    return {
+      "ids": [r[0] for r in rows],
+      "documents": [r[1] for r in rows],
+      "metadatas": [r[2] for r in rows],
+      "embeddings": [r[3] for r in rows]
+    }
+
+def fake_chromadb(collections: dict) -> types.ModuleType:
+  # chromadb.PersistentClient over in-memory collections, keyed by the index directory
+  module = types.ModuleType("chromadb")
+
+  class PersistentClient:
+    def __init__(self, path: str):
+      self.collection = collections.get(os.path.abspath(path))
+
+    def list_collections(self) -> list:
+      return [self.collection] if self.collection else []
+
+    def get_collection(self, name: str) -> FakeCollection:
+      return self.collection
+
+  module.PersistentClient = PersistentClient
+  return module
+
+def test_migrate_baseline_index_then_query_all(tmp_path, monkeypatch):
+  from tools.RAG.Index import DB_DIR, index_key, load_manifest
+  from tools.RAG.Ingest import migrate_legacy_indexes
+  from tools.RAG.RAG import RAG, resolve_documents
+
+  document = tmp_path / "manual.md"
+  paragraphs = [
+    "The warranty period of the pump is 24 months from the date of purchase.",
+    "Replace the filter cartridge every 6 months to keep the flow rate stable.",
+    "The pump is rated for a maximum pressure of 8 bar."
+  ]
+  document.write_text("# Manual\n\n" + "\n\n".join(paragraphs) + "\n", encoding="utf-8")
+
+  # A per-file index of the baseline: a Chroma directory named after the file, random chunk ids, no manifest
+  legacy_dir = os.path.join(DB_DIR, "manual")
+  os.makedirs(legacy_dir, exist_ok=True)
+  open(os.path.join(legacy_dir, "chroma.sqlite3"), "wb").close()
+  collection = FakeCollection(
+    [str(uuid.uuid4()) for _ in paragraphs],
+    paragraphs,
+    [{"source": str(document)} for _ in paragraphs],
+    FakeEmbeddings().embed_documents(paragraphs)
+  )
+  monkeypatch.setitem(sys.modules, "chromadb", fake_chromadb({os.path.abspath(legacy_dir): collection}))
+
+  stats = migrate_legacy_indexes()
+  assert stats == {"documents": 1, "chunks": 3}
+
+  doc_id = index_key(str(document))
+  manifest = load_manifest(doc_id)
+  assert manifest["filepath"] == os.path.abspath(document)
+  assert manifest["file_hash"] is None
+  assert all(chunk_id.startswith(f"{doc_id}:") for chunk_id in manifest["chunks"])
+  assert load_manifest("legacy_manual") is None
+
+  # Only regular files are searched, never an index directory
+  resolved = resolve_documents("all")
+  assert os.path.abspath(document) in resolved
+  assert all(os.path.isfile(path) for path in resolved)
+
+  context = RAG("all", "How long is the warranty period?")
+  assert context is not None
+  assert "24 months" in context
+  # The query re-planned the document against its real content hash
+  assert load_manifest(doc_id)["file_hash"] is not None
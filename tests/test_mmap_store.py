@@ -0,0 +1,67 @@
+import numpy as np
+from langchain_core.documents import Document
+
+from tools.RAG.MmapStore import MmapCorpusStore
+
+WORDS = ["pump", "valve", "filter", "sensor", "pressure", "warranty", "firmware", "inlet", "motor", "seal"]
+
+def corpus(n: int, doc_id: str = "doc") -> tuple:
+  docs = [Document(page_content=f"chunk{i} {WORDS[i % 10]} {WORDS[i % 7]} part{i % 13}", metadata={"doc_id": doc_id, "i": i}) for i in range(n)]
+  return docs, [f"{doc_id}-{i}" for i in range(n)]
+
+def test_int8_search_finds_the_exact_chunk(tmp_path):
+  store = MmapCorpusStore(directory=str(tmp_path), dtype="int8", ivf_min_rows=10 ** 6)
+  docs, ids = corpus(300)
+  store.add_documents(docs, ids)
+  assert store.vectors.dtype == np.int8
+  for i in (0, 137, 299):
+    result = store.search(docs[i].page_content, k=3)
+    assert result[0].id == ids[i]
+    assert result[0].metadata == {"doc_id": "doc", "i": i}
+
+def test_ivf_search_matches_brute_force(tmp_path):
+  docs, ids = corpus(400)
+  exact = MmapCorpusStore(directory=str(tmp_path / "exact"), dtype="int8", ivf_min_rows=10 ** 6)
+  exact.add_documents(docs, ids)
+  ivf = MmapCorpusStore(directory=str(tmp_path / "ivf"), dtype="int8", ivf_min_rows=100, nprobe=4)
+  ivf.add_documents(docs, ids)
+  assert ivf.centroids is not None and len(ivf.centroids) == 20
+  found = sum(ivf.search(doc.page_content, k=1)[0].id == exact.search(doc.page_content, k=1)[0].id for doc in docs[::10])
+  assert found >= 36
+
+def test_delete_hides_chunks_and_reuses_their_rows(tmp_path):
+  store = MmapCorpusStore(directory=str(tmp_path), dtype="int8", ivf_min_rows=10 ** 6)
+  docs, ids = corpus(50)
+  store.add_documents(docs, ids)
+  row = store.id_rows[ids[7]]
+  store.delete([ids[7]])
+  assert all(result.id != ids[7] for result in store.search(docs[7].page_content, k=50))
+  assert ids[7] not in store.get([ids[7]])
+
+  extra, extra_ids = corpus(1, doc_id="other")
+  store.add_documents(extra, extra_ids)
+  assert store.id_rows[extra_ids[0]] == row
+  assert store.count == 50
+  assert [r.id for r in store.search(extra[0].page_content, k=5, doc_ids=["other"])] == extra_ids
+
+def test_reopened_store_sees_the_writes(tmp_path):
+  writer = MmapCorpusStore(directory=str(tmp_path), dtype="float16", ivf_min_rows=10 ** 6)
+  docs, ids = corpus(20)
+  writer.add_documents(docs, ids)
+  reader = MmapCorpusStore(directory=str(tmp_path), dtype="int8")
+  # The arrays on disk decide the precision
+  assert reader.dtype == "float16"
+  assert reader.search(docs[3].page_content, k=1)[0].id == ids[3]
+  writer.delete(ids[:10])
+  assert len(reader.chunks_of("doc")) == 10
+  assert all(result.id not in ids[:10] for result in reader.search(docs[3].page_content, k=20))
+
+def test_zero_nprobe_and_rerank(tmp_path):
+  docs, ids = corpus(400)
+  store = MmapCorpusStore(directory=str(tmp_path), dtype="int8", ivf_min_rows=100, nprobe=0, rerank=0)
+  assert (store.nprobe, store.rerank) == (0, 0)
+  store.add_documents(docs, ids)
+  assert store.centroids is not None
+  # Every cluster is scanned and the quantized scores rank the chunks
+  for i in range(0, 400, 10):
+    assert store.search(docs[i].page_content, k=1)[0].id == ids[i]
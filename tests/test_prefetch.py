@@ -0,0 +1,55 @@
+from tools.RAG.Prefetch import Prefetcher
+
+def test_zero_workers_start_no_jobs(tmp_path):
+  path = tmp_path / "notes.md"
+  path.write_text("# Notes\n\nThe warranty lasts 24 months.\n", encoding="utf-8")
+  prefetcher = Prefetcher(workers=0)
+  assert prefetcher.workers == 0
+  assert prefetcher.submit(str(path)) is None
+  assert prefetcher.list_jobs() == []
+  assert prefetcher.wait(str(path)) is None
+
+def test_queued_document_is_indexed_inline(tmp_path, monkeypatch):
+  import threading
+  import time
+  from tools.RAG import Prefetch
+  from tools.RAG.RAG import RAG
+
+  release = threading.Event()
+  started = []
+
+  class BlockingChunkDocument:
+    # Stands in for the ingest of the first document, which takes as long as the test needs
+    def __init__(self, filepath, cancel=None):
+      started.append(filepath)
+      release.wait(10)
+      self.stored_chunks = 0
+
+    def parseDocument(self):
+      return True
+
+  monkeypatch.setattr(Prefetch, "ChunkDocument", BlockingChunkDocument)
+  slow, queued = tmp_path / "slow.md", tmp_path / "queued.md"
+  slow.write_text("# Slow\n\nA large manual.\n", encoding="utf-8")
+  queued.write_text("# Pump\n\nThe pump warranty lasts 24 months.\n", encoding="utf-8")
+
+  prefetcher = Prefetcher(workers=1)
+  monkeypatch.setattr(Prefetch, "_prefetcher", prefetcher)
+  slow_job = prefetcher.submit(str(slow))
+  queued_job = prefetcher.submit(str(queued))
+  while not started:
+    time.sleep(0.01)
+
+  try:
+    # The queued document is not stuck behind the unrelated ingest
+    st = time.perf_counter()
+    assert "24 months" in RAG(str(queued), "How long is the warranty?")
+    assert time.perf_counter() - st < 5
+    assert queued_job.status == "skipped"
+    assert slow_job.status == "running"
+  finally:
+    release.set()
+  slow_job.done.wait(5)
+  prefetcher.pool.shutdown(wait=True)
+  # The skipped job never ran
+  assert started == [str(slow)]
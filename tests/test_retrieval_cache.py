@@ -0,0 +1,65 @@
+from tools.RAG.Cache import RetrievalCache, normalize_query
+
+def test_exact_tier_normalizes_the_query():
+  cache = RetrievalCache(max_size=10, ttl=60, threshold=0.95)
+  key = (("doc", "hash-1"),)
+  cache.put(key, "What is the  warranty?", None, ["chunk"])
+  assert normalize_query(" what is the WARRANTY ") == "what is the warranty"
+  assert cache.get(key, "what is the warranty") == ["chunk"]
+  assert cache.get(key, "what is the price") is None
+
+def test_reindexed_document_misses(fake_embeddings):
+  cache = RetrievalCache(max_size=10, ttl=60, threshold=0.95)
+  query = "how long is the warranty"
+  cache.put((("doc", "hash-1"),), query, fake_embeddings.embed_query(query), ["old chunk"])
+  # The content hash is part of the key, a new version of the document never sees old chunks
+  assert cache.get((("doc", "hash-2"),), query) is None
+  assert cache.get_similar((("doc", "hash-2"),), fake_embeddings.embed_query(query)) is None
+
+def test_invalidate_drops_every_entry_of_a_document():
+  cache = RetrievalCache(max_size=10, ttl=60, threshold=0.95)
+  cache.put((("a", "1"),), "q1", None, ["a"])
+  cache.put((("a", "1"), ("b", "1")), "q2", None, ["a", "b"])
+  cache.put((("b", "1"),), "q3", None, ["b"])
+  cache.invalidate("a")
+  assert cache.get((("a", "1"),), "q1") is None
+  assert cache.get((("a", "1"), ("b", "1")), "q2") is None
+  assert cache.get((("b", "1"),), "q3") == ["b"]
+
+def test_semantic_tier_uses_the_threshold(fake_embeddings):
+  cache = RetrievalCache(max_size=10, ttl=60, threshold=0.8)
+  key = (("doc", "1"),)
+  cache.put(key, "warranty period of the pump", fake_embeddings.embed_query("warranty period of the pump"), ["warranty"])
+  # Same words in another order embed to the same bag-of-words vector
+  assert cache.get_similar(key, fake_embeddings.embed_query("the pump warranty period")) == ["warranty"]
+  assert cache.get_similar(key, fake_embeddings.embed_query("firmware release notes")) is None
+  assert cache.get_similar(key, None) is None
+  assert cache.stats()["hits_semantic"] == 1
+  assert cache.stats()["misses"] == 2
+
+def test_ttl_and_lru_eviction(monkeypatch):
+  import tools.RAG.Cache as Cache
+  now = [1000.0]
+  monkeypatch.setattr(Cache.time, "monotonic", lambda: now[0])
+  cache = RetrievalCache(max_size=2, ttl=10, threshold=0.95)
+  key = (("doc", "1"),)
+  cache.put(key, "q1", None, ["1"])
+  cache.put(key, "q2", None, ["2"])
+  assert cache.get(key, "q1") == ["1"]
+  cache.put(key, "q3", None, ["3"])
+  # q2 was the least recently used
+  assert cache.get(key, "q2") is None
+  assert cache.get(key, "q1") == ["1"]
+  now[0] += 11
+  assert cache.get(key, "q3") is None
+  assert cache.stats()["size"] == 1
+
+def test_explicit_zero_settings_are_kept(monkeypatch, fake_embeddings):
+  monkeypatch.setenv("RAG_CACHE_SIMILARITY", "0.99")
+  cache = RetrievalCache(max_size=10, ttl=60, threshold=0.0)
+  assert cache.threshold == 0.0
+  key = (("doc", "1"),)
+  cache.put(key, "warranty period", fake_embeddings.embed_query("warranty period"), ["warranty"])
+  assert cache.get_similar(key, fake_embeddings.embed_query("warranty of the pump")) == ["warranty"]
+  zeros = RetrievalCache(max_size=0, ttl=0)
+  assert (zeros.max_size, zeros.ttl, zeros.threshold) == (0, 0, 0.99)
@@ -0,0 +1,54 @@
+from langchain_core.messages import HumanMessage, AIMessage
+
+from utils.session_store import SessionStore
+
+def conversation(count: int, offset: int = 0) -> list:
+  return [(HumanMessage if i % 2 == 0 else AIMessage)(content=f"message {i}") for i in range(offset, offset + count)]
+
+def contents(messages: list) -> list:
+  return [m.content for m in messages]
+
+def test_pages_from_the_end(tmp_path):
+  store = SessionStore(str(tmp_path / "sessions.db"))
+  store.save("long", conversation(450))
+
+  last, start = store.page("long")
+  assert start == 250
+  assert contents(last) == [f"message {i}" for i in range(250, 450)]
+  older, start = store.page("long", before=start)
+  assert (start, contents(older)[0]) == (50, "message 50")
+  oldest, start = store.page("long", before=start)
+  assert (start, len(oldest)) == (0, 50)
+  assert store.page("missing") == ([], 0)
+
+def test_save_keeps_the_messages_that_were_not_loaded(tmp_path):
+  store = SessionStore(str(tmp_path / "sessions.db"))
+  store.save("long", conversation(450))
+  last, start = store.page("long")
+  continued = last + conversation(2, offset=450)
+
+  # Saved under a new name the older messages are copied, saved over the session they stay in place
+  assert store.save("copy", continued, prefix=("long", start)) == 452
+  assert store.save("long", continued, prefix=("long", start)) == 452
+  counts = {name: count for name, count, _ in store.list_sessions()}
+  for name in ("copy", "long"):
+    messages = [m for page in store.iter_messages(name) for m in page]
+    assert contents(messages) == [f"message {i}" for i in range(452)]
+    assert counts[name] == 452
+
+def test_load_copies_the_last_page_into_the_chat(tmp_path, monkeypatch):
+  from langchain_core.chat_history import InMemoryChatMessageHistory
+  from utils import chat_util
+  store = SessionStore(str(tmp_path / "sessions.db"))
+  store.save("long", conversation(450))
+  monkeypatch.setattr(chat_util, "get_session_store", lambda: store)
+  monkeypatch.setattr(chat_util.IntPrompt, "ask", lambda *args, **kwargs: 1)
+  monkeypatch.setattr(chat_util.Prompt, "ask", lambda *args, **kwargs: "continued")
+
+  chat_history = InMemoryChatMessageHistory()
+  chat_util._load_chat_session(chat_history)
+  assert len(chat_history.messages) == 200
+  chat_util._show_older_messages(chat_history)
+  chat_history.add_messages(conversation(2, offset=450))
+  chat_util._save_chat_session(chat_history)
+  assert {name: count for name, count, _ in store.list_sessions()}["continued"] == 452
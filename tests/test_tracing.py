@@ -0,0 +1,27 @@
+import json
+import os
+
+from utils.tracing import Span, Tracer
+
+def test_trace_file_is_off_by_default(monkeypatch, tmp_path):
+  monkeypatch.delenv("AIDA_TRACE_FILE", raising=False)
+  monkeypatch.chdir(tmp_path)
+  tracer = Tracer(otel="")
+  tracer.export(Span("turn"))
+  assert tracer.path == ""
+  assert os.listdir(tmp_path) == []
+  assert tracer.metrics.summary()["turn"]["count"] == 1
+
+def test_trace_file_rotates_at_max_size(tmp_path):
+  path = str(tmp_path / "trace.jsonl")
+  tracer = Tracer(path=path, otel="", max_mb=0.001)
+  for _ in range(50):
+    tracer.export(Span("llm", attributes={"tokens": 100}))
+
+  # Only the current file and the previous one are kept, each about max_mb
+  assert sorted(os.listdir(tmp_path)) == ["trace.jsonl", "trace.jsonl.1"]
+  for name in os.listdir(tmp_path):
+    size = os.path.getsize(tmp_path / name)
+    assert size < 1024 + 300
+  with open(path + ".1", encoding="utf-8") as f:
+    assert all(json.loads(line)["name"] == "llm" for line in f)
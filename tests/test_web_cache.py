@@ -0,0 +1,16 @@
+from utils.web_cache import WebCache
+
+def test_least_recently_used_entries_are_evicted(tmp_path):
+  cache = WebCache(path=str(tmp_path / "web_cache.db"), max_entries=2, max_bytes=10 ** 6)
+  cache.store("search", {"query": "a"}, "A")
+  cache.store("search", {"query": "b"}, "B")
+  assert cache.lookup("search", {"query": "a"}, ttl=60) == ("A", "hit")
+  cache.store("search", {"query": "c"}, "C")
+  assert cache.lookup("search", {"query": "b"}, ttl=60) is None
+  assert cache.lookup("search", {"query": "a"}, ttl=60) == ("A", "hit")
+
+def test_zero_bounds_keep_no_entries(tmp_path):
+  for bounds in ({"max_entries": 0, "max_bytes": 10 ** 6}, {"max_entries": 10, "max_bytes": 0}):
+    cache = WebCache(path=str(tmp_path / f"{bounds['max_entries']}.db"), **bounds)
+    cache.store("search", {"query": "a"}, "A")
+    assert cache.lookup("search", {"query": "a"}, ttl=60) is None
@@ -0,0 +1,48 @@
+import pytest
+
+@pytest.fixture
+def tavily(monkeypatch, tmp_path):
+  from benchmarks.fakes import FakeTavilyClient
+  from utils import web_cache
+  from utils.tavily_util import set_tavily_client
+  monkeypatch.setattr(web_cache, "_web_cache", web_cache.WebCache(path=str(tmp_path / "web_cache.db")))
+  client = FakeTavilyClient()
+  set_tavily_client(client)
+  return client
+
+def test_cold_scrape_extracts_all_urls_in_one_call(tavily):
+  from tools.WebsiteScraper.website_scraper import scrapWebsite
+
+  urls = [f"https://example.com/page/{i}" for i in range(3)]
+  context = scrapWebsite(urls, "What is on the pages?")
+  assert tavily.calls == 1
+  assert all(f"URL: {url}" in context for url in urls)
+
+  # Cached pages are not extracted again, only the new one is
+  context = scrapWebsite(urls + ["https://example.com/page/3/"], "What is on the pages?")
+  assert tavily.calls == 2
+  assert context.index("page/0") < context.index("page/3")
+
+  scrapWebsite(urls, "What is on the pages?")
+  assert tavily.calls == 2
+
+def test_redirected_page_is_never_given_to_a_failed_url(tavily, monkeypatch):
+  from utils.web_cache import get_web_cache
+  from tools.WebsiteScraper.website_scraper import scrapWebsite, _params
+
+  failed, moved, target = "https://example.com/broken", "https://example.com/old", "https://example.com/new"
+
+  def extract(urls, include_images=False, **kwargs):
+    tavily.calls += 1
+    return {"results": [{"url": target, "raw_content": "The moved page."}], "failed_results": [{"url": failed, "error": "404"}]}
+
+  monkeypatch.setattr(tavily, "extract", extract)
+  context = scrapWebsite([failed, moved], "What is on the pages?")
+  assert context.count("URL: ") == 1
+  assert f"URL: {target}\n Raw Conent: The moved page." in context
+
+  # Neither requested URL gets the page, it is only cached under the URL it came back with
+  cache = get_web_cache()
+  assert cache.lookup("WebsiteScraper", _params(failed), ttl=3600) is None
+  assert cache.lookup("WebsiteScraper", _params(moved), ttl=3600) is None
+  assert cache.lookup("WebsiteScraper", _params(target), ttl=3600)[0]["raw_content"] == "The moved page."
@@ -0,0 +1,202 @@
+from collections import Counter
+import threading
+import json
+import math
+import re
+import os
+from tools.RAG.Index import CORPUS_DIR
+
+BM25_DIR: str = os.path.join(CORPUS_DIR, "bm25")
+
+TOKEN_RE = re.compile(r"[A-Za-z0-9]+(?:[-_./:][A-Za-z0-9]+)*")
+
+def tokenize(text: str) -> list:
+  '''
+  Lower-cased word tokens. Compound identifiers such as "ERR-1042" or "v2.3.1" are kept whole
+  and also split into their parts, so both the exact identifier and its pieces match.
+  '''
+  tokens = []
+  for match in TOKEN_RE.finditer(text.lower()):
+    token = match.group(0)
+    tokens.append(token)
+    if not token.isalnum():
+      tokens.extend(part for part in re.split(r"[-_./:]", token) if part)
+  return tokens
+
+def is_identifier_query(query: str) -> bool:
+  '''
+  Checks if the query is a short lookup of an identifier (part number, error code, ...) that a
+  lexical search answers better and faster than a dense one
+  '''
+  words = query.split()
+  if not words or len(words) > 3:
+    return False
+  for word in words:
+    word = word.strip("\"'`.,;:?!()[]")
+    has_digit = any(c.isdigit() for c in word)
+    has_alpha = any(c.isalpha() for c in word)
+    if has_digit and (has_alpha or any(c in "-_./" for c in word)):
+      return True
+    if "_" in word and word.upper() == word and has_alpha:
+      return True
+  return False
+
+def bm25_path(doc_id: str) -> str:
+  return os.path.join(BM25_DIR, f"{doc_id}.json")
+
+class BM25Index:
+  '''
+  Okapi BM25 inverted index over the chunks of one document, persisted next to the corpus collection
+  '''
+
+  def __init__(self, k1: float = 1.5, b: float = 0.75):
+    self.k1 = k1
+    self.b = b
+    self.docs: dict = {}
+    self.lengths: dict = {}
+    self.postings: dict = {}
+    self.total_length = 0
+
+  def add(self, chunk_id: str, text: str) -> None:
+    if chunk_id in self.docs:
+      self.remove(chunk_id)
+    terms = dict(Counter(tokenize(text)))
+    self.docs[chunk_id] = terms
+    self.lengths[chunk_id] = sum(terms.values())
+    self.total_length += self.lengths[chunk_id]
+    for term, tf in terms.items():
+      self.postings.setdefault(term, {})[chunk_id] = tf
+
+  def remove(self, chunk_id: str) -> None:
+    terms = self.docs.pop(chunk_id, None)
+    if terms is None:
+      return
+    self.total_length -= self.lengths.pop(chunk_id)
+    for term in terms:
+      posting = self.postings.get(term)
+      if posting is not None:
+        posting.pop(chunk_id, None)
+        if not posting:
+          del self.postings[term]
+
+  def search(self, query: str, k: int = 5) -> list:
+    '''
+    Returns up to k (chunk id, score) pairs, best first
+    '''
+    n = len(self.docs)
+    if n == 0:
+      return []
+    avg_length = self.total_length / n or 1.0
+    scores: dict = {}
+    for term in set(tokenize(query)):
+      posting = self.postings.get(term)
+      if not posting:
+        continue
+      idf = math.log(1 + (n - len(posting) + 0.5) / (len(posting) + 0.5))
+      for chunk_id, tf in posting.items():
+        denominator = tf + self.k1 * (1 - self.b + self.b * self.lengths[chunk_id] / avg_length)
+        scores[chunk_id] = scores.get(chunk_id, 0.0) + idf * tf * (self.k1 + 1) / denominator
+    return sorted(scores.items(), key=lambda item: item[1], reverse=True)[:k]
+
+  def save(self, doc_id: str) -> None:
+    os.makedirs(BM25_DIR, exist_ok=True)
+    path = bm25_path(doc_id)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+      json.dump({"k1": self.k1, "b": self.b, "docs": self.docs}, f)
+    os.replace(tmp_path, path)
+    with _loaded_lock:
+      _loaded[doc_id] = (os.stat(path).st_mtime_ns, self)
+
+  @classmethod
+  def from_file(cls, path: str):
+    with open(path, "r", encoding="utf-8") as f:
+      data = json.load(f)
+    index = cls(k1=data.get("k1", 1.5), b=data.get("b", 0.75))
+    for chunk_id, terms in data["docs"].items():
+      index.docs[chunk_id] = terms
+      index.lengths[chunk_id] = sum(terms.values())
+      index.total_length += index.lengths[chunk_id]
+      for term, tf in terms.items():
+        index.postings.setdefault(term, {})[chunk_id] = tf
+    return index
+
+# doc_id -> (mtime of the index file, index), so each index is read from disk once per change
+_loaded: dict = {}
+_loaded_lock = threading.Lock()
+
+def load_bm25(doc_id: str, fresh: bool = False):
+  '''
+  Returns the BM25 index of a document, or an empty index if it was not built yet
+  Arguments:
+    doc_id: str - the document id in the corpus
+    fresh: bool - read a private copy from disk, for updating it without affecting concurrent searches
+  '''
+  path = bm25_path(doc_id)
+  if not os.path.exists(path):
+    return BM25Index()
+  if fresh:
+    return BM25Index.from_file(path)
+  mtime = os.stat(path).st_mtime_ns
+  with _loaded_lock:
+    cached = _loaded.get(doc_id)
+    if cached and cached[0] == mtime:
+      return cached[1]
+  index = BM25Index.from_file(path)
+  with _loaded_lock:
+    _loaded[doc_id] = (mtime, index)
+  return index
+
+def update_bm25(doc_id: str, docs: list, ids: list, stale_ids: list) -> None:
+  '''
+  Applies a re-index of a document (new or changed chunks and deleted chunk ids) to its BM25 index
+  '''
+  index = load_bm25(doc_id, fresh=True)
+  for chunk_id in stale_ids:
+    index.remove(chunk_id)
+  for doc, chunk_id in zip(docs, ids):
+    index.add(chunk_id, doc.page_content)
+  index.save(doc_id)
+
+def delete_bm25(doc_id: str) -> None:
+  with _loaded_lock:
+    _loaded.pop(doc_id, None)
+  if os.path.exists(bm25_path(doc_id)):
+    os.remove(bm25_path(doc_id))
+
+def search_bm25(indexes: list, query: str, k: int = 5) -> list:
+  '''
+  BM25 search over the union of several document indexes, with document frequencies and the average
+  chunk length taken over all of them, so the scores are comparable across documents
+  Output:
+    results : list - up to k (chunk id, score) pairs, best first
+  '''
+  if len(indexes) == 1:
+    return indexes[0].search(query, k)
+  n = sum(len(index.docs) for index in indexes)
+  if n == 0:
+    return []
+  avg_length = sum(index.total_length for index in indexes) / n or 1.0
+  k1, b = indexes[0].k1, indexes[0].b
+  scores: dict = {}
+  for term in set(tokenize(query)):
+    postings = [(index, index.postings[term]) for index in indexes if term in index.postings]
+    df = sum(len(posting) for _, posting in postings)
+    if df == 0:
+      continue
+    idf = math.log(1 + (n - df + 0.5) / (df + 0.5))
+    for index, posting in postings:
+      for chunk_id, tf in posting.items():
+        denominator = tf + k1 * (1 - b + b * index.lengths[chunk_id] / avg_length)
+        scores[chunk_id] = scores.get(chunk_id, 0.0) + idf * tf * (k1 + 1) / denominator
+  return sorted(scores.items(), key=lambda item: item[1], reverse=True)[:k]
+
+def reciprocal_rank_fusion(rankings: list, k: int = 60) -> list:
+  '''
+  Fuses several rankings (lists of ids, best first) into one, scoring each id by sum(1 / (k + rank))
+  '''
+  scores: dict = {}
+  for ranking in rankings:
+    for rank, chunk_id in enumerate(ranking, 1):
+      scores[chunk_id] = scores.get(chunk_id, 0.0) + 1.0 / (k + rank)
+  return [chunk_id for chunk_id, _ in sorted(scores.items(), key=lambda item: item[1], reverse=True)]
@@ -0,0 +1,113 @@
+from collections import OrderedDict
+import threading
+import time
+import re
+import os
+
+def normalize_query(query: str) -> str:
+  return re.sub(r"\s+", " ", query).strip().strip("?!.").strip().lower()
+
+class RetrievalCache:
+  '''
+  Two tier cache of retrieved chunks.
+    - exact tier: keyed by the (doc_id, content hash) pairs of the searched documents plus the normalized query
+    - semantic tier: reuses the chunks of a cached query whose embedding is within the cosine threshold
+  Entries expire after ttl seconds and the least recently used ones are evicted beyond max_size.
+  Since the content hash is part of the key, a re-indexed document never serves old entries.
+  '''
+
+  def __init__(self, max_size: int = None, ttl: float = None, threshold: float = None):
+    # Explicit zeros are honoured: a threshold of 0 accepts any cached query of the document
+    self.max_size = max_size if max_size is not None else int(os.getenv("RAG_CACHE_SIZE", "256"))
+    self.ttl = ttl if ttl is not None else float(os.getenv("RAG_CACHE_TTL", "3600"))
+    self.threshold = threshold if threshold is not None else float(os.getenv("RAG_CACHE_SIMILARITY", "0.95"))
+    self.entries: OrderedDict = OrderedDict()
+    self.lock = threading.Lock()
+    self.hits_exact = 0
+    self.hits_semantic = 0
+    self.misses = 0
+
+  def _expired(self, entry: dict) -> bool:
+    return time.monotonic() - entry["created"] > self.ttl
+
+  def get(self, doc_key: tuple, query: str):
+    key = (doc_key, normalize_query(query))
+    with self.lock:
+      entry = self.entries.get(key)
+      if entry is None:
+        return None
+      if self._expired(entry):
+        del self.entries[key]
+        return None
+      self.entries.move_to_end(key)
+      self.hits_exact += 1
+      return entry["chunks"]
+
+  def get_similar(self, doc_key: tuple, vector: list):
+    '''
+    Returns the chunks of the most similar cached query of the same document, or None (counted as a miss)
+    '''
+    import numpy as np
+    if vector is None:
+      with self.lock:
+        self.misses += 1
+      return None
+    query_vector = np.asarray(vector, dtype=np.float32)
+    query_vector = query_vector / (np.linalg.norm(query_vector) or 1.0)
+    best_key, best_score = None, self.threshold
+    with self.lock:
+      for key, entry in list(self.entries.items()):
+        if key[0] != doc_key or entry["vector"] is None:
+          continue
+        if self._expired(entry):
+          del self.entries[key]
+          continue
+        score = float(np.dot(query_vector, entry["vector"]))
+        if score >= best_score:
+          best_key, best_score = key, score
+      if best_key is None:
+        self.misses += 1
+        return None
+      self.entries.move_to_end(best_key)
+      self.hits_semantic += 1
+      return self.entries[best_key]["chunks"]
+
+  def put(self, doc_key: tuple, query: str, vector: list, chunks: list) -> None:
+    import numpy as np
+    # Queries answered without an embedding (lexical fast path) only take part in the exact tier
+    if vector is not None:
+      vector = np.asarray(vector, dtype=np.float32)
+      vector = vector / (np.linalg.norm(vector) or 1.0)
+    key = (doc_key, normalize_query(query))
+    with self.lock:
+      self.entries[key] = {"chunks": chunks, "vector": vector, "created": time.monotonic()}
+      self.entries.move_to_end(key)
+      while len(self.entries) > self.max_size:
+        self.entries.popitem(last=False)
+
+  def invalidate(self, doc_id: str) -> None:
+    '''
+    Drops every entry that searched the given document
+    '''
+    with self.lock:
+      for key in [k for k in self.entries if any(d == doc_id for d, _ in k[0])]:
+        del self.entries[key]
+
+  def stats(self) -> dict:
+    lookups = self.hits_exact + self.hits_semantic + self.misses
+    return {
+      "hits_exact": self.hits_exact,
+      "hits_semantic": self.hits_semantic,
+      "misses": self.misses,
+      "hit_rate": (self.hits_exact + self.hits_semantic) / lookups if lookups else 0.0,
+      "size": len(self.entries)
+    }
+
+_retrieval_cache = None
+
+def get_retrieval_cache() -> RetrievalCache:
+  # Created on first use so the limits are read after the .env file is loaded
+  global _retrieval_cache
+  if _retrieval_cache is None:
+    _retrieval_cache = RetrievalCache()
+  return _retrieval_cache
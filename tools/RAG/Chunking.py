@@ -1,52 +1,100 @@
-from langchain_docling.loader import ExportType
-from langchain_docling import DoclingLoader
-from langchain_huggingface import HuggingFaceEmbeddings
-from langchain_chroma import Chroma
-from langchain_community.vectorstores.utils import filter_complex_metadata
 from datetime import datetime
-from utils.util import sanitize_collection_name, extract_filename, extract_extension
+from utils.util import extract_filename, extract_extension
+from tools.RAG.Registry import DEFAULT_EMBEDDING_MODEL, get_embeddings, is_warm
+from tools.RAG.Index import index_key, file_hash, load_manifest, save_manifest, build_manifest, plan_update, tag_chunks, ChunkPlanner
+from tools.RAG.Corpus import get_corpus_store
+from tools.RAG.Cache import get_retrieval_cache
+from tools.RAG.BM25 import load_bm25, update_bm25
+from tools.RAG.Parse import load_chunks
+from utils.tracing import span, traced_thread
 from rich.console import Console
+import threading
+import queue
 import os
 
 # Create console instance at class level
 console = Console()
 
+def _parser_label(parse_stats: dict) -> str:
+  if parse_stats.get("parser") != "docling":
+    return "native text parser"
+  return "Docling, cached conversion" if parse_stats.get("cached") else "Docling"
+
+_ingest_locks: dict = {}
+_ingest_locks_guard = threading.Lock()
+
+def ingest_lock(doc_id: str) -> threading.Lock:
+  '''
+  Returns the lock of a document, held while it is checked and indexed. Concurrent lookups of one document
+  wait for a single ingest and then find its manifest, lookups of other documents are not blocked.
+  '''
+  with _ingest_locks_guard:
+    lock = _ingest_locks.get(doc_id)
+    if lock is None:
+      lock = _ingest_locks[doc_id] = threading.Lock()
+    return lock
+
+class IngestCancelled(Exception):
+  """Raised when an ingest is cancelled before its manifest was written, the document is redone on its next use"""
+
 class ChunkDocument:
 
-  def __init__(self, filepath: str):
+  def __init__(self, filepath: str, stream: bool = None, cancel: threading.Event = None):
     try:
       self.filepath: str = filepath
       self.filename: str = extract_filename(filepath)
       self.extension: str = extract_extension(filepath)
-      self.collection_name: str = sanitize_collection_name(self.filename)
-      self.current_dir = os.path.dirname(os.path.abspath(__file__))
-      self.persistant_dir = os.path.join(self.current_dir,"db", self.filename)
+      self.doc_id: str = index_key(filepath)
+      self.model_name: str = DEFAULT_EMBEDDING_MODEL
       self.isExist: bool = None
+      if stream is None:
+        stream = os.getenv("RAG_STREAMING_INGEST", "true").lower() == "true"
+      # In streaming mode the document is parsed, embedded and stored batch by batch in storeEmbeddings
+      self.stream: bool = stream
+      # Set to stop a (background) ingest between batches
+      self.cancel: threading.Event = cancel
+      self.stored_chunks: int = 0
     except Exception as e:
       console.print(f"Error during initialization: {str(e)}", style="red")
       raise
 
   def parseDocument(self)->bool:
+    with span("rag.parse", document=self.filename) as stage:
+      return self._parseDocument(stage)
+
+  def _parseDocument(self, stage)->bool:
     try:
-      if not os.path.exists(self.persistant_dir):
+      if not os.path.exists(self.filepath):
+        console.print(f"Error: The document {self.filepath} does not exist!", style="red")
+        raise FileNotFoundError(f"The document {self.filepath} does not exist!")
+
+      self.file_hash: str = file_hash(self.filepath)
+      self.manifest = load_manifest(self.doc_id)
+      if self.manifest is None or self.manifest.get("file_hash") != self.file_hash:
         self.isExist = False
-        console.print("Initializing Vector DB...", style="blue")
-        if not os.path.exists(self.filepath):
-          console.print(f"Error: The document {self.filepath} does not exist!", style="red")
-          raise FileNotFoundError(f"The document {self.filepath} does not exist!")
+        if self.manifest is None:
+          console.print("Initializing Vector DB...", style="blue")
+        else:
+          console.print("Document changed, updating Vector DB...", style="blue")
+        if self.stream:
+          return self.isExist
 
         console.print("Loading the document...", style="blue")
         st = datetime.now()
-        loader = DoclingLoader(file_path=self.filepath, export_type=ExportType.DOC_CHUNKS)
-        self.docs = loader.load()
+        parse_stats: dict = {}
+        self.docs = list(load_chunks(self.filepath, parse_stats))
+        self.docs, self.ids, self.stale_ids, self.chunks = plan_update(self.manifest, self.docs, self.doc_id)
         et = datetime.now()
         run_time = et - st
         console.print("Document Loaded", style="blue")
-        console.print(f"Time Taken: {str(run_time)}", style="blue")
-        console.print(f"Number of Chunks: {str(len(self.docs))}", style="blue")
+        console.print(f"Time Taken: {str(run_time)} ({self.extension} via {_parser_label(parse_stats)})", style="blue")
+        stage.set("parser", parse_stats.get("parser"))
+        console.print(f"Number of Chunks: {str(len(self.chunks))} (new or changed: {len(self.ids)}, removed: {len(self.stale_ids)})", style="blue")
+        stage.set("chunks", len(self.ids))
       else:
         console.print("Vector DB already exists", style="green")
         self.isExist = True
+      stage.set("indexed", self.isExist)
       return self.isExist
     except FileNotFoundError as e:
       console.print(f"File Error: {str(e)}", style="red")
@@ -55,35 +103,197 @@ class ChunkDocument:
       console.print(f"Error during document parsing: {str(e)}", style="red")
       raise
 
-  def initializeEmbeddings(self, model_name: str = "sentence-transformers/all-MiniLM-L6-v2")->None:
+  def initializeEmbeddings(self, model_name: str = DEFAULT_EMBEDDING_MODEL)->None:
     try:
       if self.isExist == False:
         console.print("Initializing Embeddings", style="green")
+        warm = is_warm(model_name)
         st = datetime.now()
-        self.embeddings = HuggingFaceEmbeddings(model_name=model_name)
+        self.model_name = model_name
+        with span("rag.load_embeddings", warm=warm):
+          self.embeddings = get_embeddings(model_name)
         et = datetime.now()
         run_time = et - st
         console.print("Initialized Embeddings", style="green")
-        console.print(f"Time Taken: {str(run_time)}", style="green")
+        console.print(f"Time Taken: {str(run_time)} ({'warm' if warm else 'cold'})", style="green")
     except Exception as e:
       console.print(f"Error initializing embeddings: {str(e)}", style="red")
       raise
 
+  def cancelled(self)->bool:
+    return self.cancel is not None and self.cancel.is_set()
+
   def storeEmbeddings(self)->None:
+    if self.isExist != False:
+      return
+    with span("rag.ingest", document=self.filename, streaming=bool(self.stream)):
+      self._storeEmbeddings()
+
+  def _storeEmbeddings(self)->None:
     try:
-      if self.isExist == False:
+      if self.isExist == False and self.stream:
+        self.streamEmbeddings()
+      elif self.isExist == False:
+        if self.cancelled():
+          raise IngestCancelled(self.filepath)
         console.print("Creating Vector DB", style="yellow")
         st = datetime.now()
-        vector_store = Chroma(
-          collection_name=self.collection_name,
-          embedding_function=self.embeddings,
-          persist_directory=self.persistant_dir
-        )
-        vector_store.add_documents(filter_complex_metadata(self.docs))
+        store = get_corpus_store(self.model_name)
+        if self.docs:
+          from langchain_community.vectorstores.utils import filter_complex_metadata
+          # add_documents embeds and stores in one call
+          with span("rag.embed_store", chunks=len(self.docs)) as stage:
+            store.add_documents(tag_chunks(filter_complex_metadata(self.docs), self.filepath), self.ids)
+          reused = stage.attributes.get("cache_hits", 0)
+          if reused:
+            console.print(f"Embedding cache: reused {reused}/{len(self.docs)} chunks", style="yellow")
+        self.stored_chunks = len(self.ids)
+        store.delete(self.stale_ids)
+        update_bm25(self.doc_id, self.docs, self.ids, self.stale_ids)
+        # The manifest is written last so an interrupted update is redone on the next run
+        save_manifest(self.doc_id, build_manifest(self.filepath, self.file_hash, self.model_name, self.chunks))
+        get_retrieval_cache().invalidate(self.doc_id)
         et = datetime.now()
         run_time = et - st
         console.print("Finished Creating Vector DB", style="yellow")
         console.print(f"Time Taken: {str(run_time)}", style="yellow")
+    except IngestCancelled:
+      console.print(f"Cancelled indexing {self.filename}", style="yellow")
+      raise
     except Exception as e:
       console.print(f"Error storing embeddings: {str(e)}", style="red")
-      raise
\ No newline at end of file
+      raise
+
+  def streamEmbeddings(self, batch_size: int = None, queue_size: int = 2)->None:
+    '''
+    Parses, embeds and stores the document in bounded batches. The three stages run in their own
+    threads connected by bounded queues, so they overlap and at most a few batches are held in memory.
+    '''
+    batch_size = batch_size or int(os.getenv("RAG_STREAMING_BATCH_SIZE", "64"))
+    embed_queue: queue.Queue = queue.Queue(maxsize=queue_size)
+    store_queue: queue.Queue = queue.Queue(maxsize=queue_size)
+    stop = threading.Event()
+    errors: list = []
+    planner = ChunkPlanner(self.manifest, self.doc_id)
+    parse_stats: dict = {}
+    done = object()
+
+    def halted() -> bool:
+      return stop.is_set() or self.cancelled()
+
+    def put(q: queue.Queue, item) -> bool:
+      while not halted():
+        try:
+          q.put(item, timeout=0.1)
+          return True
+        except queue.Full:
+          continue
+      return False
+
+    def get(q: queue.Queue):
+      while not halted():
+        try:
+          return q.get(timeout=0.1)
+        except queue.Empty:
+          continue
+      return done
+
+    def parse():
+      try:
+        with span("rag.parse_stream") as stage:
+          from langchain_community.vectorstores.utils import filter_complex_metadata
+          docs, ids = [], []
+          for doc in load_chunks(self.filepath, parse_stats):
+            stage.add("chunks")
+            chunk_id = planner.add(doc)
+            if chunk_id is None:
+              continue
+            docs.append(doc)
+            ids.append(chunk_id)
+            if len(docs) >= batch_size:
+              if not put(embed_queue, (tag_chunks(filter_complex_metadata(docs), self.filepath), ids)):
+                return
+              docs, ids = [], []
+          if docs:
+            put(embed_queue, (tag_chunks(filter_complex_metadata(docs), self.filepath), ids))
+          stage.set("parser", parse_stats.get("parser"))
+          parse_stats["seconds"] = (datetime.now() - st).total_seconds()
+      except Exception as e:
+        errors.append(e)
+        stop.set()
+      finally:
+        put(embed_queue, done)
+
+    def embed():
+      try:
+        while True:
+          item = get(embed_queue)
+          if item is done:
+            break
+          docs, ids = item
+          with span("rag.embed", chunks=len(docs)) as stage:
+            vectors = self.embeddings.embed_documents([doc.page_content for doc in docs])
+          if not put(store_queue, (docs, ids, vectors, stage.attributes.get("cache_hits", 0))):
+            return
+      except Exception as e:
+        errors.append(e)
+        stop.set()
+      finally:
+        put(store_queue, done)
+
+    console.print("Streaming the document into the Vector DB...", style="yellow")
+    st = datetime.now()
+    store = get_corpus_store(self.model_name)
+    bm25 = load_bm25(self.doc_id, fresh=True)
+    # The stage threads run in a copy of the current context, their spans join the current trace
+    workers = [
+      traced_thread(parse, name="ingest-parse", daemon=True),
+      traced_thread(embed, name="ingest-embed", daemon=True)
+    ]
+    for worker in workers:
+      worker.start()
+
+    batches, stored, reused = 0, 0, 0
+    try:
+      while True:
+        item = get(store_queue)
+        if item is done:
+          break
+        docs, ids, vectors, hits = item
+        with span("rag.store", chunks=len(docs)):
+          store.upsert(docs, ids, vectors)
+        for doc, chunk_id in zip(docs, ids):
+          bm25.add(chunk_id, doc.page_content)
+        batches += 1
+        stored += len(docs)
+        reused += hits
+        self.stored_chunks = stored
+        console.print(f"Batch {batches}: stored {len(docs)} chunks, {hits} from the embedding cache ({stored} total, {str(datetime.now() - st)})", style="yellow")
+    except Exception as e:
+      errors.append(e)
+      stop.set()
+    for worker in workers:
+      worker.join()
+    if errors:
+      raise errors[0]
+    # The manifest is not written, so the batches stored so far are upserted again by the next ingest
+    if self.cancelled():
+      raise IngestCancelled(self.filepath)
+
+    self.chunks = planner.chunks
+    self.stale_ids = planner.stale_ids()
+    store.delete(self.stale_ids)
+    for chunk_id in self.stale_ids:
+      bm25.remove(chunk_id)
+    bm25.save(self.doc_id)
+    # The manifest is written last so an interrupted update is redone on the next run
+    save_manifest(self.doc_id, build_manifest(self.filepath, self.file_hash, self.model_name, self.chunks))
+    get_retrieval_cache().invalidate(self.doc_id)
+    et = datetime.now()
+    run_time = et - st
+    console.print("Finished Creating Vector DB", style="yellow")
+    console.print(f"Time Taken: {str(run_time)}", style="yellow")
+    console.print(f"Number of Chunks: {str(len(self.chunks))} (new or changed: {stored}, removed: {len(self.stale_ids)})", style="yellow")
+    console.print(f"Parsing: {parse_stats.get('seconds', 0.0):.2f}s ({self.extension} via {_parser_label(parse_stats)})", style="yellow")
+    if stored:
+      console.print(f"Embedding cache: reused {reused}/{stored} chunks ({reused / stored:.0%}), embedded {stored - reused}", style="yellow")
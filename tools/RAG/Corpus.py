@@ -0,0 +1,74 @@
+from tools.RAG.Registry import DEFAULT_EMBEDDING_MODEL, get_vector_store
+from tools.RAG.Index import CORPUS_DIR, CORPUS_COLLECTION, vector_backend
+
+class ChromaCorpusStore:
+  '''
+  The corpus of all indexed documents in a single Chroma collection.
+  Every chunk carries a doc_id metadata field, searches can be restricted to a set of documents.
+  '''
+
+  def __init__(self, model_name: str = DEFAULT_EMBEDDING_MODEL, directory: str = None):
+    self.model_name = model_name
+    self.vector_store = get_vector_store(CORPUS_COLLECTION, directory or CORPUS_DIR, model_name)
+
+  def add_documents(self, docs: list, ids: list) -> None:
+    self.vector_store.add_documents(docs, ids=ids)
+
+  def upsert(self, docs: list, ids: list, vectors: list) -> None:
+    '''
+    Same write as add_documents, but with vectors that were already computed
+    '''
+    self.vector_store._collection.upsert(
+      ids=ids,
+      embeddings=vectors,
+      documents=[doc.page_content for doc in docs],
+      metadatas=[doc.metadata or None for doc in docs]
+    )
+
+  def delete(self, ids: list) -> None:
+    if ids:
+      self.vector_store.delete(ids=ids)
+
+  def search(self, query: str = None, vector: list = None, k: int = 5, doc_ids: list = None) -> list:
+    '''
+    Dense top-k search, by query text or by an already computed query vector
+    Arguments:
+      doc_ids: list | None - restrict the search to these documents, None searches the whole corpus
+    Output:
+      results : list - langchain Documents (with id and metadata), best first
+    '''
+    where = None
+    if doc_ids is not None:
+      where = {"doc_id": doc_ids[0]} if len(doc_ids) == 1 else {"doc_id": {"$in": doc_ids}}
+    if vector is not None:
+      return self.vector_store.similarity_search_by_vector(vector, k=k, filter=where)
+    return self.vector_store.similarity_search(query, k=k, filter=where)
+
+  def get(self, ids: list) -> dict:
+    '''
+    Returns {chunk id: (text, metadata)} of the given chunks
+    '''
+    stored = self.vector_store.get(ids=ids, include=["documents", "metadatas"])
+    return {chunk_id: (text, metadata or {}) for chunk_id, text, metadata in zip(stored["ids"], stored["documents"], stored["metadatas"])}
+
+  def chunks_of(self, doc_id: str) -> dict:
+    '''
+    Returns {chunk id: text} of every chunk of a document
+    '''
+    stored = self.vector_store.get(where={"doc_id": doc_id}, include=["documents"])
+    return dict(zip(stored["ids"], stored["documents"]))
+
+def get_corpus_store(model_name: str = DEFAULT_EMBEDDING_MODEL, backend: str = None, directory: str = None):
+  '''
+  Returns the corpus store of the configured backend (RAG_VECTOR_BACKEND), both have the same methods
+  Arguments:
+    backend: str | None - "chroma" or "mmap", None uses the configured backend
+    directory: str | None - a store outside the corpus directory, e.g. a scratch store of the benchmarks
+  '''
+  backend = backend or vector_backend()
+  if backend == "mmap":
+    # Imported on first use, like the Chroma client
+    from tools.RAG.MmapStore import get_mmap_store
+    return get_mmap_store(model_name, directory)
+  # The Chroma handle itself is shared through the registry LRU
+  return ChromaCorpusStore(model_name, directory)
@@ -0,0 +1,170 @@
+from langchain_core.embeddings import Embeddings
+from tools.RAG.Index import DB_DIR
+from utils.util import sanitize_collection_name
+import threading
+import json
+import os
+
+# Embedding backends: "torch" (sentence-transformers, the default), "onnx" (ONNX Runtime) and
+# "onnx-int8" (ONNX Runtime with dynamically int8 quantized weights)
+EMBEDDING_BACKENDS = ("torch", "onnx", "onnx-int8")
+# Quantized models are written here, the downloaded model directory may be read-only
+MODEL_DIR: str = os.path.join(DB_DIR, "models")
+# Files of a sentence-transformers repository needed to run it with ONNX Runtime
+ONNX_FILES = ["tokenizer.json", "config.json", "modules.json", "sentence_bert_config.json", "1_Pooling/config.json", "onnx/model.onnx"]
+
+def embedding_backend() -> str:
+  '''
+  Returns the configured embedding backend (RAG_EMBEDDING_BACKEND), read on every call so the .env file is honoured
+  '''
+  backend = (os.getenv("RAG_EMBEDDING_BACKEND") or "torch").strip().lower()
+  if backend not in EMBEDDING_BACKENDS:
+    raise ValueError(f"Unknown RAG_EMBEDDING_BACKEND '{backend}', expected one of {', '.join(EMBEDDING_BACKENDS)}")
+  return backend
+
+def cache_key(model_name: str, backend: str = None) -> str:
+  '''
+  Name of the model in the embedding cache, the vectors of the ONNX backends are cached separately
+  '''
+  backend = backend or embedding_backend()
+  return model_name if backend == "torch" else f"{model_name}@{backend}"
+
+def _settings(batch_size: int = None, threads: int = None) -> tuple:
+  batch_size = batch_size or int(os.getenv("RAG_EMBEDDING_BATCH_SIZE", "32"))
+  # 0 leaves the thread count to the library, usually one per physical core
+  threads = threads if threads is not None else int(os.getenv("RAG_EMBEDDING_THREADS", "0"))
+  return batch_size, threads
+
+class OnnxEmbeddings(Embeddings):
+  '''
+  Runs a sentence-transformers model with ONNX Runtime on the CPU, without PyTorch. Texts are
+  tokenized once, sorted by length and batched, so each batch is only padded to its longest text.
+  Pooling and normalization follow the model's sentence-transformers configuration.
+  '''
+
+  def __init__(self, model_name: str, model_path: str = None, quantized: bool = False, batch_size: int = None, threads: int = None, max_length: int = None):
+    '''
+    Arguments:
+      model_name: str - the HuggingFace model, downloaded unless model_path is given
+      model_path: str - a local copy of the model repository with onnx/model.onnx (RAG_EMBEDDING_MODEL_PATH)
+      quantized: bool - run int8 weights, quantized from onnx/model.onnx on first use
+      batch_size: int - texts per inference call (RAG_EMBEDDING_BATCH_SIZE)
+      threads: int - intra-op threads, 0 for the ONNX Runtime default (RAG_EMBEDDING_THREADS)
+      max_length: int - tokens per text, longer texts are truncated (defaults to the model's max_seq_length)
+    '''
+    import onnxruntime as ort
+    from tokenizers import Tokenizer
+    self.model_name = model_name
+    self.batch_size, threads = _settings(batch_size, threads)
+    directory = model_path or os.getenv("RAG_EMBEDDING_MODEL_PATH") or self._download(model_name)
+    config = self._read_json(directory, "sentence_bert_config.json")
+    self.max_length = max_length or config.get("max_seq_length", 256)
+    pooling = self._read_json(directory, "1_Pooling/config.json")
+    self.pooling = "cls" if pooling.get("pooling_mode_cls_token") else "mean"
+    modules = self._read_json(directory, "modules.json")
+    self.normalize = any(str(m.get("type", "")).endswith("Normalize") for m in modules) if isinstance(modules, list) else True
+
+    self.tokenizer = Tokenizer.from_file(os.path.join(directory, "tokenizer.json"))
+    self.tokenizer.enable_truncation(max_length=self.max_length)
+    self.tokenizer.no_padding()
+    model_file = os.getenv("RAG_ONNX_FILE") or os.path.join("onnx", "model.onnx")
+    model_file = os.path.join(directory, model_file)
+    if quantized:
+      model_file = self._quantize(model_file, model_name)
+
+    options = ort.SessionOptions()
+    options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+    if threads:
+      options.intra_op_num_threads = threads
+      options.inter_op_num_threads = 1
+    self.session = ort.InferenceSession(model_file, options, providers=["CPUExecutionProvider"])
+    self.input_names = {i.name for i in self.session.get_inputs()}
+    # One inference at a time, the session already uses all its intra-op threads
+    self.lock = threading.Lock()
+
+  @staticmethod
+  def _read_json(directory: str, name: str):
+    path = os.path.join(directory, name)
+    if not os.path.exists(path):
+      return {}
+    with open(path, "r", encoding="utf-8") as f:
+      return json.load(f)
+
+  @staticmethod
+  def _download(model_name: str) -> str:
+    from huggingface_hub import snapshot_download
+    return snapshot_download(model_name, allow_patterns=ONNX_FILES)
+
+  @staticmethod
+  def _quantize(model_file: str, model_name: str) -> str:
+    path = os.path.join(MODEL_DIR, sanitize_collection_name(model_name), "model_int8.onnx")
+    if not os.path.exists(path):
+      from onnxruntime.quantization import quantize_dynamic, QuantType
+      os.makedirs(os.path.dirname(path), exist_ok=True)
+      tmp = f"{path}.{os.getpid()}.tmp"
+      quantize_dynamic(model_file, tmp, weight_type=QuantType.QInt8)
+      os.replace(tmp, path)
+    return path
+
+  def _run(self, encodings: list):
+    import numpy as np
+    length = max(len(e.ids) for e in encodings)
+    ids = np.zeros((len(encodings), length), dtype=np.int64)
+    mask = np.zeros((len(encodings), length), dtype=np.int64)
+    for row, encoding in enumerate(encodings):
+      ids[row, :len(encoding.ids)] = encoding.ids
+      mask[row, :len(encoding.ids)] = 1
+    inputs = {"input_ids": ids, "attention_mask": mask}
+    if "token_type_ids" in self.input_names:
+      inputs["token_type_ids"] = np.zeros_like(ids)
+    with self.lock:
+      output = self.session.run(None, inputs)[0]
+    if output.ndim == 3:
+      if self.pooling == "cls":
+        output = output[:, 0]
+      else:
+        weights = mask[:, :, None].astype(output.dtype)
+        output = (output * weights).sum(axis=1) / np.maximum(weights.sum(axis=1), 1e-9)
+    if self.normalize:
+      output = output / np.maximum(np.linalg.norm(output, axis=1, keepdims=True), 1e-12)
+    return output
+
+  def embed_documents(self, texts: list) -> list:
+    if not texts:
+      return []
+    encodings = self.tokenizer.encode_batch(list(texts))
+    # Texts of similar length are batched together, so little of each batch is padding
+    order = sorted(range(len(texts)), key=lambda i: len(encodings[i].ids))
+    vectors = [None] * len(texts)
+    for start in range(0, len(order), self.batch_size):
+      batch = order[start:start + self.batch_size]
+      for i, vector in zip(batch, self._run([encodings[i] for i in batch])):
+        vectors[i] = vector.tolist()
+    return vectors
+
+  def embed_query(self, text: str) -> list:
+    return self.embed_documents([text])[0]
+
+def load_embeddings(model_name: str, backend: str = None, model_path: str = None, batch_size: int = None, threads: int = None):
+  '''
+  Loads an embedding model with the configured backend
+  Arguments:
+    model_name: str - the HuggingFace model name
+    backend: str - "torch", "onnx" or "onnx-int8", None uses RAG_EMBEDDING_BACKEND
+    model_path: str - a local copy of the model (RAG_EMBEDDING_MODEL_PATH), otherwise it is downloaded
+    batch_size: int - texts per model call (RAG_EMBEDDING_BATCH_SIZE)
+    threads: int - CPU threads of the model, 0 for the library default (RAG_EMBEDDING_THREADS)
+  Output:
+    embeddings : Embeddings - the embedding model
+  '''
+  backend = backend or embedding_backend()
+  model_path = model_path or os.getenv("RAG_EMBEDDING_MODEL_PATH")
+  if backend in ("onnx", "onnx-int8"):
+    return OnnxEmbeddings(model_name, model_path=model_path, quantized=backend == "onnx-int8", batch_size=batch_size, threads=threads)
+  batch_size, threads = _settings(batch_size, threads)
+  if threads:
+    import torch
+    torch.set_num_threads(threads)
+  from langchain_huggingface import HuggingFaceEmbeddings
+  # sentence-transformers sorts the texts of a call by length before batching them
+  return HuggingFaceEmbeddings(model_name=model_path or model_name, encode_kwargs={"batch_size": batch_size})
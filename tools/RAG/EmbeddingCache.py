@@ -0,0 +1,149 @@
+from langchain_core.embeddings import Embeddings
+from tools.RAG.Index import DB_DIR
+from utils.tracing import current_span
+import numpy as np
+import threading
+import hashlib
+import sqlite3
+import time
+import os
+
+# Rows of the last_used update and of the lookups, below SQLite's limit of bound parameters
+LOOKUP_BATCH: int = 500
+
+def text_hash(text: str) -> str:
+  return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+class EmbeddingCache:
+  '''
+  Persistent cache of chunk embeddings keyed by (embedding model, sha256 of the chunk text), shared by
+  all documents and all versions of a document. Vectors are stored as float16. Least recently used
+  vectors are evicted beyond `max_bytes`, 0 keeps none.
+  '''
+
+  def __init__(self, path: str = None, max_bytes: int = None):
+    self.path = path or os.getenv("RAG_EMBED_CACHE_PATH") or os.path.join(DB_DIR, "embedding_cache.db")
+    self.max_bytes = max_bytes if max_bytes is not None else int(float(os.getenv("RAG_EMBED_CACHE_MB", "512")) * 1024 * 1024)
+    os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+    self.lock = threading.Lock()
+    self.hits = 0
+    self.misses = 0
+    self.conn = sqlite3.connect(self.path, check_same_thread=False)
+    with self.lock, self.conn:
+      self.conn.execute("PRAGMA journal_mode=WAL")
+      self.conn.execute(
+        "CREATE TABLE IF NOT EXISTS embeddings ("
+        "model TEXT NOT NULL, hash TEXT NOT NULL, vector BLOB NOT NULL, last_used REAL NOT NULL, "
+        "PRIMARY KEY (model, hash))"
+      )
+      self.conn.execute("CREATE INDEX IF NOT EXISTS embeddings_last_used ON embeddings (last_used)")
+      self.size = self.conn.execute("SELECT COALESCE(SUM(LENGTH(vector)), 0) FROM embeddings").fetchone()[0]
+
+  def get_many(self, model_name: str, hashes: list) -> dict:
+    '''
+    Returns {hash: float32 vector} of the cached chunks among `hashes`
+    '''
+    found: dict = {}
+    now = time.time()
+    with self.lock, self.conn:
+      for i in range(0, len(hashes), LOOKUP_BATCH):
+        batch = hashes[i:i + LOOKUP_BATCH]
+        marks = ",".join("?" * len(batch))
+        for key, blob in self.conn.execute(f"SELECT hash, vector FROM embeddings WHERE model = ? AND hash IN ({marks})", (model_name, *batch)):
+          found[key] = np.frombuffer(blob, dtype=np.float16).astype(np.float32)
+        self.conn.execute(f"UPDATE embeddings SET last_used = ? WHERE model = ? AND hash IN ({marks})", (now, model_name, *batch))
+    return found
+
+  def record(self, hits: int, misses: int) -> None:
+    '''
+    Counts the chunks that skipped the model (hits) and the ones it embedded (misses)
+    '''
+    with self.lock:
+      self.hits += hits
+      self.misses += misses
+
+  def put_many(self, model_name: str, items: dict) -> None:
+    '''
+    Stores {hash: vector} and evicts the least recently used vectors beyond the size bound
+    '''
+    if not self.max_bytes:
+      return
+    now = time.time()
+    rows = [(model_name, key, np.asarray(vector, dtype=np.float16).tobytes(), now) for key, vector in items.items()]
+    with self.lock, self.conn:
+      for i in range(0, len(rows), LOOKUP_BATCH):
+        batch = rows[i:i + LOOKUP_BATCH]
+        marks = ",".join("?" * len(batch))
+        replaced = self.conn.execute(f"SELECT COALESCE(SUM(LENGTH(vector)), 0) FROM embeddings WHERE model = ? AND hash IN ({marks})",
+                                     (model_name, *[row[1] for row in batch])).fetchone()[0]
+        self.conn.executemany("INSERT OR REPLACE INTO embeddings (model, hash, vector, last_used) VALUES (?, ?, ?, ?)", batch)
+        self.size += sum(len(row[2]) for row in batch) - replaced
+      self._evict()
+
+  def _evict(self) -> None:
+    if self.size <= self.max_bytes:
+      return
+    # Evict down to 90% of the bound, so the next writes do not evict again right away
+    target = self.max_bytes * 0.9
+    to_delete = []
+    for model, key, size in self.conn.execute("SELECT model, hash, LENGTH(vector) FROM embeddings ORDER BY last_used"):
+      if self.size <= target:
+        break
+      to_delete.append((model, key))
+      self.size -= size
+    self.conn.executemany("DELETE FROM embeddings WHERE model = ? AND hash = ?", to_delete)
+
+  def stats(self) -> dict:
+    lookups = self.hits + self.misses
+    return {
+      "hits": self.hits,
+      "misses": self.misses,
+      "hit_rate": self.hits / lookups if lookups else 0.0,
+      "size_mb": self.size / (1024 * 1024)
+    }
+
+class CachedEmbeddings(Embeddings):
+  '''
+  Embedding model that looks every chunk up in the embedding cache first, only the chunks never seen
+  before are embedded by the model. Query embeddings are not cached. The vectors of fresh chunks are
+  returned at the precision they are cached with, so a re-ingest stores exactly the same vectors.
+  '''
+
+  def __init__(self, embeddings, model_name: str, cache: EmbeddingCache = None):
+    self.embeddings = embeddings
+    self.model_name = model_name
+    self.cache = cache or get_embedding_cache()
+
+  def embed_documents(self, texts: list) -> list:
+    hashes = [text_hash(text) for text in texts]
+    found = self.cache.get_many(self.model_name, hashes)
+    # Duplicate chunks within the batch are embedded once
+    missing = {}
+    for key, text in zip(hashes, texts):
+      if key not in found and key not in missing:
+        missing[key] = text
+    if missing:
+      vectors = self.embeddings.embed_documents(list(missing.values()))
+      fresh = dict(zip(missing.keys(), vectors))
+      self.cache.put_many(self.model_name, fresh)
+      for key, vector in fresh.items():
+        found[key] = np.asarray(vector, dtype=np.float16).astype(np.float32)
+    self.cache.record(len(texts) - len(missing), len(missing))
+    stage = current_span()
+    stage.add("cache_hits", len(texts) - len(missing))
+    stage.add("cache_misses", len(missing))
+    return [found[key].tolist() for key in hashes]
+
+  def embed_query(self, text: str) -> list:
+    return self.embeddings.embed_query(text)
+
+_embedding_cache = None
+_embedding_cache_lock = threading.Lock()
+
+def get_embedding_cache() -> EmbeddingCache:
+  # Created on first use so the size bound is read after the .env file is loaded
+  global _embedding_cache
+  with _embedding_cache_lock:
+    if _embedding_cache is None:
+      _embedding_cache = EmbeddingCache()
+    return _embedding_cache
@@ -0,0 +1,186 @@
+from utils.util import sanitize_collection_name, extract_filename, extract_extension
+import hashlib
+import json
+import glob
+import os
+
+# Read at import, so it has to be set in the environment (used by the benchmarks to index into a scratch directory)
+DB_DIR: str = os.getenv("RAG_DB_DIR") or os.path.join(os.path.dirname(os.path.abspath(__file__)), "db")
+# All documents live in one Chroma collection, each document's chunks tagged with its doc_id
+CORPUS_DIR: str = os.path.join(DB_DIR, "corpus")
+CORPUS_COLLECTION: str = "aida_corpus"
+MANIFEST_DIR: str = os.path.join(CORPUS_DIR, "manifests")
+LEGACY_MANIFEST_NAME: str = "manifest.json"
+
+# Vector store backends: "chroma" (default) or "mmap" (memory-mapped quantized arrays, see MmapStore)
+VECTOR_BACKENDS = ("chroma", "mmap")
+
+SUPPORTED_EXTENSIONS = (".pdf", ".docx", ".pptx", ".txt", ".md")
+
+# absolute path -> (mtime, size, content hash), so unchanged files are not hashed again
+_file_hashes: dict = {}
+
+def file_hash(filepath: str) -> str:
+  '''
+  Returns the sha256 of the file content, memoized on the file's mtime and size
+  '''
+  path = os.path.abspath(filepath)
+  stat = os.stat(path)
+  cached = _file_hashes.get(path)
+  if cached and cached[0] == stat.st_mtime_ns and cached[1] == stat.st_size:
+    return cached[2]
+  digest = hashlib.sha256()
+  with open(path, "rb") as f:
+    for block in iter(lambda: f.read(1 << 20), b""):
+      digest.update(block)
+  _file_hashes[path] = (stat.st_mtime_ns, stat.st_size, digest.hexdigest())
+  return digest.hexdigest()
+
+def chunk_hash(text: str) -> str:
+  return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+def index_key(filepath: str) -> str:
+  '''
+  Returns the document id of a file in the corpus, unique per absolute file path
+  '''
+  path = os.path.normcase(os.path.abspath(filepath)).replace("\\", "/")
+  path_hash = hashlib.sha1(path.encode("utf-8")).hexdigest()[:12]
+  return f"{sanitize_collection_name(extract_filename(filepath))}_{path_hash}"
+
+def vector_backend() -> str:
+  '''
+  Returns the configured vector store backend, read on every call so the .env file is honoured
+  '''
+  backend = (os.getenv("RAG_VECTOR_BACKEND") or "chroma").strip().lower()
+  if backend not in VECTOR_BACKENDS:
+    raise ValueError(f"Unknown RAG_VECTOR_BACKEND '{backend}', expected one of {', '.join(VECTOR_BACKENDS)}")
+  return backend
+
+def manifest_dir() -> str:
+  # Each backend keeps its own manifests, so switching backends indexes the documents into the new store
+  backend = vector_backend()
+  return MANIFEST_DIR if backend == "chroma" else os.path.join(CORPUS_DIR, backend, "manifests")
+
+def manifest_path(doc_id: str) -> str:
+  return os.path.join(manifest_dir(), f"{doc_id}.json")
+
+def load_manifest(doc_id: str):
+  '''
+  Loads the manifest of an indexed document
+  Output:
+    manifest : dict | None - {"doc_id", "filepath", "file_hash", "chunks": {chunk id: chunk hash}} or None if not indexed
+  '''
+  path = manifest_path(doc_id)
+  if not os.path.exists(path):
+    return None
+  try:
+    with open(path, "r", encoding="utf-8") as f:
+      return json.load(f)
+  except (OSError, ValueError):
+    return None
+
+def save_manifest(doc_id: str, manifest: dict) -> None:
+  os.makedirs(manifest_dir(), exist_ok=True)
+  path = manifest_path(doc_id)
+  tmp_path = path + ".tmp"
+  with open(tmp_path, "w", encoding="utf-8") as f:
+    json.dump(manifest, f)
+  os.replace(tmp_path, path)
+
+def delete_manifest(doc_id: str) -> None:
+  if os.path.exists(manifest_path(doc_id)):
+    os.remove(manifest_path(doc_id))
+
+def list_manifests() -> list:
+  '''
+  Returns the manifests of every indexed document
+  '''
+  manifests = []
+  for path in sorted(glob.glob(os.path.join(manifest_dir(), "*.json"))):
+    manifest = load_manifest(os.path.splitext(os.path.basename(path))[0])
+    if manifest is not None:
+      manifests.append(manifest)
+  return manifests
+
+def build_manifest(filepath: str, content_hash: str, model_name: str, chunks: dict) -> dict:
+  return {
+    "doc_id": index_key(filepath),
+    "filepath": os.path.abspath(filepath),
+    "file_hash": content_hash,
+    "model_name": model_name,
+    "chunks": chunks
+  }
+
+def is_indexed(filepath: str) -> bool:
+  '''
+  Checks if the document has an index built from its current content
+  '''
+  manifest = load_manifest(index_key(filepath))
+  return manifest is not None and manifest.get("file_hash") == file_hash(filepath)
+
+class ChunkPlanner:
+  '''
+  Diffs chunks against the manifest of the previous index one chunk at a time, so it also works on a stream
+  '''
+  def __init__(self, manifest, doc_id: str):
+    self.doc_id = doc_id
+    self.old_chunks: dict = manifest.get("chunks", {}) if manifest else {}
+    self.chunks: dict = {}
+    self.seen: dict = {}
+
+  def add(self, doc):
+    '''
+    Records a chunk and returns its id if it has to be embedded, or None if it is already indexed
+    '''
+    h = chunk_hash(doc.page_content)
+    # identical chunks inside one document get distinct ids
+    n = self.seen.get(h, 0)
+    self.seen[h] = n + 1
+    # chunk ids are unique across the corpus
+    chunk_id = f"{self.doc_id}:{h}_{n}"
+    self.chunks[chunk_id] = h
+    return None if chunk_id in self.old_chunks else chunk_id
+
+  def stale_ids(self) -> list:
+    return [chunk_id for chunk_id in self.old_chunks if chunk_id not in self.chunks]
+
+def plan_update(manifest, docs: list, doc_id: str):
+  '''
+  Diffs freshly parsed chunks against the manifest of the previous index
+  Arguments:
+    manifest: dict | None - the manifest of the existing index
+    docs: list - the parsed chunks (langchain Documents)
+    doc_id: str - the document id in the corpus
+  Output:
+    (new_docs, new_ids, stale_ids, chunks) - chunks to embed with their ids, ids to delete and the new chunk map
+  '''
+  planner = ChunkPlanner(manifest, doc_id)
+  new_docs, new_ids = [], []
+  for doc in docs:
+    chunk_id = planner.add(doc)
+    if chunk_id is not None:
+      new_docs.append(doc)
+      new_ids.append(chunk_id)
+  return new_docs, new_ids, planner.stale_ids(), planner.chunks
+
+def tag_chunks(docs: list, filepath: str) -> list:
+  '''
+  Adds the corpus metadata used for filtering (doc_id and source path) to parsed chunks
+  '''
+  doc_id = index_key(filepath)
+  source = os.path.abspath(filepath)
+  for doc in docs:
+    doc.metadata = {**(doc.metadata or {}), "doc_id": doc_id, "source": source}
+  return docs
+
+def collect_files(target: str) -> list:
+  '''
+  Expands a document path, a directory (recursively) or a glob pattern into the supported documents
+  '''
+  if os.path.isdir(target):
+    paths = glob.glob(os.path.join(target, "**", "*"), recursive=True)
+  elif os.path.isfile(target):
+    paths = [target]
+  else:
+    paths = glob.glob(target, recursive=True)
+  return sorted(p for p in paths if os.path.isfile(p) and extract_extension(p).lower() in SUPPORTED_EXTENSIONS)
@@ -0,0 +1,235 @@
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from langchain_community.vectorstores.utils import filter_complex_metadata
+from langchain_core.documents import Document
+from datetime import datetime
+from tools.RAG.Registry import DEFAULT_EMBEDDING_MODEL, get_embeddings
+from tools.RAG.Index import DB_DIR, CORPUS_DIR, LEGACY_MANIFEST_NAME, ChunkPlanner, index_key, file_hash, load_manifest, save_manifest, build_manifest, plan_update, is_indexed, tag_chunks, collect_files
+from tools.RAG.Corpus import get_corpus_store
+from tools.RAG.BM25 import update_bm25
+from tools.RAG.Cache import get_retrieval_cache
+from tools.RAG.Parse import load_chunks, get_converter, parser_name
+from utils.util import extract_extension
+from utils.tracing import span
+from rich.console import Console
+import multiprocessing
+import json
+import time
+import os
+
+console = Console()
+
+def _init_worker(load_docling: bool) -> None:
+  # One converter per worker process, so the Docling models are loaded once and not per file.
+  # A corpus of only Markdown and text files never loads them.
+  if load_docling:
+    get_converter()
+
+def _parse_file(filepath: str):
+  st = time.perf_counter()
+  parse_stats: dict = {}
+  docs = filter_complex_metadata(list(load_chunks(filepath, parse_stats)))
+  parse_stats["seconds"] = time.perf_counter() - st
+  return docs, parse_stats
+
+def ingest(target: str, workers: int = None, batch_size: int = 256, model_name: str = DEFAULT_EMBEDDING_MODEL) -> dict:
+  '''
+  Parses every document under target in a process pool and indexes the chunks with one batched embedding stage
+  Arguments:
+    target: str - a document, a directory or a glob pattern
+    workers: int - number of parsing processes (defaults to the CPU count)
+    batch_size: int - number of chunks embedded per model call
+    model_name: str - the embedding model
+  Output:
+    stats : dict - counts of indexed, skipped and failed documents and chunks
+  '''
+  files = collect_files(target)
+  pending = [f for f in files if not is_indexed(f)]
+  stats = {"documents": 0, "chunks": 0, "skipped": len(files) - len(pending), "failed": 0, "reused_chunks": 0, "formats": {}}
+  console.print(f"Found {len(files)} documents, {stats['skipped']} already indexed", style="blue")
+  if not pending:
+    return stats
+
+  workers = workers or os.cpu_count() or 1
+  embeddings = get_embeddings(model_name)
+  store = get_corpus_store(model_name)
+  batch: list = []
+  st = datetime.now()
+
+  def flush():
+    if not batch:
+      return
+    docs = [doc for item in batch for doc in item["docs"]]
+    vectors = []
+    if docs:
+      with span("rag.embed", chunks=len(docs)) as stage:
+        vectors = embeddings.embed_documents([doc.page_content for doc in docs])
+      stats["reused_chunks"] += stage.attributes.get("cache_hits", 0)
+    offset = 0
+    for item in batch:
+      n = len(item["docs"])
+      if n:
+        store.upsert(tag_chunks(item["docs"], item["filepath"]), item["ids"], vectors[offset:offset + n])
+      store.delete(item["stale_ids"])
+      update_bm25(item["doc_id"], item["docs"], item["ids"], item["stale_ids"])
+      save_manifest(item["doc_id"], build_manifest(item["filepath"], item["file_hash"], model_name, item["chunks"]))
+      get_retrieval_cache().invalidate(item["doc_id"])
+      offset += n
+      stats["documents"] += 1
+      stats["chunks"] += n
+    batch.clear()
+    run_time = (datetime.now() - st).total_seconds() or 1e-9
+    console.print(f"Indexed {stats['documents']}/{len(pending)} documents "
+                  f"({stats['documents'] / run_time:.2f} docs/sec, {stats['chunks'] / run_time:.2f} chunks/sec, "
+                  f"embedding cache hit rate {stats['reused_chunks'] / (stats['chunks'] or 1):.0%})", style="yellow")
+
+  # Spawned workers do not inherit the embedding model or the open corpus of this process
+  load_docling = any(parser_name(f) == "docling" for f in pending)
+  with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"), initializer=_init_worker, initargs=(load_docling,)) as pool:
+    queue = list(reversed(pending))
+    running: dict = {}
+    while queue or running:
+      # Keep a bounded number of parsed documents in flight so memory does not grow with the corpus
+      while queue and len(running) < workers * 2:
+        filepath = queue.pop()
+        running[pool.submit(_parse_file, filepath)] = filepath
+      done, _ = wait(running, return_when=FIRST_COMPLETED)
+      for future in done:
+        filepath = running.pop(future)
+        try:
+          parsed, parse_stats = future.result()
+          doc_id = index_key(filepath)
+          docs, ids, stale_ids, chunks = plan_update(load_manifest(doc_id), parsed, doc_id)
+        except Exception as e:
+          console.print(f"Error parsing {filepath}: {str(e)}", style="red")
+          stats["failed"] += 1
+          continue
+        fmt = stats["formats"].setdefault(extract_extension(filepath).lower().lstrip("."), {"documents": 0, "chunks": 0, "parse_seconds": 0.0, "cached_conversions": 0})
+        fmt["documents"] += 1
+        fmt["chunks"] += len(parsed)
+        fmt["parse_seconds"] += parse_stats["seconds"]
+        fmt["cached_conversions"] += 1 if parse_stats.get("cached") else 0
+        batch.append({
+          "filepath": filepath,
+          "file_hash": file_hash(filepath),
+          "doc_id": doc_id,
+          "docs": docs,
+          "ids": ids,
+          "stale_ids": stale_ids,
+          "chunks": chunks
+        })
+        if sum(len(item["docs"]) for item in batch) >= batch_size:
+          flush()
+    flush()
+
+  et = datetime.now()
+  run_time = et - st
+  seconds = run_time.total_seconds() or 1e-9
+  console.print("Finished Ingesting Documents", style="yellow")
+  console.print(f"Time Taken: {str(run_time)}", style="yellow")
+  console.print(f"Documents: {stats['documents']} ({stats['documents'] / seconds:.2f} docs/sec), "
+                f"Chunks: {stats['chunks']} ({stats['chunks'] / seconds:.2f} chunks/sec), "
+                f"Skipped: {stats['skipped']}, Failed: {stats['failed']}, "
+                f"Reused from the embedding cache: {stats['reused_chunks']}", style="yellow")
+  for name, fmt in sorted(stats["formats"].items()):
+    # Summed over the parsing processes, so it can exceed the wall time
+    console.print(f"  .{name}: {fmt['documents']} documents, {fmt['chunks']} chunks, parsing {fmt['parse_seconds']:.2f}s "
+                  f"({fmt['parse_seconds'] / fmt['documents']:.3f}s per document, {fmt['cached_conversions']} cached conversions)", style="yellow")
+  return stats
+
+def migrate_legacy_indexes(batch_size: int = 512, model_name: str = DEFAULT_EMBEDDING_MODEL) -> dict:
+  '''
+  Moves the per-document Chroma indexes of older versions into the corpus, reusing their stored
+  embeddings, so nothing is parsed or embedded again. The old directories are left in place.
+  Arguments:
+    batch_size: int - number of chunks copied per read
+    model_name: str - the embedding model the old indexes were built with
+  Output:
+    stats : dict - counts of migrated documents and chunks
+  '''
+  import chromadb
+
+  store = get_corpus_store(model_name)
+  stats = {"documents": 0, "chunks": 0}
+  legacy_dirs = []
+  st = datetime.now()
+  for name in sorted(os.listdir(DB_DIR)) if os.path.isdir(DB_DIR) else []:
+    path = os.path.join(DB_DIR, name)
+    if not os.path.isdir(path) or os.path.abspath(path) == os.path.abspath(CORPUS_DIR):
+      continue
+    # Only Chroma directories, not the conversion cache or the quantized models
+    if not os.path.exists(os.path.join(path, "chroma.sqlite3")):
+      continue
+    legacy_manifest = None
+    manifest_file = os.path.join(path, LEGACY_MANIFEST_NAME)
+    if os.path.exists(manifest_file):
+      with open(manifest_file, "r", encoding="utf-8") as f:
+        legacy_manifest = json.load(f)
+    try:
+      client = chromadb.PersistentClient(path=path)
+      collections = client.list_collections()
+      if not collections:
+        continue
+      collection = client.get_collection(getattr(collections[0], "name", collections[0]))
+      if legacy_manifest:
+        source = legacy_manifest["filepath"]
+      else:
+        # Baseline indexes have no manifest, the document is the "source" DoclingLoader stored with every chunk
+        first = collection.get(limit=1, include=["metadatas"])
+        source = next((m.get("source") for m in first["metadatas"] if m and m.get("source")), None)
+        if source is None:
+          console.print(f"Skipping {path}: its chunks do not record their source document", style="red")
+          continue
+        source = os.path.abspath(source)
+      doc_id = index_key(source)
+      if load_manifest(doc_id) is not None:
+        continue
+      # Baseline chunk ids are random, they are given the corpus ids of their text, so the first query
+      # re-plans the document (file_hash None) and keeps every chunk whose text did not change
+      planner = None if legacy_manifest else ChunkPlanner(None, doc_id)
+      chunks: dict = {}
+      bm25_docs, bm25_ids = [], []
+      offset = 0
+      while True:
+        stored = collection.get(limit=batch_size, offset=offset, include=["embeddings", "documents", "metadatas"])
+        if not stored["ids"]:
+          break
+        docs = [Document(page_content=text, metadata=metadata or {}) for text, metadata in zip(stored["documents"], stored["metadatas"])]
+        for doc in docs:
+          doc.metadata = {**doc.metadata, "doc_id": doc_id, "source": source}
+        if planner is None:
+          ids = [f"{doc_id}:{chunk_id}" for chunk_id in stored["ids"]]
+          for chunk_id in ids:
+            # Chunk ids of the manifest layout are "<chunk hash>_<n>", the manifest maps each id to its hash
+            chunks[chunk_id] = chunk_id.split(":", 1)[1].rsplit("_", 1)[0]
+        else:
+          # Nothing is indexed under the new doc_id yet, so the planner returns the id of every chunk
+          ids = [planner.add(doc) for doc in docs]
+          chunks = planner.chunks
+        store.upsert(docs, ids, [[float(x) for x in vector] for vector in stored["embeddings"]])
+        bm25_docs.extend(docs)
+        bm25_ids.extend(ids)
+        offset += len(stored["ids"])
+      update_bm25(doc_id, bm25_docs, bm25_ids, [])
+      save_manifest(doc_id, {
+        "doc_id": doc_id,
+        "filepath": source,
+        "file_hash": legacy_manifest.get("file_hash") if legacy_manifest else None,
+        "model_name": legacy_manifest.get("model_name", model_name) if legacy_manifest else model_name,
+        "chunks": chunks
+      })
+    except Exception as e:
+      console.print(f"Error migrating {path}: {str(e)}", style="red")
+      continue
+    legacy_dirs.append(path)
+    stats["documents"] += 1
+    stats["chunks"] += len(chunks)
+    console.print(f"Migrated {name} ({len(chunks)} chunks)", style="yellow")
+
+  console.print("Finished Migrating Indexes", style="yellow")
+  console.print(f"Time Taken: {str(datetime.now() - st)}", style="yellow")
+  console.print(f"Documents: {stats['documents']}, Chunks: {stats['chunks']}", style="yellow")
+  if legacy_dirs:
+    console.print("The old index directories are no longer used and can be deleted:", style="blue")
+    for path in legacy_dirs:
+      console.print(f"  {path}", style="blue")
+  return stats
@@ -0,0 +1,357 @@
+from langchain_core.documents import Document
+from numpy.lib.format import open_memmap
+from tools.RAG.Registry import DEFAULT_EMBEDDING_MODEL, get_embeddings
+from tools.RAG.Index import CORPUS_DIR
+import numpy as np
+import threading
+import sqlite3
+import json
+import os
+
+MMAP_DIR: str = os.path.join(CORPUS_DIR, "mmap")
+MMAP_DTYPES = ("int8", "float16")
+
+# Rows scored per block, so a search never converts more than this many quantized rows to float32 at once
+SCAN_BLOCK: int = 32768
+
+def normalize(matrix):
+  norms = np.linalg.norm(matrix, axis=-1, keepdims=True)
+  return matrix / np.where(norms == 0, 1.0, norms)
+
+class MmapCorpusStore:
+  '''
+  The corpus in memory-mapped NumPy arrays, a lighter alternative to Chroma for corpora up to ~100k chunks.
+    - vectors.npy: the normalized embeddings quantized to float16 or int8 (with a per-row scale in scales.npy), scanned on every search
+    - exact.npy: the float32 embeddings, only the rows of the top candidates are read to re-score them
+    - chunks.db: SQLite table mapping chunk ids to rows, with their doc_id, text and metadata
+  Corpora below ivf_min_rows are searched by brute force. Above it the rows are clustered with k-means
+  (IVF) and only the nprobe clusters closest to the query are scanned. Only one process should write
+  at a time, other processes reload the arrays on their next search after a write.
+  '''
+
+  def __init__(self, model_name: str = DEFAULT_EMBEDDING_MODEL, directory: str = None, dtype: str = None,
+               ivf_min_rows: int = None, nprobe: int = None, rerank: int = None):
+    self.model_name = model_name
+    self.directory = directory or MMAP_DIR
+    self.dtype = (dtype or os.getenv("RAG_MMAP_DTYPE", "int8")).lower()
+    if self.dtype not in MMAP_DTYPES:
+      raise ValueError(f"Unknown RAG_MMAP_DTYPE '{self.dtype}', expected one of {', '.join(MMAP_DTYPES)}")
+    self.ivf_min_rows = ivf_min_rows if ivf_min_rows is not None else int(os.getenv("RAG_MMAP_IVF_MIN_ROWS", "20000"))
+    # 0 scans every cluster, as a brute force search
+    self.nprobe = nprobe if nprobe is not None else int(os.getenv("RAG_MMAP_NPROBE", "8"))
+    # Number of quantized candidates per requested result that are re-scored with the float32 vectors, 0 keeps the quantized scores
+    self.rerank = rerank if rerank is not None else int(os.getenv("RAG_MMAP_RERANK", "4"))
+    os.makedirs(self.directory, exist_ok=True)
+    self.lock = threading.RLock()
+    self.conn = sqlite3.connect(os.path.join(self.directory, "chunks.db"), check_same_thread=False)
+    with self.lock, self.conn:
+      self.conn.execute("PRAGMA journal_mode=WAL")
+      self.conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL)")
+      self.conn.execute(
+        "CREATE TABLE IF NOT EXISTS chunks ("
+        "id TEXT PRIMARY KEY, row INTEGER NOT NULL UNIQUE, doc_id TEXT, text TEXT NOT NULL, metadata TEXT NOT NULL)"
+      )
+      self.conn.execute("CREATE INDEX IF NOT EXISTS chunks_doc_id ON chunks (doc_id)")
+      self._load()
+
+  def _path(self, name: str) -> str:
+    return os.path.join(self.directory, name)
+
+  def _stored_version(self) -> int:
+    row = self.conn.execute("SELECT value FROM meta WHERE key = 'version'").fetchone()
+    return int(row[0]) if row else 0
+
+  def _load(self) -> None:
+    '''
+    (Re)opens the arrays and rebuilds the in-memory row maps from chunks.db
+    '''
+    meta = dict(self.conn.execute("SELECT key, value FROM meta"))
+    self.version = int(meta.get("version", 0))
+    self.dim = int(meta["dim"]) if "dim" in meta else None
+    # The arrays on disk decide the precision, the configured dtype only applies to a new store
+    self.dtype = meta.get("dtype", self.dtype)
+    self.ivf_rows = int(meta.get("ivf_rows", 0))
+    self.vectors = self.exact = self.scales = self.lists = self.centroids = None
+    self.capacity = 0
+    if self.dim is not None:
+      self.vectors = np.load(self._path("vectors.npy"), mmap_mode="r+")
+      self.exact = np.load(self._path("exact.npy"), mmap_mode="r+")
+      self.lists = np.load(self._path("lists.npy"), mmap_mode="r+")
+      if self.dtype == "int8":
+        self.scales = np.load(self._path("scales.npy"), mmap_mode="r+")
+      if self.ivf_rows and os.path.exists(self._path("centroids.npy")):
+        self.centroids = np.load(self._path("centroids.npy"))
+      self.capacity = self.vectors.shape[0]
+
+    self.id_rows: dict = {}
+    self.row_ids: dict = {}
+    self.doc_codes: dict = {}
+    stored = self.conn.execute("SELECT row, id, doc_id FROM chunks").fetchall()
+    self.count = max((row for row, _, _ in stored), default=-1) + 1
+    self.live = np.zeros(self.capacity, dtype=bool)
+    self.docs = np.full(self.capacity, -1, dtype=np.int32)
+    for row, chunk_id, doc_id in stored:
+      self._track(row, chunk_id, doc_id)
+
+  def _track(self, row: int, chunk_id: str, doc_id: str) -> None:
+    self.id_rows[chunk_id] = row
+    self.row_ids[row] = chunk_id
+    self.live[row] = True
+    self.docs[row] = self.doc_codes.setdefault(doc_id, len(self.doc_codes))
+
+  def _refresh(self) -> None:
+    # Another process wrote to the store since it was loaded
+    if self._stored_version() != self.version:
+      self._load()
+
+  def _create(self, dim: int) -> None:
+    self.dim = dim
+    # The files exist before the size is recorded, a store with a size always has its arrays
+    self._grow(1024)
+    with self.conn:
+      self.conn.executemany("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", [("dim", str(dim)), ("dtype", self.dtype)])
+
+  def _grow(self, capacity: int) -> None:
+    '''
+    Resizes the row arrays to the given capacity, copying the used rows into new files
+    '''
+    arrays = {
+      "vectors.npy": (self.vectors, np.int8 if self.dtype == "int8" else np.float16, (capacity, self.dim)),
+      "exact.npy": (self.exact, np.float32, (capacity, self.dim)),
+      "lists.npy": (self.lists, np.int32, (capacity,))
+    }
+    if self.dtype == "int8":
+      arrays["scales.npy"] = (self.scales, np.float32, (capacity,))
+    for name, (old, dtype, shape) in arrays.items():
+      grown = open_memmap(self._path(name + ".tmp"), mode="w+", dtype=dtype, shape=shape)
+      if name == "lists.npy":
+        grown[:] = -1
+      if old is not None:
+        used = min(self.count, len(old))
+        grown[:used] = old[:used]
+      grown.flush()
+      del grown
+    # The old maps have to be closed before their files are replaced (required on Windows)
+    self.vectors = self.exact = self.scales = self.lists = None
+    for name in arrays:
+      os.replace(self._path(name + ".tmp"), self._path(name))
+    self.vectors = np.load(self._path("vectors.npy"), mmap_mode="r+")
+    self.exact = np.load(self._path("exact.npy"), mmap_mode="r+")
+    self.lists = np.load(self._path("lists.npy"), mmap_mode="r+")
+    if self.dtype == "int8":
+      self.scales = np.load(self._path("scales.npy"), mmap_mode="r+")
+    self.live = np.concatenate([self.live, np.zeros(capacity - self.capacity, dtype=bool)])
+    self.docs = np.concatenate([self.docs, np.full(capacity - self.capacity, -1, dtype=np.int32)])
+    self.capacity = capacity
+
+  def _commit(self) -> None:
+    self.version += 1
+    self.conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('version', ?)", (str(self.version),))
+
+  def add_documents(self, docs: list, ids: list) -> None:
+    vectors = get_embeddings(self.model_name).embed_documents([doc.page_content for doc in docs])
+    self.upsert(docs, ids, vectors)
+
+  def upsert(self, docs: list, ids: list, vectors: list) -> None:
+    '''
+    Same write as add_documents, but with vectors that were already computed
+    '''
+    if not ids:
+      return
+    matrix = normalize(np.asarray(vectors, dtype=np.float32))
+    with self.lock:
+      self._refresh()
+      if self.dim is None:
+        self._create(matrix.shape[1])
+      if matrix.shape[1] != self.dim:
+        raise ValueError(f"Embedding size {matrix.shape[1]} does not match the store ({self.dim})")
+
+      # Existing ids are overwritten in place, new ones reuse the rows of deleted chunks first
+      free = iter(np.flatnonzero(~self.live[:self.count]).tolist())
+      assigned: dict = {}
+      for chunk_id in ids:
+        if chunk_id in assigned:
+          continue
+        row = self.id_rows.get(chunk_id)
+        if row is None:
+          row = next(free, None)
+        if row is None:
+          row = self.count
+          self.count += 1
+        assigned[chunk_id] = row
+      rows = np.asarray([assigned[chunk_id] for chunk_id in ids])
+      if self.count > self.capacity:
+        self._grow(max(self.count, self.capacity * 2))
+
+      self.exact[rows] = matrix
+      if self.dtype == "int8":
+        # Symmetric per-row quantization, the scale maps the largest component to 127
+        scales = np.abs(matrix).max(axis=1) / 127.0
+        scales[scales == 0] = 1.0
+        self.vectors[rows] = np.round(matrix / scales[:, None]).astype(np.int8)
+        self.scales[rows] = scales
+      else:
+        self.vectors[rows] = matrix.astype(np.float16)
+      if self.centroids is not None:
+        self.lists[rows] = np.argmax(matrix @ self.centroids.T, axis=1)
+      self._flush()
+
+      with self.conn:
+        self.conn.executemany(
+          "INSERT OR REPLACE INTO chunks (id, row, doc_id, text, metadata) VALUES (?, ?, ?, ?, ?)",
+          [(chunk_id, int(row), (doc.metadata or {}).get("doc_id"), doc.page_content, json.dumps(doc.metadata or {}))
+           for doc, chunk_id, row in zip(docs, ids, rows)]
+        )
+        self._commit()
+      for doc, chunk_id, row in zip(docs, ids, rows):
+        self._track(int(row), chunk_id, (doc.metadata or {}).get("doc_id"))
+
+      live = int(self.live.sum())
+      # Clusters are trained once the corpus is large enough and retrained when it has doubled since
+      if live >= max(self.ivf_min_rows, 1) and live > 2 * self.ivf_rows:
+        self._train_ivf()
+
+  def _flush(self) -> None:
+    for array in (self.vectors, self.exact, self.scales, self.lists):
+      if array is not None:
+        array.flush()
+
+  def delete(self, ids: list) -> None:
+    if not ids:
+      return
+    with self.lock:
+      self._refresh()
+      rows = [self.id_rows.pop(chunk_id) for chunk_id in ids if chunk_id in self.id_rows]
+      if not rows:
+        return
+      with self.conn:
+        self.conn.executemany("DELETE FROM chunks WHERE id = ?", [(chunk_id,) for chunk_id in ids])
+        self._commit()
+      for row in rows:
+        # The row stays in the arrays and is reused by the next upsert
+        self.row_ids.pop(row, None)
+        self.live[row] = False
+        self.docs[row] = -1
+
+  def _train_ivf(self, iterations: int = 10) -> None:
+    '''
+    k-means over a sample of the exact vectors (sqrt(n) clusters), then assigns every row to its closest centroid
+    '''
+    rows = np.flatnonzero(self.live[:self.count])
+    nlist = max(1, int(np.sqrt(rows.size)))
+    rng = np.random.default_rng(0)
+    sample = np.sort(rng.choice(rows, size=min(rows.size, nlist * 64), replace=False))
+    data = np.asarray(self.exact[sample], dtype=np.float32)
+    centroids = data[rng.choice(len(data), size=nlist, replace=False)].copy()
+    for _ in range(iterations):
+      assignment = np.argmax(data @ centroids.T, axis=1)
+      sums = np.zeros_like(centroids)
+      np.add.at(sums, assignment, data)
+      counts = np.bincount(assignment, minlength=nlist)
+      # Empty clusters keep their previous centroid
+      centroids[counts > 0] = normalize(sums[counts > 0])
+
+    for start in range(0, self.count, SCAN_BLOCK):
+      block = np.asarray(self.exact[start:start + SCAN_BLOCK], dtype=np.float32)
+      self.lists[start:start + SCAN_BLOCK] = np.argmax(block @ centroids.T, axis=1)
+    self.lists.flush()
+    np.save(self._path("centroids.tmp.npy"), centroids)
+    os.replace(self._path("centroids.tmp.npy"), self._path("centroids.npy"))
+    self.centroids = centroids
+    self.ivf_rows = int(rows.size)
+    with self.conn:
+      self.conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('ivf_rows', ?)", (str(self.ivf_rows),))
+      self._commit()
+
+  def _approximate(self, rows, query):
+    '''
+    Scores the given rows against the query with the quantized vectors, block by block
+    '''
+    scores = np.empty(rows.size, dtype=np.float32)
+    for start in range(0, rows.size, SCAN_BLOCK):
+      block = rows[start:start + SCAN_BLOCK]
+      # Contiguous rows are read as a slice, which is a sequential read of the mapped file
+      if block[-1] - block[0] + 1 == block.size:
+        index = slice(int(block[0]), int(block[-1]) + 1)
+      else:
+        index = block
+      block_scores = np.asarray(self.vectors[index], dtype=np.float32) @ query
+      if self.scales is not None:
+        block_scores *= self.scales[index]
+      scores[start:start + block.size] = block_scores
+    return scores
+
+  def search(self, query: str = None, vector: list = None, k: int = 5, doc_ids: list = None) -> list:
+    '''
+    Top-k cosine search, by query text or by an already computed query vector
+    Arguments:
+      doc_ids: list | None - restrict the search to these documents, None searches the whole corpus
+    Output:
+      results : list - langchain Documents (with id and metadata), best first
+    '''
+    if vector is None:
+      vector = get_embeddings(self.model_name).embed_query(query)
+    query_vector = normalize(np.asarray(vector, dtype=np.float32))
+    with self.lock:
+      self._refresh()
+      if self.dim is None or k <= 0:
+        return []
+      mask = self.live[:self.count].copy()
+      if doc_ids is not None:
+        codes = [self.doc_codes[doc_id] for doc_id in doc_ids if doc_id in self.doc_codes]
+        mask &= np.isin(self.docs[:self.count], codes)
+      if self.centroids is not None and self.nprobe:
+        probe = np.argsort(self.centroids @ query_vector)[::-1][:self.nprobe]
+        probed = mask & np.isin(self.lists[:self.count], probe)
+        # A narrow document filter can leave too few rows in the probed clusters
+        if probed.sum() >= k:
+          mask = probed
+      rows = np.flatnonzero(mask)
+      if not rows.size:
+        return []
+
+      scores = self._approximate(rows, query_vector)
+      if self.rerank:
+        n = min(rows.size, k * self.rerank)
+        candidates = np.sort(rows[np.argpartition(-scores, n - 1)[:n]])
+        exact = np.asarray(self.exact[candidates], dtype=np.float32) @ query_vector
+        best = candidates[np.argsort(-exact)[:k]]
+      else:
+        best = rows[np.argsort(-scores)[:k]]
+      ids = [self.row_ids[int(row)] for row in best]
+      stored = self.get(ids)
+    return [Document(id=chunk_id, page_content=stored[chunk_id][0], metadata=stored[chunk_id][1]) for chunk_id in ids if chunk_id in stored]
+
+  def get(self, ids: list) -> dict:
+    '''
+    Returns {chunk id: (text, metadata)} of the given chunks
+    '''
+    found = {}
+    with self.lock:
+      # Batched to stay below the SQLite limit of bound parameters
+      for start in range(0, len(ids), 500):
+        batch = ids[start:start + 500]
+        query = f"SELECT id, text, metadata FROM chunks WHERE id IN ({', '.join('?' * len(batch))})"
+        for chunk_id, text, metadata in self.conn.execute(query, batch):
+          found[chunk_id] = (text, json.loads(metadata))
+    return found
+
+  def chunks_of(self, doc_id: str) -> dict:
+    '''
+    Returns {chunk id: text} of every chunk of a document
+    '''
+    with self.lock:
+      return dict(self.conn.execute("SELECT id, text FROM chunks WHERE doc_id = ? ORDER BY row", (doc_id,)))
+
+_stores: dict = {}
+_stores_lock = threading.Lock()
+
+def get_mmap_store(model_name: str = DEFAULT_EMBEDDING_MODEL, directory: str = None) -> MmapCorpusStore:
+  '''
+  Returns the process wide store of a directory, so the row maps are built once and the arrays mapped once
+  '''
+  key = (os.path.abspath(directory or MMAP_DIR), model_name)
+  with _stores_lock:
+    if key not in _stores:
+      _stores[key] = MmapCorpusStore(model_name, directory)
+    return _stores[key]
@@ -0,0 +1,187 @@
+from langchain_core.documents import Document
+from tools.RAG.Index import DB_DIR, file_hash
+from utils.util import extract_extension
+import threading
+import hashlib
+import gzip
+import json
+import re
+import os
+
+# Converted Docling documents, keyed by file content hash and converter options
+CONVERSION_DIR: str = os.path.join(DB_DIR, "conversions")
+# Formats chunked natively, without loading Docling and its models
+TEXT_EXTENSIONS = (".md", ".txt")
+# Part of the conversion cache key, bump it when the converter is configured differently
+CONVERTER_OPTIONS: dict = {"converter": "default", "chunker": "hybrid"}
+
+HEADING_RE = re.compile(r"^(#{1,6})\s+(.*?)\s*#*\s*$")
+FENCE_RE = re.compile(r"^\s*(```|~~~)")
+SENTENCE_RE = re.compile(r"(?<=[.!?])\s+")
+
+_converter = None
+_converter_lock = threading.Lock()
+
+def get_converter():
+  '''
+  Returns the process wide Docling converter, so its layout models are loaded once per process
+  '''
+  global _converter
+  with _converter_lock:
+    if _converter is None:
+      from docling.document_converter import DocumentConverter
+      _converter = DocumentConverter()
+    return _converter
+
+def parser_name(filepath: str) -> str:
+  '''
+  Returns "text" for the formats chunked natively (RAG_NATIVE_TEXT_PARSER) and "docling" for the others
+  '''
+  native = os.getenv("RAG_NATIVE_TEXT_PARSER", "true").lower() == "true"
+  return "text" if native and extract_extension(filepath).lower() in TEXT_EXTENSIONS else "docling"
+
+def _split_long(text: str, max_chars: int) -> list:
+  # A paragraph above the chunk size is split between sentences, a sentence above it between words
+  parts, current = [], ""
+  for sentence in SENTENCE_RE.split(text):
+    while len(sentence) > max_chars:
+      cut = sentence.rfind(" ", 0, max_chars)
+      cut = cut if cut > 0 else max_chars
+      if current:
+        parts.append(current)
+        current = ""
+      parts.append(sentence[:cut])
+      sentence = sentence[cut:].lstrip()
+    if current and len(current) + len(sentence) + 1 > max_chars:
+      parts.append(current)
+      current = sentence
+    else:
+      current = f"{current} {sentence}" if current else sentence
+  if current:
+    parts.append(current)
+  return parts
+
+def _blocks(lines: list, markdown: bool):
+  '''
+  Yields (headings, paragraph) pairs, paragraphs are separated by blank lines and code blocks kept whole
+  '''
+  headings: list = []
+  paragraph: list = []
+  fenced = False
+  for line in lines:
+    if markdown and FENCE_RE.match(line):
+      fenced = not fenced
+      paragraph.append(line)
+      continue
+    heading = HEADING_RE.match(line) if markdown and not fenced else None
+    if heading or (not fenced and not line.strip()):
+      if paragraph:
+        yield list(headings), "\n".join(paragraph).strip()
+        paragraph = []
+      if heading:
+        level = len(heading.group(1))
+        headings = headings[:level - 1] + [heading.group(2)]
+      continue
+    paragraph.append(line)
+  if paragraph:
+    yield list(headings), "\n".join(paragraph).strip()
+
+def text_chunks(filepath: str, max_chars: int = None):
+  '''
+  Chunks a Markdown or plain-text file without Docling: paragraphs of a section are merged up to
+  `max_chars`, every chunk starts with the headings it is under, like Docling's contextualized chunks
+  Arguments:
+    filepath: str - the .md or .txt file
+    max_chars: int - chunk size (RAG_NATIVE_CHUNK_CHARS)
+  Output:
+    chunks : iterator of langchain Documents with "source" and "headings" metadata
+  '''
+  max_chars = max_chars or int(os.getenv("RAG_NATIVE_CHUNK_CHARS", "1500"))
+  markdown = extract_extension(filepath).lower() == ".md"
+  with open(filepath, "r", encoding="utf-8", errors="replace") as f:
+    lines = f.read().splitlines()
+
+  def chunk(headings: list, texts: list) -> Document:
+    context = "\n".join(headings)
+    body = "\n\n".join(texts)
+    return Document(page_content=f"{context}\n{body}" if context else body, metadata={"source": filepath, "headings": " > ".join(headings)})
+
+  section, texts, size = None, [], 0
+  for headings, paragraph in _blocks(lines, markdown):
+    if headings != section or (texts and size + len(paragraph) + 2 > max_chars):
+      if texts:
+        yield chunk(section, texts)
+      section, texts, size = headings, [], 0
+    for part in ([paragraph] if len(paragraph) <= max_chars else _split_long(paragraph, max_chars)):
+      if texts and size + len(part) + 2 > max_chars:
+        yield chunk(section, texts)
+        texts, size = [], 0
+      texts.append(part)
+      size += len(part) + 2
+  if texts:
+    yield chunk(section, texts)
+
+def conversion_key(filepath: str) -> str:
+  '''
+  Cache key of a converted document: its content hash, the Docling version and the converter options
+  '''
+  try:
+    from importlib.metadata import version
+    docling_version = version("docling")
+  except Exception:
+    docling_version = None
+  options = json.dumps({**CONVERTER_OPTIONS, "docling": docling_version}, sort_keys=True)
+  return f"{file_hash(filepath)}_{hashlib.sha1(options.encode('utf-8')).hexdigest()[:12]}"
+
+def convert(filepath: str):
+  '''
+  Returns the Docling document of a file, from the conversion cache (RAG_CONVERSION_CACHE) or by converting it
+  Output:
+    (document, cached) : (DoclingDocument, bool)
+  '''
+  from docling_core.types.doc import DoclingDocument
+  use_cache = os.getenv("RAG_CONVERSION_CACHE", "true").lower() == "true"
+  path = os.path.join(CONVERSION_DIR, f"{conversion_key(filepath)}.json.gz")
+  if use_cache and os.path.exists(path):
+    try:
+      with gzip.open(path, "rt", encoding="utf-8") as f:
+        return DoclingDocument.model_validate_json(f.read()), True
+    except Exception:
+      # A damaged entry is converted again and overwritten
+      pass
+  document = get_converter().convert(filepath).document
+  if use_cache:
+    os.makedirs(CONVERSION_DIR, exist_ok=True)
+    # Written under a temporary name first, so a concurrent reader never sees half a file
+    tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with gzip.open(tmp, "wt", encoding="utf-8") as f:
+      f.write(document.model_dump_json())
+    os.replace(tmp, path)
+  return document, False
+
+def docling_chunks(filepath: str, stats: dict = None):
+  '''
+  Chunks a document with Docling's hybrid chunker, reusing its cached conversion. The chunks are the
+  same as those of DoclingLoader(export_type=ExportType.DOC_CHUNKS).
+  '''
+  from docling.chunking import HybridChunker
+  document, cached = convert(filepath)
+  if stats is not None:
+    stats["cached"] = cached
+  chunker = HybridChunker()
+  for chunk in chunker.chunk(document):
+    yield Document(page_content=chunker.contextualize(chunk=chunk), metadata={"source": filepath, "dl_meta": chunk.meta.export_json_dict()})
+
+def load_chunks(filepath: str, stats: dict = None):
+  '''
+  Parses and chunks a document with the parser of its format
+  Arguments:
+    filepath: str - the document
+    stats: dict | None - receives "parser" ("text" or "docling") and, for Docling, "cached"
+  Output:
+    chunks : iterator of langchain Documents
+  '''
+  parser = parser_name(filepath)
+  if stats is not None:
+    stats["parser"] = parser
+  return text_chunks(filepath) if parser == "text" else docling_chunks(filepath, stats)
@@ -0,0 +1,179 @@
+from concurrent.futures import ThreadPoolExecutor
+from collections import OrderedDict
+from tools.RAG.Chunking import ChunkDocument, IngestCancelled, ingest_lock
+from tools.RAG.Index import index_key, is_indexed
+from utils.util import extract_filename
+from utils.tracing import span
+from rich.console import Console
+import threading
+import time
+import os
+
+console = Console()
+
+# Finished jobs kept for /jobs
+MAX_FINISHED_JOBS: int = 20
+
+class IngestJob:
+  '''
+  A document indexed in the background, ahead of the DocumentRetrieval call that will need it
+  '''
+  def __init__(self, filepath: str, doc_id: str):
+    self.filepath = filepath
+    self.filename = extract_filename(filepath)
+    self.doc_id = doc_id
+    self.status = "queued"
+    self.error = None
+    self.chunking = None
+    self.cancel = threading.Event()
+    self.done = threading.Event()
+    # Guards the queued -> running and queued -> skipped transitions
+    self.lock = threading.Lock()
+    self.created_at = time.time()
+    self.finished_at = None
+
+  @property
+  def stored_chunks(self) -> int:
+    return self.chunking.stored_chunks if self.chunking is not None else 0
+
+  def skip(self) -> bool:
+    '''
+    Takes the job off the queue if no worker has started it yet
+    Output:
+      skipped : bool - True if the job will not run, the caller indexes the document itself
+    '''
+    with self.lock:
+      if self.status != "queued":
+        return False
+      self.status = "skipped"
+    self.finished_at = time.time()
+    self.done.set()
+    return True
+
+  def run(self) -> None:
+    with self.lock:
+      if self.status != "queued":
+        return
+      self.status = "running"
+    try:
+      if self.cancel.is_set():
+        self.status = "cancelled"
+        return
+      if is_indexed(self.filepath):
+        self.status = "indexed"
+        return
+      console.print(f"Indexing {self.filename} in the background...", style="blue")
+      with span("rag.prefetch", document=self.filename), ingest_lock(self.doc_id):
+        self.chunking = ChunkDocument(self.filepath, cancel=self.cancel)
+        if not self.chunking.parseDocument():
+          self.chunking.initializeEmbeddings()
+          self.chunking.storeEmbeddings()
+      self.status = "done"
+      console.print(f"Background indexing of {self.filename} finished ({self.stored_chunks} chunks stored)", style="blue")
+    except IngestCancelled:
+      self.status = "cancelled"
+    except Exception as e:
+      self.status = "failed"
+      self.error = str(e)
+    finally:
+      self.finished_at = time.time()
+      self.done.set()
+
+class Prefetcher:
+  '''
+  Starts indexing a document as soon as it is mentioned, so parsing and embedding overlap with the
+  first LLM call of the turn. There is at most one job per document, the DocumentRetrieval tool waits
+  for it instead of indexing the document a second time.
+  '''
+  def __init__(self, workers: int = None):
+    # 0 starts no background jobs, documents are indexed by the DocumentRetrieval tool
+    self.workers = workers if workers is not None else int(os.getenv("RAG_PREFETCH_WORKERS", "1"))
+    self.pool = None
+    self.jobs: OrderedDict = OrderedDict()
+    self.lock = threading.Lock()
+
+  def submit(self, filepath: str) -> IngestJob:
+    '''
+    Queues the document for background indexing, unless it is already queued or running
+    Arguments:
+      filepath: str - the document
+    Output:
+      job : IngestJob | None - the job of the document, None if the file does not exist or there are no workers
+    '''
+    filepath = filepath.strip()
+    if not self.workers or not os.path.isfile(filepath):
+      return None
+    doc_id = index_key(filepath)
+    with self.lock:
+      job = self.jobs.get(doc_id)
+      if job is not None and not job.done.is_set():
+        return job
+      job = IngestJob(filepath, doc_id)
+      self.jobs[doc_id] = job
+      self.jobs.move_to_end(doc_id)
+      finished = [key for key, j in self.jobs.items() if j.done.is_set()]
+      for key in finished[:max(0, len(finished) - MAX_FINISHED_JOBS)]:
+        del self.jobs[key]
+      if self.pool is None:
+        self.pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="rag-prefetch")
+      self.pool.submit(job.run)
+    return job
+
+  def active(self, filepath: str) -> IngestJob:
+    with self.lock:
+      job = self.jobs.get(index_key(filepath))
+    return job if job is not None and not job.done.is_set() else None
+
+  def wait(self, filepath: str, timeout: float = None) -> IngestJob:
+    '''
+    Waits for the background job of the document, if a worker has started it. A job still queued
+    behind other documents is skipped instead, the caller indexes the document under its ingest lock.
+    Output:
+      job : IngestJob | None - the finished job, None if none was in flight or it was skipped
+    '''
+    job = self.active(filepath)
+    if job is None or job.skip():
+      return None
+    console.print(f"Waiting for the background indexing of {job.filename} ({job.stored_chunks} chunks stored so far)...", style="blue")
+    with span("rag.prefetch_wait", document=job.filename):
+      job.done.wait(timeout)
+    return job
+
+  def cancel(self, filepath: str = None) -> int:
+    '''
+    Cancels the unfinished job of a document, or all of them. Running jobs stop after their current batch.
+    Output:
+      cancelled : int - number of jobs cancelled
+    '''
+    with self.lock:
+      jobs = [j for j in self.jobs.values() if not j.done.is_set()]
+    if filepath is not None:
+      jobs = [j for j in jobs if j.doc_id == index_key(filepath)]
+    for job in jobs:
+      job.cancel.set()
+    return len(jobs)
+
+  def list_jobs(self) -> list:
+    with self.lock:
+      return list(self.jobs.values())
+
+_prefetcher = None
+_prefetcher_lock = threading.Lock()
+
+def get_prefetcher() -> Prefetcher:
+  '''
+  Returns the process wide prefetcher, so the chat, the server sessions and the tool share its jobs
+  '''
+  global _prefetcher
+  with _prefetcher_lock:
+    if _prefetcher is None:
+      _prefetcher = Prefetcher()
+    return _prefetcher
+
+def prefetch(filepath: str) -> IngestJob:
+  '''
+  Starts indexing a detected document in the background, if prefetching is enabled (RAG_PREFETCH)
+  '''
+  if os.getenv("RAG_PREFETCH", "true").lower() != "true":
+    return None
+  return get_prefetcher().submit(filepath)
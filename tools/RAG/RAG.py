@@ -1,39 +1,100 @@
-from tools.RAG.Chunking import ChunkDocument
+from tools.RAG.Chunking import ChunkDocument, ingest_lock
 from tools.RAG.Retrieve import RetrieveChunks
+from tools.RAG.Cache import get_retrieval_cache
+from tools.RAG.BM25 import is_identifier_query
+from tools.RAG.Index import collect_files, list_manifests
+from tools.RAG.Prefetch import get_prefetcher
+from utils.tracing import span
 from rich import print as rprint
-from typing import Union
+from typing import Union, List
 from pydantic import BaseModel, Field
 from langchain_core.tools import StructuredTool
 import os
 
-def RAG(filepath: str, query: str) -> Union[str, None]:
+ALL_DOCUMENTS = ("all", "*")
+
+def resolve_documents(filepath: Union[str, List[str]]) -> list:
+  '''
+  Expands the filepath argument of the tool into the documents to search
+  Arguments:
+    filepath: str | list - a document, a directory, a list of documents, or "all" for every indexed document
+  Output:
+    filepaths : list - the documents, in a stable order
+  '''
+  if isinstance(filepath, str) and filepath.strip().lower() in ALL_DOCUMENTS:
+    # Only manifests of documents that still exist, a migrated index may point at a moved or deleted file
+    return [manifest["filepath"] for manifest in list_manifests() if os.path.isfile(manifest["filepath"])]
+  paths = [filepath] if isinstance(filepath, str) else filepath
+  filepaths = []
+  for path in paths:
+    path = path.strip().replace("\\", "/")
+    for file in (collect_files(path) if os.path.isdir(path) else [path]):
+      if file not in filepaths:
+        filepaths.append(file)
+  return filepaths
+
+def RAG(filepath: Union[str, List[str]], query: str) -> Union[str, None]:
   '''
   Retrieves context from the vector database based on the given query
   Arguments:
-    filepath: str - the filepath of the document to query about
+    filepath: str | list - the document(s) to query about, a directory, or "all" for every indexed document
     query : str - the query from the user
   Output:
     context : str | None - the retrieved context from the vector database or else return None
   '''
-  filepath = filepath.replace("\\", "/")
+  filepaths = resolve_documents(filepath)
+  if not filepaths:
+    rprint(f"[red]Error: No documents found for '{filepath}'[/red]")
+    return None
+
+  with span("rag", documents=len(filepaths)) as stage:
+    return _retrieve_context(filepath, filepaths, query, stage)
 
+def _retrieve_context(filepath: Union[str, List[str]], filepaths: list, query: str, stage) -> Union[str, None]:
   try:
     context = ""
-    # Parse and chunk the document
-    chunking = ChunkDocument(filepath)
+    # Parse and chunk every document, unchanged ones are skipped by their manifest
+    doc_key = []
+    for path in filepaths:
+      # A document already being indexed in the background is not indexed a second time, one still
+      # queued behind other documents is indexed here instead of waiting for their ingest
+      get_prefetcher().wait(path)
+      chunking = ChunkDocument(path)
 
-    if not chunking.parseDocument():
-      try:
-        chunking.initializeEmbeddings()
-        chunking.storeEmbeddings()
-      except Exception as e:
-        rprint(f"[red]Error during embedding initialization: {str(e)}[/red]")
-        return None
+      # Only one call parses and embeds a document, the others wait and find it indexed
+      with ingest_lock(chunking.doc_id):
+        if not chunking.parseDocument():
+          try:
+            chunking.initializeEmbeddings()
+            chunking.storeEmbeddings()
+          except Exception as e:
+            rprint(f"[red]Error during embedding initialization: {str(e)}[/red]")
+            return None
+      doc_key.append((chunking.doc_id, chunking.file_hash))
+    doc_key = tuple(sorted(doc_key))
 
-    # Retrieve context based on the query
+    # Retrieve context based on the query, answering repeated or near duplicate queries from the cache
     try:
-      retrieve = RetrieveChunks(filepath, query)
-      chunks: list = retrieve.retrieveChunks()
+      cache = get_retrieval_cache()
+      chunks = cache.get(doc_key, query)
+      cache_tier = "exact"
+      if chunks is None:
+        # One top-k query over all the documents, not one per document
+        retrieve = RetrieveChunks(filepaths, query)
+        # Identifier lookups are answered by the lexical index, without embedding the query
+        vector = None if is_identifier_query(query) else retrieve.embedQuery()
+        chunks = cache.get_similar(doc_key, vector)
+        cache_tier = "semantic"
+        if chunks is None:
+          chunks = retrieve.retrieveChunks(vector=vector)
+          cache_tier = None
+          if chunks:
+            cache.put(doc_key, query, vector, chunks)
+      stats = cache.stats()
+      stage.set("cache_hit", cache_tier is not None)
+      stage.set("chunks", len(chunks))
+      if cache_tier:
+        rprint(f"[orange3]Retrieval cache: {cache_tier} hit (hit rate {stats['hit_rate']:.0%})[/orange3]")
     except Exception as e:
       rprint(f"[red]Error during chunk retrieval: {str(e)}[/red]")
       return None
@@ -43,34 +104,39 @@ def RAG(filepath: str, query: str) -> Union[str, None]:
 
     return context
 
-  except FileNotFoundError:
-    rprint(f"[red]Error: File '{filepath}' not found[/red]")
+  except FileNotFoundError as e:
+    rprint(f"[red]Error: File '{e.filename or filepath}' not found[/red]")
     return None
   except Exception as e:
     rprint(f"[red]Unexpected error: {str(e)}[/red]")
     return None
 
-def _rag_wrapper(filepath: str, query: str) -> str:
+def _rag_wrapper(filepath: Union[str, List[str]], query: str) -> str:
         try:
-            filepath = filepath.strip()
-            if filepath[0] == "\\":
-                filepath = filepath[1:]
-            if not os.path.exists(filepath):
-                return f"Error: File {filepath} not found"
-            context = RAG(filepath, query)
+            paths = [filepath] if isinstance(filepath, str) else list(filepath)
+            cleaned = []
+            for path in paths:
+                path = path.strip()
+                if path and path[0] == "\\":
+                    path = path[1:]
+                if path.lower() not in ALL_DOCUMENTS and not os.path.exists(path):
+                    return f"Error: File {path} not found"
+                cleaned.append(path)
+            context = RAG(cleaned[0] if isinstance(filepath, str) else cleaned, query)
             return context if context else "No relevant content found in document"
         except Exception as e:
             return f"Document processing error: {str(e)}"
 
 class DocumentQueryInput(BaseModel):
-    filepath: str = Field(..., description="Full path to the document file")
+    filepath: Union[str, List[str]] = Field(..., description="Full path to the document file, a list of document paths, a directory, or \"all\" to search every indexed document")
     query: str = Field(..., description="Specific question or task for the document")
 
 DocumentRetrieverTool = StructuredTool.from_function(
                 func=_rag_wrapper,
                 name="DocumentRetrieval",
                 description="""ONLY use for questions about SPECIFIC DOCUMENTS.
-                Requires both filepath and query. File must exist locally.
+                Requires both filepath and query. Files must exist locally.
+                To search several documents at once pass a list of paths, a directory, or "all".
                 Input format: {{"filepath": "path/to/file", "query": "your question"}}""",
                 args_schema=DocumentQueryInput
             )
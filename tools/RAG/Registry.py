@@ -0,0 +1,115 @@
+from collections import OrderedDict
+from rich.console import Console
+import threading
+import os
+
+console = Console()
+
+DEFAULT_EMBEDDING_MODEL: str = "sentence-transformers/all-MiniLM-L6-v2"
+
+_embeddings: dict = {}
+_embeddings_lock = threading.Lock()
+_model_locks: dict = {}
+
+_vector_stores: OrderedDict = OrderedDict()
+_vector_stores_lock = threading.Lock()
+
+def _model_lock(model_name: str) -> threading.Lock:
+  with _embeddings_lock:
+    if model_name not in _model_locks:
+      _model_locks[model_name] = threading.Lock()
+    return _model_locks[model_name]
+
+def _with_cache(embeddings, model_name: str):
+  # Chunks embedded before, in any document or version, are read from the embedding cache (RAG_EMBED_CACHE)
+  if os.getenv("RAG_EMBED_CACHE", "true").lower() != "true":
+    return embeddings
+  from tools.RAG.EmbeddingCache import CachedEmbeddings
+  from tools.RAG.Embedders import cache_key
+  return CachedEmbeddings(embeddings, cache_key(model_name))
+
+def get_embeddings(model_name: str = DEFAULT_EMBEDDING_MODEL):
+  '''
+  Returns the process wide embedding model, loading it on first use with the configured backend
+  (RAG_EMBEDDING_BACKEND: torch, onnx or onnx-int8)
+  Arguments:
+    model_name: str - the HuggingFace model name
+  Output:
+    embeddings : Embeddings - the shared (warm) embedding model, behind the embedding cache
+  '''
+  embeddings = _embeddings.get(model_name)
+  if embeddings is not None:
+    return embeddings
+
+  # Only one thread loads a given model, the others wait for it
+  with _model_lock(model_name):
+    embeddings = _embeddings.get(model_name)
+    if embeddings is None:
+      from tools.RAG.Embedders import load_embeddings
+      embeddings = _with_cache(load_embeddings(model_name), model_name)
+      _embeddings[model_name] = embeddings
+    return embeddings
+
+def set_embeddings(embeddings, model_name: str = DEFAULT_EMBEDDING_MODEL) -> None:
+  '''
+  Registers an embedding model under a model name, e.g. a local fake for tests and benchmarks
+  '''
+  with _model_lock(model_name):
+    _embeddings[model_name] = _with_cache(embeddings, model_name)
+
+def is_warm(model_name: str = DEFAULT_EMBEDDING_MODEL) -> bool:
+  return model_name in _embeddings
+
+def warm_up(model_name: str = DEFAULT_EMBEDDING_MODEL) -> threading.Thread:
+  '''
+  Starts loading the embedding model in a background thread so the first query does not pay for it
+  '''
+  def _load():
+    try:
+      get_embeddings(model_name)
+    except Exception as e:
+      console.print(f"Error warming up embeddings: {str(e)}", style="red")
+
+  thread = threading.Thread(target=_load, name="embeddings-warmup", daemon=True)
+  thread.start()
+  return thread
+
+def get_vector_store(collection_name: str, persist_directory: str, model_name: str = DEFAULT_EMBEDDING_MODEL):
+  '''
+  Returns an open Chroma collection, reusing the handle if it is still in the LRU
+  Arguments:
+    collection_name: str - the Chroma collection name
+    persist_directory: str - the directory of the persistent Chroma database
+    model_name: str - the embedding model used by the collection
+  Output:
+    vector_store : Chroma - the open vector store
+  '''
+  key = (persist_directory, collection_name, model_name)
+  with _vector_stores_lock:
+    vector_store = _vector_stores.get(key)
+    if vector_store is not None:
+      _vector_stores.move_to_end(key)
+      return vector_store
+
+  embeddings = get_embeddings(model_name)
+  from langchain_chroma import Chroma
+  vector_store = Chroma(
+    collection_name=collection_name,
+    embedding_function=embeddings,
+    persist_directory=persist_directory
+  )
+
+  with _vector_stores_lock:
+    _vector_stores[key] = vector_store
+    _vector_stores.move_to_end(key)
+    while len(_vector_stores) > int(os.getenv("RAG_MAX_OPEN_COLLECTIONS", "8")):
+      _vector_stores.popitem(last=False)
+  return vector_store
+
+def evict_vector_store(persist_directory: str) -> None:
+  '''
+  Drops every cached handle that points at the given persistent directory
+  '''
+  with _vector_stores_lock:
+    for key in [k for k in _vector_stores if k[0] == persist_directory]:
+      del _vector_stores[key]
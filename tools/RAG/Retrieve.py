@@ -1,59 +1,118 @@
-from langchain_community.vectorstores import Chroma
-from langchain_huggingface import HuggingFaceEmbeddings
 import os
 from datetime import datetime
-from utils.util import sanitize_collection_name, extract_filename
+from tools.RAG.Registry import DEFAULT_EMBEDDING_MODEL, get_embeddings, is_warm
+from tools.RAG.Index import index_key, load_manifest, list_manifests
+from tools.RAG.Corpus import get_corpus_store
+from tools.RAG.BM25 import load_bm25, update_bm25, search_bm25, is_identifier_query, reciprocal_rank_fusion
+from langchain_core.documents import Document
+from utils.tracing import span
 from rich.console import Console
 
 console = Console()
 
 class RetrieveChunks:
-  def __init__(self, filepath: str, query: str):
+  def __init__(self, filepath, query: str):
+    '''
+    Arguments:
+      filepath: str | list | None - a document, a list of documents, or None for every indexed document
+      query: str - the query from the user
+    '''
     try:
       self.query = query
-      self.filepath: str = filepath
-      self.filename: str = extract_filename(filepath)
-      self.collection_name: str = sanitize_collection_name(self.filename)
-      self.current_dir = os.path.dirname(os.path.abspath(__file__))
-      self.persistant_dir = os.path.join(self.current_dir,"db", self.filename)
+      self.filepath = filepath
+      if filepath is None:
+        self.doc_ids = None
+      else:
+        filepaths = [filepath] if isinstance(filepath, str) else filepath
+        self.doc_ids: list = [index_key(path) for path in filepaths]
     except Exception as e:
       console.print(f"Error during initialization: {str(e)}", style="red")
       raise
 
-  def retrieveChunks(self, model_name: str = "sentence-transformers/all-MiniLM-L6-v2")->list:
+  def embedQuery(self, model_name: str = DEFAULT_EMBEDDING_MODEL)->list:
+    with span("rag.embed_query"):
+      return get_embeddings(model_name).embed_query(self.query)
+
+  def loadBM25(self, store) -> list:
+    doc_ids = self.doc_ids if self.doc_ids is not None else [m["doc_id"] for m in list_manifests()]
+    indexes = []
+    for doc_id in doc_ids:
+      bm25 = load_bm25(doc_id)
+      if not bm25.docs:
+        # Document indexed before the lexical index existed, backfill it from the stored chunks
+        stored = store.chunks_of(doc_id)
+        if stored:
+          update_bm25(doc_id, [Document(page_content=text) for text in stored.values()], list(stored), [])
+          bm25 = load_bm25(doc_id)
+      indexes.append(bm25)
+    return indexes
+
+  def retrieveChunks(self, model_name: str = DEFAULT_EMBEDDING_MODEL, vector: list = None, k: int = 5)->list:
+    with span("rag.search") as stage:
+      chunks = self._retrieveChunks(model_name, vector, k, stage)
+      stage.set("chunks", len(chunks))
+      return chunks
+
+  def _retrieveChunks(self, model_name: str, vector: list, k: int, stage)->list:
     try:
-      if not os.path.exists(self.persistant_dir):
+      if self.doc_ids is not None and any(load_manifest(doc_id) is None for doc_id in self.doc_ids):
         console.print("Vector DB is not created!", style="red")
         return []
 
-      embeddings = HuggingFaceEmbeddings(model_name=model_name)
-      vector_store = Chroma(
-        collection_name=self.collection_name,
-        embedding_function=embeddings,
-        persist_directory=self.persistant_dir
-      )
-
-      chunks = []
       console.print("Retrieving Context...", style="orange3")
+      warm = is_warm(model_name)
       st = datetime.now()
+      store = get_corpus_store(model_name)
 
-      try:
-        query_result = vector_store.similarity_search(self.query, k=5)
-      except Exception as e:
-        console.print(f"Error during similarity search: {str(e)}", style="red")
-        return []
+      lt = datetime.now()
+      with span("rag.lexical"):
+        lexical = [chunk_id for chunk_id, _ in search_bm25(self.loadBM25(store), self.query, k=k * 2)]
+      console.print(f"Lexical Search Time Taken: {str(datetime.now() - lt)}", style="orange3")
+
+      found: dict = {}
+      stage.set("lexical_fast_path", bool(lexical and is_identifier_query(self.query)))
+      if lexical and is_identifier_query(self.query):
+        # Identifier lookups (part numbers, error codes) skip the query embedding and the dense search
+        console.print("Lexical fast path", style="orange3")
+        ranked = lexical[:k]
+      else:
+        dt = datetime.now()
+        try:
+          # Reuse the query embedding when the caller already computed it
+          with span("rag.dense"):
+            query_result = store.search(query=self.query, vector=vector, k=k * 2, doc_ids=self.doc_ids)
+        except Exception as e:
+          console.print(f"Error during similarity search: {str(e)}", style="red")
+          return []
+        console.print(f"Dense Search Time Taken: {str(datetime.now() - dt)}", style="orange3")
+        for result in query_result:
+          found[result.id] = (result.page_content, result.metadata)
+
+        ft = datetime.now()
+        ranked = reciprocal_rank_fusion([[result.id for result in query_result], lexical])[:k]
+        console.print(f"Rank Fusion Time Taken: {str(datetime.now() - ft)}", style="orange3")
+
+      missing = [chunk_id for chunk_id in ranked if chunk_id not in found]
+      if missing:
+        found.update(store.get(missing))
+
+      # With several documents, each chunk is labelled with the file it comes from
+      multiple = self.doc_ids is None or len(self.doc_ids) > 1
+      chunks = []
+      for chunk_id in ranked:
+        if chunk_id not in found:
+          continue
+        text, metadata = found[chunk_id]
+        source = metadata.get("source")
+        chunks.append(f"Source: {os.path.basename(source)}\n{text}" if multiple and source else text)
 
       et = datetime.now()
       run_time = et - st
       console.print("Context Retrieved", style="orange3")
-      console.print(f"Time Taken: {str(run_time)}", style="orange3")
-
-      for result in query_result:
-        chunks.append(result.page_content)
-
+      console.print(f"Time Taken: {str(run_time)} ({'warm' if warm else 'cold'})", style="orange3")
       console.print(f"Chunks Retrieved: {str(len(chunks))}", style="orange3")
       return chunks
 
     except Exception as e:
       console.print(f"Error in retrieveChunks: {str(e)}", style="red")
-      return []
\ No newline at end of file
+      return []
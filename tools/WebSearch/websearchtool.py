@@ -1,17 +1,29 @@
-from tavily import TavilyClient
 from dotenv import load_dotenv
-import os
 from rich import print as rprint
 from pydantic import BaseModel, Field
 from langchain_core.tools import StructuredTool
+from utils.tavily_util import get_tavily_client
+from utils.web_cache import get_web_cache, get_ttl, normalize_query
+from utils.tracing import span, current_span
 
 load_dotenv()
 
-tavily_client = TavilyClient(api_key=os.getenv("TAVILY_API_KEY"))
-
 def web_search(query: str) -> str:
-  rprint("[green]Searching the Web...[green]")
-  context = tavily_client.get_search_context(query=query,max_tokens=1000,max_results=3)
+  def fetch():
+    rprint("[green]Searching the Web...[green]")
+    with span("tavily.search"):
+      return get_tavily_client().get_search_context(query=query,max_tokens=1000,max_results=3)
+
+  context, status = get_web_cache().cached(
+    "WebSearch",
+    {"query": normalize_query(query), "max_tokens": 1000, "max_results": 3},
+    fetch,
+    ttl=get_ttl("WEB_SEARCH_CACHE_TTL", 86400),
+    stale_ttl=get_ttl("WEB_CACHE_STALE_TTL", 0)
+  )
+  current_span().set("cache_hit", status != "miss")
+  if status != "miss":
+    rprint(f"[green]Web search served from cache ({status})[green]")
   return context
 
 class WebSearchInput(BaseModel):
@@ -1,21 +1,91 @@
-from tavily import TavilyClient
 from dotenv import load_dotenv
-import os
 from rich import print as rprint
 from pydantic import BaseModel, Field
 from langchain_core.tools import StructuredTool
+from utils.tavily_util import get_tavily_client
+from utils.web_cache import get_web_cache, get_ttl, normalize_url
+from utils.tracing import span, current_span
 
 load_dotenv()
 
-tavily_client = TavilyClient(api_key=os.getenv("TAVILY_API_KEY"))
+def _params(url: str) -> dict:
+  return {"url": normalize_url(url), "include_images": False}
+
+def _extract(urls: list) -> tuple:
+  '''
+  Extracts the pages with one Tavily call. Results are matched to the requested URLs by normalized URL
+  only, a result that came back under another URL (a redirect) is never guessed to belong to a request.
+  Output:
+    pages : dict - {requested url: {"url", "raw_content"}} of the matched results
+    others : list - the results that match no requested URL, under the URL they came back with
+    failed : set - the requested URLs Tavily reported as failed
+  '''
+  rprint(f"[green]Scrapping the website{'s' if len(urls) > 1 else ''} {', '.join(urls)}...[green]")
+  with span("tavily.extract", urls=len(urls)):
+    response = get_tavily_client().extract(urls=urls, include_images=False)
+  pending = {normalize_url(u): u for u in urls}
+  failed = set()
+  for res in response.get("failed_results") or []:
+    requested = pending.pop(normalize_url(res.get("url", "")), None)
+    if requested is not None:
+      failed.add(requested)
+  pages, others = {}, []
+  for res in response["results"]:
+    page = {"url": res["url"], "raw_content": res["raw_content"]}
+    requested = pending.pop(normalize_url(res["url"]), None)
+    if requested is None:
+      others.append(page)
+    else:
+      pages[requested] = page
+  return pages, others, failed
+
+def _refresh(u: str):
+  # Background refresh of a stale entry, a failed extraction keeps the stale entry
+  page = _extract([u])[0].get(u)
+  if page is None:
+    raise ValueError(f"Could not extract {u}")
+  return page
 
 def scrapWebsite(url: str | list, query: str):
-  rprint("[green]Scrapping the website...[green]")
   context = ""
   urls = [url] if isinstance(url,str) else url
-  response = tavily_client.extract(urls=urls, include_images=False)
-  for res in response["results"]:
-    context += f"URL: {res["url"]}\n Raw Conent: {res['raw_content']}\n"
+  cache = get_web_cache()
+  ttl, stale_ttl = get_ttl("WEB_SCRAPE_CACHE_TTL", 604800), get_ttl("WEB_CACHE_STALE_TTL", 0)
+  pages, misses = {}, []
+  for u in urls:
+    found = cache.lookup("WebsiteScraper", _params(u), ttl, stale_ttl, refresh=lambda u=u: _refresh(u))
+    if found is None:
+      if u not in misses:
+        misses.append(u)
+      continue
+    pages[u] = found[0]
+    current_span().add("cache_hits")
+    rprint(f"[green]{u} served from cache ({found[1]})[green]")
+
+  # Every page missing from the cache is extracted in a single request
+  others = []
+  if misses:
+    try:
+      extracted, others, failed = _extract(misses)
+    except Exception as e:
+      rprint(f"[red]{str(e)}[red]")
+      extracted, failed = {}, set(misses)
+    for u in misses:
+      if u not in extracted:
+        # Failed extractions are not cached
+        if u in failed:
+          rprint(f"[red]Could not extract {u}[red]")
+        else:
+          rprint(f"[red]No page came back under {u}, it may have redirected[red]")
+        continue
+      cache.store("WebsiteScraper", _params(u), extracted[u])
+      pages[u] = extracted[u]
+    # Pages that came back under another URL are cached under that URL only
+    for page in others:
+      cache.store("WebsiteScraper", _params(page["url"]), page)
+
+  for page in [pages[u] for u in urls if u in pages] + others:
+    context += f"URL: {page['url']}\n Raw Conent: {page['raw_content']}\n"
   context += f"\n Answer the below query using the above context: \n Query: {query}"
   return context
 
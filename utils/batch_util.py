@@ -0,0 +1,216 @@
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from langchain_core.messages import HumanMessage, AIMessage, ToolMessage
+from utils.chat_util import _document_query_prompt, document_fast_path
+from utils.tracing import span, collect_spans, percentile, LLM_SPANS
+from datetime import datetime, timezone
+import hashlib
+import json
+import time
+import os
+
+def read_queries(path: str):
+    """
+    Reads the queries of a JSONL file, one {"query", "filepath"?, "id"?} object per line
+    Args:
+        path (str): The JSONL file
+    Yields:
+        dict: {"id", "query", "filepath", "line"}. Queries without an id get one derived from their
+        filepath and query, so it stays the same when the file is edited and the batch is resumed.
+    """
+    seen: dict = {}
+    with open(path, "r", encoding="utf-8") as f:
+        for number, line in enumerate(f, 1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                item = json.loads(line)
+            except ValueError as e:
+                raise ValueError(f"{path}:{number}: invalid JSON ({e})")
+            if isinstance(item, str):
+                item = {"query": item}
+            if not isinstance(item, dict) or not str(item.get("query", "")).strip():
+                raise ValueError(f"{path}:{number}: expected an object with a \"query\"")
+            filepath = item.get("filepath")
+            query_id = item.get("id")
+            if query_id is None:
+                digest = hashlib.sha1(json.dumps([filepath, item["query"]]).encode("utf-8")).hexdigest()[:12]
+                # identical queries in one file get distinct ids
+                n = seen.get(digest, 0)
+                seen[digest] = n + 1
+                query_id = f"{digest}_{n}"
+            yield {"id": str(query_id), "query": item["query"], "filepath": filepath, "line": number}
+
+def load_completed(path: str) -> set:
+    """
+    Returns the ids that already have a successful result in the output file, failed ones are run again
+    """
+    completed = set()
+    if not os.path.exists(path):
+        return completed
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                # a line cut short by an interrupted run
+                continue
+            if isinstance(record, dict) and record.get("status") == "ok":
+                completed.add(record.get("id"))
+    return completed
+
+def _ends_with_newline(path: str) -> bool:
+    with open(path, "rb") as f:
+        f.seek(-1, os.SEEK_END)
+        return f.read(1) == b"\n"
+
+def _tool_trace(messages: list) -> list:
+    outputs = {m.tool_call_id: m for m in messages if isinstance(m, ToolMessage)}
+    calls = []
+    for message in messages:
+        if not isinstance(message, AIMessage):
+            continue
+        for call in message.tool_calls:
+            output = outputs.get(call["id"])
+            content = str(output.content) if output is not None else ""
+            calls.append({
+                "name": call["name"],
+                "args": call["args"],
+                "output_chars": len(content),
+                "failed": output is None or content.startswith("Tool error:")
+            })
+    return calls
+
+def _stage_timings(spans: list) -> dict:
+    stages: dict = {}
+    for finished in spans:
+        stage = stages.setdefault(finished.name, {"count": 0, "seconds": 0.0})
+        stage["count"] += 1
+        stage["seconds"] += finished.duration or 0.0
+    return stages
+
+def run_query(agent, item: dict) -> dict:
+    """
+    Runs one query through the agent graph in its own thread of conversation
+    Args:
+        agent: The Agent of aida-agent-v-0.1.1
+        item (dict): A query of read_queries
+    Returns:
+        dict: The result record with the answer or the error, the tool calls, token counts and stage timings
+    """
+    prompt, document = item["query"], None
+    if item.get("filepath"):
+        if document_fast_path():
+            document = {"filepath": item["filepath"], "query": item["query"]}
+        else:
+            prompt = _document_query_prompt(item["filepath"], item["query"])
+    thread_id = f"batch-{item['id']}"
+    config = {"configurable": {"thread_id": thread_id}}
+    record = {
+        "id": item["id"],
+        "query": item["query"],
+        "filepath": item.get("filepath"),
+        "started_at": datetime.now(timezone.utc).isoformat()
+    }
+    st = time.perf_counter()
+    with collect_spans() as spans:
+        try:
+            with span("batch.query", id=item["id"]):
+                state = agent.graph.invoke({"messages": [HumanMessage(content=prompt)], "document": document}, config=config)
+            messages = state["messages"]
+            # Only messages of a model call carry usage, not the router's synthetic tool call message
+            usage = [m.usage_metadata for m in messages if isinstance(m, AIMessage) and m.usage_metadata]
+            record.update({
+                "status": "ok",
+                "answer": messages[-1].content,
+                "tool_calls": _tool_trace(messages),
+                "prompt_tokens": sum(u.get("input_tokens", 0) for u in usage),
+                "output_tokens": sum(u.get("output_tokens", 0) for u in usage)
+            })
+        except Exception as e:
+            record.update({"status": "error", "error": f"{type(e).__name__}: {e}"})
+        finally:
+            # Every query has its own thread, which is never continued, so its checkpoints are dropped
+            delete_thread = getattr(agent.checkpointer, "delete_thread", None)
+            if delete_thread is not None:
+                delete_thread(thread_id)
+    record["latency"] = time.perf_counter() - st
+    if record["status"] == "ok":
+        record["llm_calls"] = sum(1 for s in spans if s.name in LLM_SPANS)
+        # The rolling summary's usage is not in the messages, only in its span
+        summaries = [s for s in spans if s.name == "llm.summary"]
+        record["prompt_tokens"] += sum(s.attributes.get("prompt_tokens", 0) for s in summaries)
+        record["output_tokens"] += sum(s.attributes.get("output_tokens", 0) for s in summaries)
+    record["stages"] = _stage_timings(spans)
+    return record
+
+def run_batch(agent, input_path: str, output_path: str, concurrency: int = 4, limit: int = None, progress=None) -> dict:
+    """
+    Runs the queries of a JSONL file concurrently and appends one result line per query to the output file.
+    Queries that already have a successful result in the output file are skipped, so an interrupted
+    batch continues where it stopped.
+    Args:
+        agent: The Agent of aida-agent-v-0.1.1
+        input_path (str): JSONL file of queries
+        output_path (str): JSONL file the results are appended to
+        concurrency (int): Number of queries run at the same time
+        limit (int): Run at most this many queries
+        progress (callable): Called with each result record as it is written
+    Returns:
+        dict: Aggregate counts, throughput, latency percentiles and token totals of this run
+    """
+    completed = load_completed(output_path)
+    os.makedirs(os.path.dirname(os.path.abspath(output_path)), exist_ok=True)
+    stats = {"ok": 0, "error": 0, "skipped": 0, "prompt_tokens": 0, "output_tokens": 0}
+    latencies = []
+    queries = read_queries(input_path)
+    submitted = 0
+    st = time.perf_counter()
+
+    with open(output_path, "a", encoding="utf-8") as output, ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="aida-batch") as pool:
+        if output.tell() and not _ends_with_newline(output_path):
+            # Terminate a line cut short by an interrupted run, so the next result starts on its own line
+            output.write("\n")
+        running: dict = {}
+        exhausted = False
+        while not exhausted or running:
+            # Only a bounded number of queries are read ahead, so large input files are streamed
+            while not exhausted and len(running) < concurrency * 2:
+                item = next(queries, None)
+                if item is None or (limit is not None and submitted >= limit):
+                    exhausted = True
+                    break
+                if item["id"] in completed:
+                    stats["skipped"] += 1
+                    continue
+                completed.add(item["id"])
+                running[pool.submit(run_query, agent, item)] = item
+                submitted += 1
+            if not running:
+                break
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                running.pop(future)
+                record = future.result()
+                # Results are written by this thread only, one complete line per query
+                output.write(json.dumps(record, default=str) + "\n")
+                output.flush()
+                stats[record["status"]] += 1
+                stats["prompt_tokens"] += record.get("prompt_tokens", 0)
+                stats["output_tokens"] += record.get("output_tokens", 0)
+                latencies.append(record["latency"])
+                if progress is not None:
+                    progress(record)
+
+    seconds = time.perf_counter() - st
+    latencies.sort()
+    finished = stats["ok"] + stats["error"]
+    return {
+        **stats,
+        "seconds": seconds,
+        "queries_per_sec": finished / seconds if seconds else 0.0,
+        "output_tokens_per_sec": stats["output_tokens"] / seconds if seconds else 0.0,
+        "latency_p50": percentile(latencies, 50),
+        "latency_p95": percentile(latencies, 95),
+        "latency_p99": percentile(latencies, 99)
+    }
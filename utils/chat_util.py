@@ -1,9 +1,15 @@
 from rich import print as rprint
 from rich.prompt import Prompt, IntPrompt
+from rich.markdown import Markdown
 from langchain_core.messages import AIMessageChunk, HumanMessage, AIMessage
 from typing import Dict, Optional, Tuple, Any
 import re
+import time
 from langchain_community.chat_message_histories import SQLChatMessageHistory
+from utils.session_store import get_session_store
+from utils.tracing import get_tracer
+from rich.table import Table
+from rich.markup import escape
 import os
 
 def _detect_document_query(input_text: str) -> Optional[Tuple[str, str]]:
@@ -19,6 +25,13 @@ def _detect_document_query(input_text: str) -> Optional[Tuple[str, str]]:
 
         return None
 
+def _document_query_prompt(filepath: str, query: str) -> str:
+  return f"Use the below filepath (use as such don't change anyting in the filepath) and query to call the DocumentRetriever Tool: filepath: {filepath} , query: {query}"
+
+def document_fast_path() -> bool:
+  """Detected document queries are retrieved by the router of the graph, without an LLM call to route them"""
+  return os.getenv("AIDA_DOCUMENT_FAST_PATH", "true").lower() == "true"
+
 def _process_input(user_input: str) -> Dict:
   doc_info = _detect_document_query(user_input)
   if doc_info:
@@ -37,57 +50,140 @@ def _process_stream_chunk(chunk: Any) -> str:
     return chunk.get("output", "")
   return ""
 
+class ThrottledMarkdown:
+  """Accumulates streamed text and re-renders it on a Rich Live display at most every
+  `interval` seconds or every `min_chars` new characters, instead of on every chunk"""
+
+  def __init__(self, live, interval: float = 0.1, min_chars: int = 400):
+    self.live = live
+    self.interval = interval
+    self.min_chars = min_chars
+    self.parts: list = []
+    self.pending = 0
+    self.last_render = 0.0
+
+  @property
+  def text(self) -> str:
+    return "".join(self.parts)
+
+  def append(self, content: str) -> None:
+    self.parts.append(content)
+    self.pending += len(content)
+    if self.pending >= self.min_chars or time.perf_counter() - self.last_render >= self.interval:
+      self.flush()
+
+  def flush(self) -> None:
+    if self.pending:
+      self.live.update(Markdown(self.text), refresh=True)
+      self.pending = 0
+    self.last_render = time.perf_counter()
+
+def _show_jobs():
+  """Show the documents indexed in the background"""
+  from tools.RAG.Prefetch import get_prefetcher
+  jobs = get_prefetcher().list_jobs()
+  if not jobs:
+    rprint("[red]No background indexing jobs[/red]")
+    return
+
+  table = Table(title="Background indexing")
+  for column in ("Document", "Status", "Chunks stored", "Seconds"):
+    table.add_column(column, justify="left" if column in ("Document", "Status") else "right")
+  for job in jobs:
+    seconds = (job.finished_at or time.time()) - job.created_at
+    status = f"{job.status}: {job.error}" if job.error else job.status
+    table.add_row(escape(job.filepath), status, str(job.stored_chunks), f"{seconds:.1f}")
+  rprint(table)
+
+# Chat histories continued from a saved session: the session name, the position of the first message copied into
+# the history and the position of the oldest message shown with /more. Older messages stay in the session store.
+_loaded_sessions: dict = {}
+
 def _save_chat_session(chat_history: SQLChatMessageHistory):
-  """Save current chat session to separate database"""
+  """Save current chat session to the session store"""
   name = Prompt.ask("[bold green]Enter the name of the chat to save[/bold green]").strip()
-  filename = f"chats/chat_{name}.db"
+  store = get_session_store()
 
-  # Create new database
-  saved_chat = SQLChatMessageHistory(
-    session_id="saved_session",
-    connection=f"sqlite:///{filename}"
-  )
+  # All messages are written in one transaction, the messages of a loaded session that were not copied into
+  # the history are copied within the session store
+  loaded = _loaded_sessions.get(id(chat_history))
+  prefix = (loaded["name"], loaded["start"]) if loaded else None
+  count = store.save(name, [m for m in chat_history.messages if isinstance(m, (HumanMessage, AIMessage))], prefix=prefix)
+  if loaded:
+    loaded["name"] = name
 
-  # Copy messages
-  for message in chat_history.messages:
-    if isinstance(message, HumanMessage):
-      saved_chat.add_user_message(message.content)
-    elif isinstance(message, AIMessage):
-      saved_chat.add_ai_message(message.content)
-
-  rprint(f"[green]Chat saved to {filename}[/green]")
+  rprint(f"[green]Chat saved as '{name}' ({count} messages)[/green]")
 
 def _load_chat_session(chat_history : SQLChatMessageHistory):
-  """Load chat session from saved database"""
-  chat_files = [f for f in os.listdir("chats") if f.endswith(".db")]
-  if not chat_files:
+  """Load chat session from the session store"""
+  store = get_session_store()
+  # Chats saved by older versions as separate files are imported on first use
+  store.import_legacy("chats")
+  sessions = store.list_sessions()
+  if not sessions:
     rprint("[red]No saved chats found[/red]")
     return
 
   rprint("[bold]Available chats:[/bold]")
-  for idx, file in enumerate(chat_files, 1):
-    rprint(f"{idx}. {file}")
+  for idx, (name, message_count, updated_at) in enumerate(sessions, 1):
+    rprint(f"{idx}. {name} ({message_count} messages, {time.strftime('%Y-%m-%d %H:%M', time.localtime(updated_at))})")
 
   try:
     selection = IntPrompt.ask("Enter chat number to load", default=1, show_default=False)
-    selected_file = chat_files[selection - 1]
+    selected = sessions[selection - 1][0]
   except (ValueError, IndexError):
     rprint("[red]Invalid selection[/red]")
     return
 
-  # Load selected chat
-  filepath = os.path.join("chats", selected_file)
-  loaded_chat = SQLChatMessageHistory(
-    session_id="saved_session",
-    connection=f"sqlite:///{filepath}"
-  )
-
-  # Clear current history and load messages
+  # Only the last page is copied into the history, older messages are read with /more
+  messages, start = store.page(selected)
   chat_history.clear()
-  for message in loaded_chat.messages:
-    if isinstance(message, HumanMessage):
-      chat_history.add_user_message(message.content)
-    elif isinstance(message, AIMessage):
-      chat_history.add_ai_message(message.content)
+  chat_history.add_messages(messages)
+  _loaded_sessions[id(chat_history)] = {"name": selected, "start": start, "shown": start}
+
+  if start:
+    rprint(f"[green]Loaded chat '{selected}' (last {len(messages)} messages, '/more' shows older ones)[/green]")
+  else:
+    rprint(f"[green]Loaded chat '{selected}'[/green]")
+
+def _show_older_messages(chat_history: SQLChatMessageHistory):
+  """Show the page of the loaded chat session before the oldest message shown so far"""
+  loaded = _loaded_sessions.get(id(chat_history))
+  if not loaded or not loaded["shown"]:
+    rprint("[red]No older messages[/red]")
+    return
+
+  messages, loaded["shown"] = get_session_store().page(loaded["name"], before=loaded["shown"])
+  for message in messages:
+    role = "User" if isinstance(message, HumanMessage) else "AiDA"
+    rprint(f"[bold]{role}:[/bold] {escape(message.content)}")
+
+def _search_chat_sessions(query: str):
+  """Search the saved chat sessions"""
+  store = get_session_store()
+  store.import_legacy("chats")
+  results = store.search(query)
+  if not results:
+    rprint(f"[red]No saved chats match '{query}'[/red]")
+    return
+
+  for name, role, snippet in results:
+    rprint(f"[bold]{name}[/bold] ({role}): {escape(snippet)}")
+
+def _show_stats():
+  """Show rolling latency percentiles of every traced stage"""
+  summary = get_tracer().metrics.summary()
+  if not summary:
+    rprint("[red]No stages recorded yet[/red]")
+    return
 
-  rprint(f"[green]Loaded chat from {selected_file}[/green]")
\ No newline at end of file
+  table = Table(title=f"Latency of the last {get_tracer().metrics.window} runs per stage (ms)")
+  for column in ("Stage", "Count", "p50", "p95", "p99", "Max", "Totals"):
+    table.add_column(column, justify="left" if column in ("Stage", "Totals") else "right")
+  for name, stats in sorted(summary.items()):
+    totals = ", ".join(
+      f"{key} {value[0]}/{value[1]}" if isinstance(value, tuple) else f"{key} {value:g}"
+      for key, value in stats["totals"].items()
+    )
+    table.add_row(name, str(stats["count"]), *(f"{stats[p] * 1000:.1f}" for p in ("p50", "p95", "p99", "max")), totals)
+  rprint(table)
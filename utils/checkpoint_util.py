@@ -0,0 +1,375 @@
+from langgraph.checkpoint.base import WRITES_IDX_MAP, BaseCheckpointSaver, CheckpointTuple, get_checkpoint_id, get_checkpoint_metadata, writes_sort_key
+from langgraph.checkpoint.memory import MemorySaver
+from collections import OrderedDict
+import threading
+import sqlite3
+import zlib
+import time
+import os
+
+DEFAULT_CHECKPOINT_DB: str = os.path.join("chats", "checkpoints.db")
+
+# Serialized values above this size are stored zlib compressed, tool outputs and scraped pages compress well
+COMPRESS_MIN_BYTES: int = 1024
+# A new version of a list channel (the messages) only stores the items replaced or appended since the previous
+# version, at most this many deltas deep before the full list is written again as a new base
+MAX_DELTA_CHAIN: int = 50
+# (thread, namespace, channel) whose latest list value is kept in memory to compute the next delta
+LAST_VALUES_SIZE: int = 256
+
+class SqliteCheckpointer(BaseCheckpointSaver):
+    """
+    LangGraph checkpointer in a SQLite database, so the checkpoints of the agent's threads live on disk
+    instead of in process memory. A checkpoint row only holds the channel versions, each channel value
+    is stored once per version in the blobs table and only for the channels a step changed. A new
+    version of a list channel such as the messages stores only the items replaced in place (tool
+    digests) and appended on top of the previous version, so a step writes its new messages instead
+    of the whole history. After MAX_DELTA_CHAIN deltas, or when items were removed (summarized turns)
+    or most of them changed, the full list is written again as a new base. Only the last `keep` checkpoints of each thread are kept, older ones are
+    deleted with their pending writes and the values no kept checkpoint needs. Threads idle for longer
+    than `ttl` are deleted and the freed pages are returned to the file system every `vacuum_interval` seconds.
+    """
+
+    def __init__(self, path: str = None, keep: int = None, vacuum_interval: float = None, ttl: float = None, serde=None):
+        super().__init__(serde=serde)
+        self.path = path or os.getenv("AIDA_CHECKPOINT_DB") or DEFAULT_CHECKPOINT_DB
+        self.keep = max(1, keep or int(os.getenv("AIDA_CHECKPOINT_KEEP", "20")))
+        self.vacuum_interval = vacuum_interval if vacuum_interval is not None else float(os.getenv("AIDA_CHECKPOINT_VACUUM_INTERVAL", "300"))
+        self.ttl = ttl if ttl is not None else float(os.getenv("AIDA_CHECKPOINT_TTL", "604800"))
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(self.path, check_same_thread=False)
+        with self.lock, self.conn:
+            # Set before the tables are created, so deleted checkpoints can be vacuumed incrementally
+            self.conn.execute("PRAGMA auto_vacuum=INCREMENTAL")
+            self.conn.execute("PRAGMA journal_mode=WAL")
+            self.conn.execute(
+                "CREATE TABLE IF NOT EXISTS checkpoints ("
+                "thread_id TEXT NOT NULL, checkpoint_ns TEXT NOT NULL, checkpoint_id TEXT NOT NULL, parent_id TEXT, "
+                "type TEXT NOT NULL, checkpoint BLOB NOT NULL, metadata_type TEXT NOT NULL, metadata BLOB NOT NULL, "
+                "updated_at REAL NOT NULL, PRIMARY KEY (thread_id, checkpoint_ns, checkpoint_id))"
+            )
+            self.conn.execute(
+                "CREATE TABLE IF NOT EXISTS writes ("
+                "thread_id TEXT NOT NULL, checkpoint_ns TEXT NOT NULL, checkpoint_id TEXT NOT NULL, task_id TEXT NOT NULL, "
+                "idx INTEGER NOT NULL, channel TEXT NOT NULL, type TEXT NOT NULL, value BLOB NOT NULL, task_path TEXT NOT NULL, "
+                "PRIMARY KEY (thread_id, checkpoint_ns, checkpoint_id, task_id, idx))"
+            )
+            self.conn.execute(
+                "CREATE TABLE IF NOT EXISTS blobs ("
+                "thread_id TEXT NOT NULL, checkpoint_ns TEXT NOT NULL, channel TEXT NOT NULL, version TEXT NOT NULL, "
+                "type TEXT NOT NULL, value BLOB NOT NULL, base_version TEXT, depth INTEGER NOT NULL, "
+                "PRIMARY KEY (thread_id, checkpoint_ns, channel, version))"
+            )
+            self.conn.execute("CREATE INDEX IF NOT EXISTS checkpoints_updated_at ON checkpoints (updated_at)")
+        self.last_vacuum = time.time()
+        self.pruned = 0
+        # (thread_id, checkpoint_ns, channel) -> (version, list value, delta depth), the base of the next delta
+        self.last_values: OrderedDict = OrderedDict()
+
+    def _dumps(self, value) -> tuple:
+        kind, data = self.serde.dumps_typed(value)
+        if len(data) >= COMPRESS_MIN_BYTES:
+            return f"{kind}+zlib", zlib.compress(data, 1)
+        return kind, data
+
+    def _loads(self, kind: str, data: bytes):
+        if kind.endswith("+zlib"):
+            kind, data = kind[:-len("+zlib")], zlib.decompress(data)
+        return self.serde.loads_typed((kind, data))
+
+    def _remember(self, key: tuple, version: str, value: list, depth: int) -> None:
+        self.last_values[key] = (version, list(value), depth)
+        self.last_values.move_to_end(key)
+        while len(self.last_values) > LAST_VALUES_SIZE:
+            self.last_values.popitem(last=False)
+
+    def _put_blobs(self, thread_id: str, checkpoint_ns: str, values: dict, new_versions: dict) -> None:
+        # Called with the lock held and inside a transaction
+        rows = []
+        for channel, version in new_versions.items():
+            version, key = str(version), (thread_id, checkpoint_ns, channel)
+            if channel not in values:
+                self.last_values.pop(key, None)
+                rows.append((thread_id, checkpoint_ns, channel, version, "empty", b"", None, 0))
+                continue
+            value = values[channel]
+            stored, base_version, depth = value, None, 0
+            last = self.last_values.get(key)
+            if isinstance(value, list) and last is not None and last[0] != version and last[2] < MAX_DELTA_CHAIN and len(value) >= len(last[1]):
+                previous = last[1]
+                # Unchanged items are usually the same objects, so the comparison is cheap
+                replaced = [(i, value[i]) for i in range(len(previous)) if value[i] is not previous[i] and value[i] != previous[i]]
+                if len(replaced) <= len(previous) // 2 and self.conn.execute(
+                    "SELECT 1 FROM blobs WHERE thread_id = ? AND checkpoint_ns = ? AND channel = ? AND version = ?",
+                    (thread_id, checkpoint_ns, channel, last[0])
+                ).fetchone():
+                    stored = {"replaced": replaced, "appended": value[len(previous):]}
+                    base_version, depth = last[0], last[2] + 1
+            kind, data = self._dumps(stored)
+            rows.append((thread_id, checkpoint_ns, channel, version, kind, data, base_version, depth))
+            if isinstance(value, list):
+                self._remember(key, version, value, depth)
+        self.conn.executemany(
+            "INSERT OR REPLACE INTO blobs (thread_id, checkpoint_ns, channel, version, type, value, base_version, depth) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?)", rows
+        )
+
+    def _load_blobs(self, thread_id: str, checkpoint_ns: str, versions: dict, remember: bool = False) -> dict:
+        # Called with the lock held. A delta is applied on top of the value of its base version.
+        values = {}
+        for channel, version in versions.items():
+            chain, next_version = [], str(version)
+            while next_version is not None and len(chain) <= MAX_DELTA_CHAIN:
+                row = self.conn.execute(
+                    "SELECT type, value, base_version, depth FROM blobs WHERE thread_id = ? AND checkpoint_ns = ? AND channel = ? AND version = ?",
+                    (thread_id, checkpoint_ns, channel, next_version)
+                ).fetchone()
+                if row is None:
+                    break
+                chain.append(row)
+                next_version = row[2]
+            if not chain or chain[0][0] == "empty" or chain[-1][2] is not None:
+                continue
+            value = self._loads(chain[-1][0], chain[-1][1])
+            for kind, data, _, _ in reversed(chain[:-1]):
+                delta = self._loads(kind, data)
+                value = list(value)
+                for index, item in delta["replaced"]:
+                    value[index] = item
+                value.extend(delta["appended"])
+            values[channel] = value
+            if remember and isinstance(value, list):
+                self._remember((thread_id, checkpoint_ns, channel), str(version), value, chain[0][3])
+        return values
+
+    def _tuple(self, thread_id: str, checkpoint_ns: str, row: tuple, remember: bool = False) -> CheckpointTuple:
+        checkpoint_id, parent_id, kind, checkpoint, metadata_type, metadata = row
+        checkpoint = self._loads(kind, checkpoint)
+        # Checkpoints written before the blobs table hold their values inline
+        values = checkpoint.get("channel_values") or {}
+        missing = {channel: version for channel, version in checkpoint["channel_versions"].items() if channel not in values}
+        checkpoint["channel_values"] = {**self._load_blobs(thread_id, checkpoint_ns, missing, remember), **values}
+        writes = self.conn.execute(
+            "SELECT task_id, idx, channel, type, value, task_path FROM writes "
+            "WHERE thread_id = ? AND checkpoint_ns = ? AND checkpoint_id = ?",
+            (thread_id, checkpoint_ns, checkpoint_id)
+        ).fetchall()
+        writes.sort(key=lambda w: writes_sort_key(w[5], w[0], w[1]))
+        return CheckpointTuple(
+            config={"configurable": {"thread_id": thread_id, "checkpoint_ns": checkpoint_ns, "checkpoint_id": checkpoint_id}},
+            checkpoint=checkpoint,
+            metadata=self._loads(metadata_type, metadata),
+            parent_config={"configurable": {"thread_id": thread_id, "checkpoint_ns": checkpoint_ns, "checkpoint_id": parent_id}} if parent_id else None,
+            pending_writes=[(task_id, channel, self._loads(value_type, value)) for task_id, _, channel, value_type, value, _ in writes]
+        )
+
+    def get_tuple(self, config) -> CheckpointTuple:
+        """
+        Returns the checkpoint of the config, or the latest one of its thread, with one indexed lookup
+        """
+        thread_id = config["configurable"]["thread_id"]
+        checkpoint_ns = config["configurable"].get("checkpoint_ns", "")
+        columns = "checkpoint_id, parent_id, type, checkpoint, metadata_type, metadata"
+        with self.lock:
+            if checkpoint_id := get_checkpoint_id(config):
+                row = self.conn.execute(
+                    f"SELECT {columns} FROM checkpoints WHERE thread_id = ? AND checkpoint_ns = ? AND checkpoint_id = ?",
+                    (thread_id, checkpoint_ns, checkpoint_id)
+                ).fetchone()
+            else:
+                row = self.conn.execute(
+                    f"SELECT {columns} FROM checkpoints WHERE thread_id = ? AND checkpoint_ns = ? ORDER BY checkpoint_id DESC LIMIT 1",
+                    (thread_id, checkpoint_ns)
+                ).fetchone()
+            # The graph continues from the latest checkpoint, its list values are the base of the next deltas
+            return self._tuple(thread_id, checkpoint_ns, row, remember=not checkpoint_id) if row else None
+
+    def list(self, config, *, filter: dict = None, before=None, limit: int = None):
+        """
+        Yields the kept checkpoints matching the config, newest first
+        """
+        query = "SELECT thread_id, checkpoint_ns, checkpoint_id, parent_id, type, checkpoint, metadata_type, metadata FROM checkpoints"
+        clauses, params = [], []
+        if config:
+            clauses.append("thread_id = ?")
+            params.append(config["configurable"]["thread_id"])
+            if (checkpoint_ns := config["configurable"].get("checkpoint_ns")) is not None:
+                clauses.append("checkpoint_ns = ?")
+                params.append(checkpoint_ns)
+            if checkpoint_id := get_checkpoint_id(config):
+                clauses.append("checkpoint_id = ?")
+                params.append(checkpoint_id)
+        if before and (before_id := get_checkpoint_id(before)):
+            clauses.append("checkpoint_id < ?")
+            params.append(before_id)
+        if clauses:
+            query += " WHERE " + " AND ".join(clauses)
+        query += " ORDER BY checkpoint_id DESC"
+        with self.lock:
+            rows = self.conn.execute(query, params).fetchall()
+        for thread_id, checkpoint_ns, *row in rows:
+            if limit is not None and limit <= 0:
+                break
+            with self.lock:
+                item = self._tuple(thread_id, checkpoint_ns, tuple(row))
+            if filter and not all(item.metadata.get(key) == value for key, value in filter.items()):
+                continue
+            if limit is not None:
+                limit -= 1
+            yield item
+
+    def put(self, config, checkpoint, metadata, new_versions):
+        """
+        Stores a checkpoint with the values of the channels that changed (`new_versions`) and prunes the
+        thread down to the last `keep` checkpoints
+        """
+        thread_id = config["configurable"]["thread_id"]
+        checkpoint_ns = config["configurable"].get("checkpoint_ns", "")
+        kind, data = self._dumps({**checkpoint, "channel_values": {}})
+        metadata_type, metadata_data = self._dumps(get_checkpoint_metadata(config, metadata))
+        with self.lock, self.conn:
+            self._put_blobs(thread_id, checkpoint_ns, checkpoint["channel_values"], new_versions)
+            self.conn.execute(
+                "INSERT OR REPLACE INTO checkpoints (thread_id, checkpoint_ns, checkpoint_id, parent_id, type, checkpoint, "
+                "metadata_type, metadata, updated_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (thread_id, checkpoint_ns, checkpoint["id"], config["configurable"].get("checkpoint_id"),
+                 kind, data, metadata_type, metadata_data, time.time())
+            )
+            self._prune(thread_id, checkpoint_ns, self.keep)
+        self._maybe_vacuum()
+        return {"configurable": {"thread_id": thread_id, "checkpoint_ns": checkpoint_ns, "checkpoint_id": checkpoint["id"]}}
+
+    def put_writes(self, config, writes, task_id: str, task_path: str = "") -> None:
+        thread_id = config["configurable"]["thread_id"]
+        checkpoint_ns = config["configurable"].get("checkpoint_ns", "")
+        checkpoint_id = config["configurable"]["checkpoint_id"]
+        rows = []
+        for idx, (channel, value) in enumerate(writes):
+            kind, data = self._dumps(value)
+            rows.append((thread_id, checkpoint_ns, checkpoint_id, task_id, WRITES_IDX_MAP.get(channel, idx), channel, kind, data, task_path))
+        columns = "(thread_id, checkpoint_ns, checkpoint_id, task_id, idx, channel, type, value, task_path) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)"
+        with self.lock, self.conn:
+            # Regular writes of a task are stored once, special writes (errors, interrupts) replace the previous one
+            self.conn.executemany(f"INSERT OR IGNORE INTO writes {columns}", [row for row in rows if row[4] >= 0])
+            self.conn.executemany(f"INSERT OR REPLACE INTO writes {columns}", [row for row in rows if row[4] < 0])
+
+    def _prune(self, thread_id: str, checkpoint_ns: str, keep: int) -> None:
+        # Called with the lock held and inside a transaction
+        cutoff = self.conn.execute(
+            "SELECT checkpoint_id FROM checkpoints WHERE thread_id = ? AND checkpoint_ns = ? ORDER BY checkpoint_id DESC LIMIT 1 OFFSET ?",
+            (thread_id, checkpoint_ns, keep - 1)
+        ).fetchone()
+        if cutoff is None:
+            return
+        deleted = self.conn.execute(
+            "DELETE FROM checkpoints WHERE thread_id = ? AND checkpoint_ns = ? AND checkpoint_id < ?",
+            (thread_id, checkpoint_ns, cutoff[0])
+        ).rowcount
+        self.conn.execute("DELETE FROM writes WHERE thread_id = ? AND checkpoint_ns = ? AND checkpoint_id < ?", (thread_id, checkpoint_ns, cutoff[0]))
+        self.pruned += deleted
+        if deleted:
+            self._prune_blobs(thread_id, checkpoint_ns)
+
+    def _prune_blobs(self, thread_id: str, checkpoint_ns: str) -> None:
+        # Keeps the values of the kept checkpoints and the bases their deltas are applied to
+        needed = set()
+        for kind, data in self.conn.execute(
+            "SELECT type, checkpoint FROM checkpoints WHERE thread_id = ? AND checkpoint_ns = ?", (thread_id, checkpoint_ns)
+        ).fetchall():
+            needed.update((channel, str(version)) for channel, version in self._loads(kind, data)["channel_versions"].items())
+        bases = {(channel, version): base for channel, version, base in self.conn.execute(
+            "SELECT channel, version, base_version FROM blobs WHERE thread_id = ? AND checkpoint_ns = ?", (thread_id, checkpoint_ns)
+        )}
+        pending = list(needed)
+        while pending:
+            channel, version = pending.pop()
+            base = bases.get((channel, version))
+            if base is not None and (channel, base) not in needed:
+                needed.add((channel, base))
+                pending.append((channel, base))
+        self.conn.executemany(
+            "DELETE FROM blobs WHERE thread_id = ? AND checkpoint_ns = ? AND channel = ? AND version = ?",
+            [(thread_id, checkpoint_ns, channel, version) for channel, version in bases if (channel, version) not in needed]
+        )
+
+    def _forget(self, thread_id: str) -> None:
+        # Called with the lock held and inside a transaction
+        self.conn.execute("DELETE FROM checkpoints WHERE thread_id = ?", (thread_id,))
+        self.conn.execute("DELETE FROM writes WHERE thread_id = ?", (thread_id,))
+        self.conn.execute("DELETE FROM blobs WHERE thread_id = ?", (thread_id,))
+        for key in [key for key in self.last_values if key[0] == thread_id]:
+            del self.last_values[key]
+
+    def prune(self, thread_ids, *, strategy: str = "keep_latest") -> None:
+        """
+        Keeps only the latest checkpoint of each namespace of the threads ("keep_latest") or deletes them ("delete")
+        """
+        for thread_id in thread_ids:
+            if strategy == "delete":
+                self.delete_thread(thread_id)
+                continue
+            with self.lock, self.conn:
+                for (checkpoint_ns,) in self.conn.execute("SELECT DISTINCT checkpoint_ns FROM checkpoints WHERE thread_id = ?", (thread_id,)).fetchall():
+                    self._prune(thread_id, checkpoint_ns, 1)
+
+    def delete_thread(self, thread_id: str) -> None:
+        with self.lock, self.conn:
+            self._forget(thread_id)
+
+    def _maybe_vacuum(self) -> None:
+        if time.time() - self.last_vacuum < self.vacuum_interval:
+            return
+        self.vacuum()
+
+    def vacuum(self) -> None:
+        """
+        Deletes the threads idle for longer than the TTL and returns the free pages to the file system
+        """
+        self.last_vacuum = time.time()
+        with self.lock:
+            with self.conn:
+                if self.ttl > 0:
+                    idle = [row[0] for row in self.conn.execute(
+                        "SELECT thread_id FROM checkpoints GROUP BY thread_id HAVING MAX(updated_at) < ?", (time.time() - self.ttl,)
+                    )]
+                    for thread_id in idle:
+                        self._forget(thread_id)
+            self.conn.execute("PRAGMA incremental_vacuum")
+            self.conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+
+    def stats(self) -> dict:
+        with self.lock:
+            threads, checkpoints = self.conn.execute("SELECT COUNT(DISTINCT thread_id), COUNT(*) FROM checkpoints").fetchone()
+            pages, page_size = self.conn.execute("PRAGMA page_count").fetchone()[0], self.conn.execute("PRAGMA page_size").fetchone()[0]
+        return {"threads": threads, "checkpoints": checkpoints, "pruned": self.pruned, "size_mb": pages * page_size / (1024 * 1024)}
+
+    # The graph is run synchronously (in worker threads for the server), the async API wraps the sync one
+    async def aget_tuple(self, config) -> CheckpointTuple:
+        return self.get_tuple(config)
+
+    async def alist(self, config, *, filter: dict = None, before=None, limit: int = None):
+        for item in self.list(config, filter=filter, before=before, limit=limit):
+            yield item
+
+    async def aput(self, config, checkpoint, metadata, new_versions):
+        return self.put(config, checkpoint, metadata, new_versions)
+
+    async def aput_writes(self, config, writes, task_id: str, task_path: str = "") -> None:
+        self.put_writes(config, writes, task_id, task_path)
+
+    async def adelete_thread(self, thread_id: str) -> None:
+        self.delete_thread(thread_id)
+
+def get_checkpointer():
+    """
+    Returns the checkpointer of the agent graph selected with AIDA_CHECKPOINTER
+    Returns:
+        BaseCheckpointSaver: SqliteCheckpointer for "sqlite" (the default), MemorySaver for "memory"
+    """
+    kind = os.getenv("AIDA_CHECKPOINTER", "sqlite").strip().lower()
+    if kind == "memory":
+        return MemorySaver()
+    if kind != "sqlite":
+        raise ValueError(f"Unknown AIDA_CHECKPOINTER '{kind}', expected sqlite or memory")
+    return SqliteCheckpointer()
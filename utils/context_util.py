@@ -0,0 +1,200 @@
+from langchain_core.messages import AnyMessage, HumanMessage, SystemMessage, ToolMessage, RemoveMessage
+from utils.tracing import span
+import json
+import os
+import re
+
+SUMMARY_PROMPT = """Summarize the conversation below for an assistant that will continue it.
+Keep the user's goals, decisions, facts and file paths or URLs that were mentioned, and drop small talk.
+{existing}Answer with the summary only, in under {words} words.
+
+Conversation:
+{conversation}"""
+
+class TokenCounter:
+  """Estimates prompt tokens for a provider. Azure (OpenAI) models are counted with tiktoken when it is
+  installed, other providers by characters. Every real prompt token count reported by the provider
+  corrects the estimate, so it converges on the provider's own tokenizer"""
+
+  def __init__(self, provider: str, model_name: str):
+    self.provider = provider
+    self.chars_per_token = 4.0
+    self.scale = 1.0
+    self.encoding = None
+    if provider == "azure":
+      try:
+        import tiktoken
+        try:
+          self.encoding = tiktoken.encoding_for_model(model_name)
+        except KeyError:
+          self.encoding = tiktoken.get_encoding("o200k_base")
+      except ImportError:
+        pass
+
+  def count_text(self, text: str) -> int:
+    if self.encoding is not None:
+      return len(self.encoding.encode(text, disallowed_special=()))
+    return int(len(text) / self.chars_per_token) + 1
+
+  def count_message(self, message: AnyMessage) -> int:
+    content = message.content if isinstance(message.content, str) else json.dumps(message.content)
+    tokens = self.count_text(content) + 4
+    tool_calls = getattr(message, "tool_calls", None)
+    if tool_calls:
+      tokens += self.count_text(json.dumps([{"name": t["name"], "args": t["args"]} for t in tool_calls]))
+    return tokens
+
+  def count(self, messages: list) -> int:
+    return int(sum(self.count_message(m) for m in messages) * self.scale)
+
+  def calibrate(self, estimated: int, actual: int) -> None:
+    """Moves the scale towards the ratio of the provider's prompt token count to the estimate"""
+    if estimated > 0 and actual > 0:
+      self.scale = 0.7 * self.scale + 0.3 * (actual / (estimated / self.scale))
+
+def split_turns(messages: list) -> list:
+  """Groups messages into turns, each starting at a HumanMessage, so a tool call is never separated from its results"""
+  turns = []
+  for message in messages:
+    if isinstance(message, HumanMessage) or not turns:
+      turns.append([])
+    turns[-1].append(message)
+  return turns
+
+def tool_digest(message: ToolMessage, counter: TokenCounter, max_chars: int) -> ToolMessage:
+  """Replaces the content of an old tool result with its beginning and the size of what was dropped"""
+  text = re.sub(r"\s+", " ", str(message.content)).strip()
+  name = getattr(message, "tool_name", None) or message.name or "tool"
+  kept = f"{text[:max_chars]} ... " if max_chars else ""
+  digest = f"{kept}[{name} output shortened from {counter.count_text(str(message.content))} tokens]"
+  return ToolMessage(
+    content=digest,
+    id=message.id,
+    tool_call_id=message.tool_call_id,
+    tool_name=name,
+    additional_kwargs={**message.additional_kwargs, "digest": True}
+  )
+
+def render_conversation(messages: list, max_chars: int) -> str:
+  lines = []
+  for message in messages:
+    if isinstance(message, SystemMessage):
+      continue
+    content = message.content if isinstance(message.content, str) else json.dumps(message.content)
+    if isinstance(message, ToolMessage):
+      content = content[:max_chars]
+    elif getattr(message, "tool_calls", None):
+      content = f"{content} (called: {', '.join(t['name'] for t in message.tool_calls)})"
+    lines.append(f"{message.type}: {content}")
+  return "\n".join(lines)
+
+class ContextManager:
+  """Keeps the prompt of every LLM call within a token budget. Tool results of earlier turns are
+  replaced by short digests, and when the prompt is still over budget the oldest turns are folded
+  into a rolling summary (or dropped, with the "trim" strategy). As a last resort the largest tool
+  results of the current turn are shortened."""
+
+  def __init__(self, counter: TokenCounter, llm=None, budget: int = None, strategy: str = None, keep_turns: int = None, digest_chars: int = None):
+    self.counter = counter
+    self.llm = llm
+    self.budget = budget if budget is not None else int(os.getenv("AIDA_CONTEXT_BUDGET", "8000"))
+    self.strategy = strategy or os.getenv("AIDA_CONTEXT_STRATEGY", "summarize")
+    self.keep_turns = keep_turns if keep_turns is not None else int(os.getenv("AIDA_CONTEXT_KEEP_TURNS", "2"))
+    # 0 keeps only the size of old tool results
+    self.digest_chars = digest_chars if digest_chars is not None else int(os.getenv("AIDA_TOOL_DIGEST_CHARS", "500"))
+    # Once over budget, old turns are folded until the prompt is back under this share of it,
+    # so the summary is not rewritten on every following turn
+    self.target = 0.6
+
+  def prompt_tokens(self, system: str, summary: str, messages: list) -> int:
+    return self.counter.count([SystemMessage(content=system_prompt(system, summary))] + messages)
+
+  def summarize(self, summary: str, messages: list) -> tuple:
+    """Returns the new summary and the prompt tokens of the model call that wrote it"""
+    words = max(50, int(self.budget * self.target * 0.25))
+    existing = f"Fold it into the existing summary:\n{summary}\n\n" if summary else ""
+    prompt = SUMMARY_PROMPT.format(existing=existing, words=words, conversation=render_conversation(messages, self.digest_chars))
+    # A model call of its own, counted with the LLM calls and prompt tokens of the turn
+    with span("llm.summary") as stage:
+      response = self.llm.invoke([HumanMessage(content=prompt)], config={"tags": ["aida-summary"]})
+      usage = getattr(response, "usage_metadata", None) or {}
+      prompt_tokens = usage.get("input_tokens") or self.counter.count_text(prompt)
+      stage.set("prompt_tokens", prompt_tokens)
+      stage.set("output_tokens", usage.get("output_tokens", 0))
+    return str(response.content).strip(), prompt_tokens
+
+  def manage(self, system: str, summary: str, messages: list) -> dict:
+    """
+    Returns the state update that brings the conversation within the budget
+    Output:
+      update : dict - {"messages": replacements and removals, "summary": new summary, "prompt_tokens": prompt tokens
+        of the summary call} (empty if nothing changed)
+    """
+    replaced = {}
+    turns = split_turns(messages)
+    history, current = turns[:-1], turns[-1] if turns else []
+
+    # Tool results of earlier turns were already used to answer, only a digest is kept
+    for turn in history:
+      for i, message in enumerate(turn):
+        if isinstance(message, ToolMessage) and not message.additional_kwargs.get("digest") and len(str(message.content)) > self.digest_chars:
+          turn[i] = tool_digest(message, self.counter, self.digest_chars)
+          replaced[message.id] = turn[i]
+
+    def tokens() -> int:
+      return self.prompt_tokens(system, summary, [m for turn in history for m in turn] + current)
+
+    new_summary = None
+    summary_tokens = 0
+    if history and tokens() > self.budget:
+      target = int(self.budget * self.target)
+      folded = []
+      while history and tokens() > target:
+        # The most recent turns are kept unless the prompt does not fit without them
+        if len(history) <= self.keep_turns and tokens() <= self.budget:
+          break
+        folded.extend(history.pop(0))
+      for message in folded:
+        replaced[message.id] = RemoveMessage(id=message.id)
+      new_summary = summary
+      if self.strategy == "summarize" and self.llm is not None:
+        try:
+          new_summary, summary_tokens = self.summarize(summary, folded)
+        except Exception:
+          # The turns are dropped without a summary rather than failing the turn
+          pass
+      summary = new_summary
+
+    # The current turn alone can be over budget (several whole pages scraped), its largest tool results are cut
+    excess = tokens() - self.budget
+    tool_results = sorted((m for m in current if isinstance(m, ToolMessage)), key=lambda m: len(str(m.content)), reverse=True)
+    for message in tool_results:
+      if excess <= 0:
+        break
+      content = str(message.content)
+      size = self.counter.count_text(content) * self.counter.scale
+      keep_chars = max(self.digest_chars, int(len(content) * (1 - (excess + 50) / max(size, 1))))
+      if keep_chars >= len(content):
+        continue
+      shortened = ToolMessage(
+        content=f"{content[:keep_chars]} ... [output cut to fit the context budget]",
+        id=message.id,
+        tool_call_id=message.tool_call_id,
+        tool_name=getattr(message, "tool_name", None) or message.name
+      )
+      excess -= size - self.counter.count_text(shortened.content) * self.counter.scale
+      replaced[message.id] = shortened
+
+    update = {}
+    if replaced:
+      update["messages"] = list(replaced.values())
+    if new_summary is not None:
+      update["summary"] = new_summary
+    if summary_tokens:
+      update["prompt_tokens"] = summary_tokens
+    return update
+
+def system_prompt(system: str, summary: str) -> str:
+  if not summary:
+    return system or ""
+  return f"{system or ''}\n\nSummary of the earlier conversation:\n{summary}"
@@ -0,0 +1,382 @@
+from email.utils import parsedate_to_datetime
+from utils.tracing import current_span
+import threading
+import asyncio
+import random
+import httpx
+import json
+import time
+import os
+
+# Responses retried with backoff, 429 is the provider's rate limit, the others are transient failures
+RETRY_STATUSES: tuple = (429, 500, 502, 503, 504)
+# Connection failures retried with backoff
+RETRY_ERRORS: tuple = (httpx.ConnectError, httpx.RemoteProtocolError, httpx.ReadError)
+
+def get_rate_limits(value: str) -> dict:
+    """
+    Parses per model rate limits of the form "llama-3.3-70b-versatile=30/6000,qwen2.5:3b=0/0"
+    Args:
+        value (str): Comma separated model=requests_per_minute/tokens_per_minute pairs, 0 is unlimited
+    Returns:
+        dict: {model: (requests_per_minute, tokens_per_minute)}
+    """
+    limits = {}
+    for item in value.split(","):
+        if "=" in item:
+            model, limit = item.rsplit("=", 1)
+            rpm, _, tpm = limit.partition("/")
+            limits[model.strip()] = (int(rpm or 0), int(tpm or 0))
+    return limits
+
+def retry_after(response: httpx.Response) -> float:
+    """
+    Returns the delay a response asks for before the next request, or None
+    Args:
+        response (httpx.Response): The throttled or failed response
+    Returns:
+        float: Seconds from retry-after-ms or Retry-After (seconds or an HTTP date)
+    """
+    value = response.headers.get("retry-after-ms")
+    if value:
+        try:
+            return max(0.0, float(value) / 1000)
+        except ValueError:
+            pass
+    value = response.headers.get("retry-after")
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+class TokenBucket:
+    """
+    Token bucket holding up to `per_minute` units, refilled continuously at per_minute / 60 a second.
+    A request larger than the bucket waits for a full bucket instead of waiting forever.
+    """
+
+    def __init__(self, per_minute: int):
+        self.capacity = float(per_minute)
+        self.rate = per_minute / 60.0
+        self.level = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def _refill(self, now: float) -> None:
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def reserve(self, amount: float) -> float:
+        """
+        Takes `amount` units from the bucket, going into debt if it is short
+        Returns:
+            float: Seconds the caller has to wait before its request may go out
+        """
+        amount = min(float(amount), self.capacity)
+        with self.lock:
+            self._refill(time.monotonic())
+            self.level -= amount
+            return max(0.0, -self.level / self.rate)
+
+    def sync(self, remaining: float) -> None:
+        """
+        Lowers the bucket to what the provider reports as remaining, e.g. after other clients used the same key
+        """
+        with self.lock:
+            self._refill(time.monotonic())
+            self.level = min(self.level, float(remaining))
+
+    def pause(self, seconds: float) -> None:
+        """
+        Empties the bucket for `seconds`, so every caller waits after the provider throttled one of them
+        """
+        with self.lock:
+            self._refill(time.monotonic())
+            self.level = min(self.level, -seconds * self.rate)
+
+class RateLimiter:
+    """
+    Client side limit of the requests and tokens per minute sent to one provider model
+    """
+
+    def __init__(self, requests_per_minute: int = 0, tokens_per_minute: int = 0):
+        self.requests = TokenBucket(requests_per_minute) if requests_per_minute > 0 else None
+        self.tokens = TokenBucket(tokens_per_minute) if tokens_per_minute > 0 else None
+
+    def reserve(self, tokens: int) -> float:
+        """
+        Reserves a request of about `tokens` tokens without waiting
+        Returns:
+            float: Seconds the caller has to wait before sending it
+        """
+        wait = 0.0
+        if self.requests is not None:
+            wait = max(wait, self.requests.reserve(1))
+        if self.tokens is not None:
+            wait = max(wait, self.tokens.reserve(tokens))
+        return wait
+
+    def acquire(self, tokens: int) -> float:
+        """
+        Blocks until a request of about `tokens` tokens may be sent
+        Returns:
+            float: Seconds waited
+        """
+        wait = self.reserve(tokens)
+        if wait > 0:
+            time.sleep(wait)
+        return wait
+
+    def observe(self, response: httpx.Response) -> None:
+        """
+        Follows the x-ratelimit-remaining-* headers of Groq and OpenAI compatible providers
+        """
+        for bucket, header in ((self.requests, "x-ratelimit-remaining-requests"), (self.tokens, "x-ratelimit-remaining-tokens")):
+            value = response.headers.get(header)
+            if bucket is not None and value:
+                try:
+                    bucket.sync(float(value))
+                except ValueError:
+                    pass
+
+    def pause(self, seconds: float) -> None:
+        for bucket in (self.requests, self.tokens):
+            if bucket is not None:
+                bucket.pause(seconds)
+
+def _request_body(content: bytes) -> dict:
+    try:
+        body = json.loads(content or b"{}")
+    except ValueError:
+        return {}
+    return body if isinstance(body, dict) else {}
+
+def estimate_tokens(body: dict) -> int:
+    """
+    Estimates the tokens a chat completion request counts against the token limit: the prompt
+    (about 4 characters a token) and the completion it allows for
+    Args:
+        body (dict): The JSON body of the request
+    """
+    prompt = len(json.dumps(body.get("messages", ""))) // 4
+    completion = body.get("max_completion_tokens") or body.get("max_tokens") or (body.get("options") or {}).get("num_predict") or 0
+    return max(1, prompt + int(completion))
+
+class ProviderTransport(httpx.BaseTransport):
+    """
+    HTTP transport shared by all the clients of one LLM provider. It keeps a pool of keep-alive connections,
+    limits the requests and tokens per minute of every model, and retries throttled and failed requests with
+    jittered exponential backoff, waiting at least as long as the provider's Retry-After.
+    """
+
+    def __init__(self, provider: str, max_connections: int = None, keepalive: float = None, max_retries: int = None,
+                 backoff_base: float = None, backoff_max: float = None, requests_per_minute: int = None,
+                 tokens_per_minute: int = None, model_limits: dict = None):
+        """
+        Args:
+            provider (str): groq, azure or ollama, only used in the statistics
+            max_connections (int): Connections kept open to the provider
+            keepalive (float): Seconds an idle connection is kept
+            max_retries (int): Retries of a throttled or failed request
+            backoff_base (float), backoff_max (float): First and longest backoff (s), the delay doubles each retry
+            requests_per_minute (int), tokens_per_minute (int): Limits of every model, 0 is unlimited
+            model_limits (dict): {model: (requests_per_minute, tokens_per_minute)} overriding the defaults
+        """
+        self.provider = provider
+        max_connections = max_connections or int(os.getenv("AIDA_LLM_POOL_SIZE", "20"))
+        keepalive = keepalive if keepalive is not None else float(os.getenv("AIDA_LLM_KEEPALIVE", "60"))
+        self.limits = httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections, keepalive_expiry=keepalive)
+        self.transport = httpx.HTTPTransport(limits=self.limits)
+        self.max_retries = max_retries if max_retries is not None else int(os.getenv("AIDA_LLM_MAX_RETRIES", "4"))
+        self.backoff_base = backoff_base if backoff_base is not None else float(os.getenv("AIDA_LLM_BACKOFF_BASE", "0.5"))
+        self.backoff_max = backoff_max if backoff_max is not None else float(os.getenv("AIDA_LLM_BACKOFF_MAX", "30"))
+        self.requests_per_minute = requests_per_minute if requests_per_minute is not None else int(os.getenv("AIDA_LLM_RPM", "0"))
+        self.tokens_per_minute = tokens_per_minute if tokens_per_minute is not None else int(os.getenv("AIDA_LLM_TPM", "0"))
+        self.model_limits = model_limits if model_limits is not None else get_rate_limits(os.getenv("AIDA_LLM_RATE_LIMITS", ""))
+        self.limiters: dict = {}
+        self.lock = threading.Lock()
+        self.stats = {"requests": 0, "retries": 0, "throttled": 0, "failed": 0, "wait_seconds": 0.0, "backoff_seconds": 0.0}
+
+    def limiter(self, model: str) -> RateLimiter:
+        with self.lock:
+            if model not in self.limiters:
+                rpm, tpm = self.model_limits.get(model, (self.requests_per_minute, self.tokens_per_minute))
+                self.limiters[model] = RateLimiter(rpm, tpm)
+            return self.limiters[model]
+
+    def _count(self, key: str, value: float = 1) -> None:
+        with self.lock:
+            self.stats[key] += value
+
+    def backoff(self, attempt: int, response: httpx.Response = None) -> float:
+        """
+        Delay before retry number `attempt` (from 0): full jitter over an exponentially growing window,
+        never shorter than the Retry-After of the response
+        """
+        delay = random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+        requested = retry_after(response) if response is not None else None
+        if requested is not None:
+            delay = max(delay, min(requested, self.backoff_max))
+        return delay
+
+    def _start(self, content: bytes) -> tuple:
+        body = _request_body(content)
+        return self.limiter(str(body.get("model", ""))), estimate_tokens(body)
+
+    def _waited(self, waited: float) -> None:
+        self._count("requests")
+        if waited:
+            self._count("wait_seconds", waited)
+            current_span().add("rate_limit_wait", waited)
+
+    def _retry_delay(self, limiter: RateLimiter, attempt: int, response: httpx.Response = None) -> float:
+        """
+        Returns the backoff before the next attempt, or None when the response (or the connection error
+        when there is no response) is passed on to the caller
+        """
+        if response is not None:
+            limiter.observe(response)
+            if response.status_code not in RETRY_STATUSES:
+                return None
+            if response.status_code == 429:
+                self._count("throttled")
+        if attempt >= self.max_retries:
+            self._count("failed")
+            return None
+        delay = self.backoff(attempt, response)
+        if response is not None and response.status_code == 429:
+            # The other callers of the model back off as well instead of running into the same limit
+            limiter.pause(delay)
+        self._count("retries")
+        self._count("backoff_seconds", delay)
+        current_span().add("retries")
+        return delay
+
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        limiter, tokens = self._start(request.read())
+        attempt = 0
+        while True:
+            self._waited(limiter.acquire(tokens))
+            try:
+                response = self.transport.handle_request(request)
+            except RETRY_ERRORS:
+                delay = self._retry_delay(limiter, attempt)
+                if delay is None:
+                    raise
+            else:
+                delay = self._retry_delay(limiter, attempt, response)
+                if delay is None:
+                    return response
+                response.close()
+            attempt += 1
+            time.sleep(delay)
+
+    def close(self) -> None:
+        self.transport.close()
+
+class AsyncProviderTransport(httpx.AsyncBaseTransport):
+    """
+    Async counterpart of ProviderTransport for the async clients of the provider SDKs (ainvoke, astream).
+    It has its own pool of async connections but shares the rate limiters, retry settings and statistics
+    of the provider's transport, so sync and async requests count against the same limits.
+    The pool belongs to the event loop of its first request, like any httpx.AsyncClient.
+    """
+
+    def __init__(self, shared: ProviderTransport):
+        self.shared = shared
+        self.transport = httpx.AsyncHTTPTransport(limits=shared.limits)
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        shared = self.shared
+        limiter, tokens = shared._start(await request.aread())
+        attempt = 0
+        while True:
+            wait = limiter.reserve(tokens)
+            if wait > 0:
+                await asyncio.sleep(wait)
+            shared._waited(wait)
+            try:
+                response = await self.transport.handle_async_request(request)
+            except RETRY_ERRORS:
+                delay = shared._retry_delay(limiter, attempt)
+                if delay is None:
+                    raise
+            else:
+                delay = shared._retry_delay(limiter, attempt, response)
+                if delay is None:
+                    return response
+                await response.aclose()
+            attempt += 1
+            await asyncio.sleep(delay)
+
+    async def aclose(self) -> None:
+        await self.transport.aclose()
+
+_transports: dict = {}
+_async_transports: dict = {}
+_transports_lock = threading.Lock()
+
+def get_transport(provider: str) -> ProviderTransport:
+    """
+    Returns the process wide transport of a provider, so every session reuses its connections and limits
+    Args:
+        provider (str): groq, azure or ollama
+    Returns:
+        ProviderTransport: The shared transport
+    """
+    with _transports_lock:
+        if provider not in _transports:
+            _transports[provider] = ProviderTransport(provider)
+        return _transports[provider]
+
+def get_async_transport(provider: str) -> AsyncProviderTransport:
+    """
+    Returns the process wide async transport of a provider, sharing the limits of get_transport(provider)
+    Args:
+        provider (str): groq, azure or ollama
+    Returns:
+        AsyncProviderTransport: The shared async transport
+    """
+    shared = get_transport(provider)
+    with _transports_lock:
+        if provider not in _async_transports:
+            _async_transports[provider] = AsyncProviderTransport(shared)
+        return _async_transports[provider]
+
+def get_http_client(provider: str, timeout: float = None) -> httpx.Client:
+    """
+    Returns an HTTP client on the shared transport of a provider, for the provider SDKs that take an httpx.Client
+    Args:
+        provider (str): groq or azure
+        timeout (float): Request timeout (s)
+    Returns:
+        httpx.Client: Client whose requests go through the connection pool, rate limits and retries of the provider
+    """
+    timeout = timeout or float(os.getenv("AIDA_LLM_TIMEOUT", "120"))
+    return httpx.Client(transport=get_transport(provider), timeout=timeout)
+
+def get_async_http_client(provider: str, timeout: float = None) -> httpx.AsyncClient:
+    """
+    Returns an async HTTP client on the shared async transport of a provider, for the async clients of the SDKs
+    Args:
+        provider (str): groq or azure
+        timeout (float): Request timeout (s)
+    Returns:
+        httpx.AsyncClient: Client whose requests go through the rate limits and retries of the provider
+    """
+    timeout = timeout or float(os.getenv("AIDA_LLM_TIMEOUT", "120"))
+    return httpx.AsyncClient(transport=get_async_transport(provider), timeout=timeout)
+
+def llm_client_stats() -> dict:
+    """
+    Returns the request, retry and throttling counters of every provider used so far
+    """
+    with _transports_lock:
+        transports = dict(_transports)
+    return {provider: dict(transport.stats) for provider, transport in transports.items()}
@@ -0,0 +1,312 @@
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from langchain_core.messages import HumanMessage
+from utils.chat_util import _detect_document_query, _document_query_prompt, document_fast_path
+from utils.tracing import span, get_tracer
+from utils.llm_client import llm_client_stats
+from tools.RAG.Prefetch import prefetch
+from aiohttp import web, WSMsgType
+import threading
+import asyncio
+import json
+import time
+import uuid
+import os
+
+# Events of a turn buffered between the agent thread and the client, beyond it the agent waits for the client
+EVENT_QUEUE_SIZE: int = 256
+
+class Session:
+    """One conversation, a thread of the shared agent graph"""
+
+    def __init__(self, session_id: str):
+        self.id = session_id
+        self.thread_id = f"session-{session_id}"
+        self.busy = False
+        self.turns = 0
+        self.created_at = time.time()
+        self.last_used = self.created_at
+
+class AidaServer:
+    """
+    Serves many chat sessions from one process over HTTP (NDJSON streaming) and WebSocket.
+    All sessions share the compiled agent graph (one checkpointer, one thread per session), the warm
+    embedding model and the open vector stores. Turns run in a pool of `max_turns` threads. Up to
+    `max_queued` more turns wait for a free slot, further turns are rejected with 503 and Retry-After,
+    so load never builds an unbounded queue. The events of a turn pass through a bounded queue, a slow
+    client holds up its own turn instead of making the server buffer it.
+    """
+
+    def __init__(self, agent, turn_events, max_turns: int = None, max_queued: int = None, max_sessions: int = None, session_ttl: float = None):
+        """
+        Args:
+            agent: The Agent of aida-agent-v-0.1.1
+            turn_events (callable): turn_events of aida-agent-v-0.1.1, runs a turn and yields its events
+            max_turns (int): Turns running at the same time
+            max_queued (int): Turns waiting for a slot before new ones are rejected
+            max_sessions (int): Open sessions before new ones are rejected
+            session_ttl (float): Seconds an idle session is kept
+        """
+        self.agent = agent
+        self.turn_events = turn_events
+        self.max_turns = max_turns or int(os.getenv("AIDA_SERVER_MAX_TURNS", "8"))
+        self.max_queued = max_queued if max_queued is not None else int(os.getenv("AIDA_SERVER_MAX_QUEUED", "32"))
+        self.max_sessions = max_sessions or int(os.getenv("AIDA_SERVER_MAX_SESSIONS", "1000"))
+        self.session_ttl = session_ttl or float(os.getenv("AIDA_SERVER_SESSION_TTL", "3600"))
+        self.sessions: dict = {}
+        self.pool = ThreadPoolExecutor(max_workers=self.max_turns, thread_name_prefix="aida-turn")
+        self.slots = asyncio.Semaphore(self.max_turns)
+        self.waiting = 0
+        self.running = 0
+        self.rejected = 0
+        self.turns = 0
+
+    def app(self) -> web.Application:
+        app = web.Application()
+        app.add_routes([
+            web.get("/health", self.health),
+            web.get("/stats", self.stats),
+            web.post("/sessions", self.create_session),
+            web.delete("/sessions/{session_id}", self.delete_session),
+            web.post("/sessions/{session_id}/messages", self.post_message),
+            web.get("/sessions/{session_id}/ws", self.websocket)
+        ])
+        app.on_startup.append(self._start_expiry)
+        app.on_cleanup.append(self._stop)
+        return app
+
+    async def _start_expiry(self, app: web.Application) -> None:
+        self.expiry = asyncio.create_task(self._expire_sessions())
+
+    async def _stop(self, app: web.Application) -> None:
+        self.expiry.cancel()
+        self.pool.shutdown(wait=False, cancel_futures=True)
+
+    async def _expire_sessions(self) -> None:
+        while True:
+            await asyncio.sleep(min(60.0, self.session_ttl))
+            now = time.time()
+            for session in [s for s in self.sessions.values() if not s.busy and now - s.last_used > self.session_ttl]:
+                self._drop(session)
+
+    def _drop(self, session: Session) -> None:
+        self.sessions.pop(session.id, None)
+        # The checkpoints of the session's thread are the only per session memory of the graph
+        delete_thread = getattr(self.agent.checkpointer, "delete_thread", None)
+        if delete_thread is not None:
+            delete_thread(session.thread_id)
+
+    @staticmethod
+    def _error(status: int, message: str, **headers) -> web.HTTPException:
+        errors = {404: web.HTTPNotFound, 400: web.HTTPBadRequest, 409: web.HTTPConflict, 503: web.HTTPServiceUnavailable}
+        return errors[status](text=json.dumps({"error": message}), content_type="application/json", headers=headers or None)
+
+    def _session(self, request: web.Request) -> Session:
+        session = self.sessions.get(request.match_info["session_id"])
+        if session is None:
+            raise self._error(404, "Unknown session")
+        return session
+
+    @staticmethod
+    def _prompt(data) -> tuple:
+        """
+        Builds the user prompt of a {"message", "filepath"?} request, like the chat loop does
+        Returns:
+            tuple: The prompt and the {"filepath", "query"} retrieved by the router, or None
+        """
+        if not isinstance(data, dict) or not str(data.get("message", "")).strip():
+            raise ValueError("Expected a JSON object with a \"message\"")
+        message = str(data["message"]).strip()
+        doc_info = (data["filepath"], message) if data.get("filepath") else _detect_document_query(message)
+        if not doc_info:
+            return message, None
+        # The document is indexed while the turn waits for a slot and for the first LLM call
+        prefetch(doc_info[0])
+        if document_fast_path():
+            return message, {"filepath": doc_info[0], "query": doc_info[1]}
+        return _document_query_prompt(*doc_info), None
+
+    def _admit(self, session: Session) -> None:
+        """
+        Reserves a place for a turn of the session, or raises 409 (the session is busy) or 503 (the server is full)
+        """
+        if session.busy:
+            raise self._error(409, "A turn of this session is already running")
+        if self.slots.locked() and self.waiting >= self.max_queued:
+            self.rejected += 1
+            raise self._error(503, "Too many turns in progress", **{"Retry-After": "1"})
+        session.busy = True
+        self.waiting += 1
+
+    async def _turn(self, session: Session, prompt: str, send, document: dict = None) -> None:
+        """
+        Runs an admitted turn once a slot is free, passing every event to the async callable `send`
+        """
+        try:
+            try:
+                await self.slots.acquire()
+            finally:
+                self.waiting -= 1
+            self.running += 1
+            try:
+                await self._run(session, prompt, send, document)
+            finally:
+                self.running -= 1
+                self.slots.release()
+        finally:
+            session.busy = False
+            session.turns += 1
+            session.last_used = time.time()
+            self.turns += 1
+
+    async def _run(self, session: Session, prompt: str, send, document: dict = None) -> None:
+        loop = asyncio.get_running_loop()
+        events: asyncio.Queue = asyncio.Queue(maxsize=EVENT_QUEUE_SIZE)
+        disconnected = threading.Event()
+        done = object()
+
+        def put(item) -> None:
+            # Blocks the agent thread while the queue is full. Once the client is gone the events are dropped
+            # and the turn runs to the end, so the conversation is never left with unanswered tool calls.
+            if disconnected.is_set():
+                return
+            future = asyncio.run_coroutine_threadsafe(events.put(item), loop)
+            while True:
+                try:
+                    future.result(timeout=0.1)
+                    return
+                except FutureTimeoutError:
+                    if disconnected.is_set():
+                        future.cancel()
+                        return
+
+        def produce() -> None:
+            config = {"configurable": {"thread_id": session.thread_id}}
+            st = time.perf_counter()
+            first_token = None
+            tokens, usage_tokens, prompt_tokens = 0, 0, []
+            try:
+                with span("turn", session=session.id) as turn:
+                    for event, value in self.turn_events(self.agent, [HumanMessage(content=prompt)], config, document):
+                        if event == "token":
+                            if first_token is None:
+                                first_token = time.perf_counter()
+                            tokens += 1
+                            put({"type": "token", "content": value})
+                        elif event == "output_tokens":
+                            usage_tokens += value
+                        elif event == "prompt_tokens":
+                            prompt_tokens.append(value)
+                        elif event == "tool_calls":
+                            put({"type": "tool_calls", "names": value})
+                        elif event == "tool_result":
+                            put({"type": "tool_result", "name": value})
+                    turn.set("llm_calls", len(prompt_tokens))
+                    turn.set("prompt_tokens", sum(prompt_tokens))
+                    turn.set("output_tokens", usage_tokens or tokens)
+                content = self.agent.graph.get_state(config).values["messages"][-1].content
+                put({
+                    "type": "done",
+                    "content": content,
+                    "latency": time.perf_counter() - st,
+                    "ttft": first_token - st if first_token is not None else None,
+                    "llm_calls": len(prompt_tokens),
+                    "prompt_tokens": sum(prompt_tokens),
+                    "output_tokens": usage_tokens or tokens
+                })
+            except Exception as e:
+                put({"type": "error", "error": f"{type(e).__name__}: {e}"})
+            finally:
+                put(done)
+
+        worker = loop.run_in_executor(self.pool, produce)
+        try:
+            await send({"type": "start", "session_id": session.id})
+            while True:
+                item = await events.get()
+                if item is done:
+                    break
+                await send(item)
+        finally:
+            disconnected.set()
+            # The slot is only released once the agent thread has finished the turn
+            await asyncio.shield(worker)
+
+    async def health(self, request: web.Request) -> web.Response:
+        return web.json_response({"status": "ok"})
+
+    async def stats(self, request: web.Request) -> web.Response:
+        return web.json_response({
+            "sessions": len(self.sessions),
+            "running": self.running,
+            "waiting": self.waiting,
+            "rejected": self.rejected,
+            "turns": self.turns,
+            "max_turns": self.max_turns,
+            "max_queued": self.max_queued,
+            "stages": get_tracer().metrics.summary(),
+            "llm": llm_client_stats(),
+            "checkpoints": self.agent.checkpointer.stats() if hasattr(self.agent.checkpointer, "stats") else None
+        }, dumps=lambda data: json.dumps(data, default=str))
+
+    async def create_session(self, request: web.Request) -> web.Response:
+        if len(self.sessions) >= self.max_sessions:
+            raise self._error(503, "Too many open sessions", **{"Retry-After": "60"})
+        session = Session(uuid.uuid4().hex)
+        self.sessions[session.id] = session
+        return web.json_response({"session_id": session.id}, status=201)
+
+    async def delete_session(self, request: web.Request) -> web.Response:
+        session = self._session(request)
+        if session.busy:
+            raise self._error(409, "A turn of this session is still running")
+        self._drop(session)
+        return web.Response(status=204)
+
+    async def post_message(self, request: web.Request) -> web.StreamResponse:
+        """
+        Runs a turn and streams its events as newline delimited JSON:
+        start, token, tool_calls, tool_result, then done (or error)
+        """
+        session = self._session(request)
+        try:
+            prompt, document = self._prompt(await request.json())
+        except ValueError as e:
+            raise self._error(400, str(e))
+        self._admit(session)
+        response = web.StreamResponse(headers={"Content-Type": "application/x-ndjson", "Cache-Control": "no-cache"})
+
+        async def send(event: dict) -> None:
+            if not response.prepared:
+                await response.prepare(request)
+            # write() waits while the client's socket buffer is full
+            await response.write((json.dumps(event) + "\n").encode("utf-8"))
+
+        try:
+            await self._turn(session, prompt, send, document)
+            await response.write_eof()
+        except ConnectionResetError:
+            # The client went away, the turn was still completed for the session
+            pass
+        return response
+
+    async def websocket(self, request: web.Request) -> web.WebSocketResponse:
+        """
+        Every {"message", "filepath"?} text message runs a turn, its events are sent back as JSON messages
+        """
+        session = self._session(request)
+        ws = web.WebSocketResponse(heartbeat=30)
+        await ws.prepare(request)
+        async for message in ws:
+            if message.type != WSMsgType.TEXT:
+                continue
+            try:
+                prompt, document = self._prompt(json.loads(message.data))
+                self._admit(session)
+            except ValueError as e:
+                await ws.send_json({"type": "error", "status": 400, "error": str(e)})
+                continue
+            except web.HTTPException as e:
+                await ws.send_json({"type": "error", "status": e.status, "error": json.loads(e.text)["error"]})
+                continue
+            await self._turn(session, prompt, ws.send_json, document)
+        return ws
@@ -0,0 +1,233 @@
+from langchain_core.messages import BaseMessage, HumanMessage, AIMessage, SystemMessage, messages_from_dict
+import sqlite3
+import threading
+import json
+import glob
+import time
+import re
+import os
+
+DEFAULT_SESSION_DB: str = os.path.join("chats", "sessions.db")
+
+MESSAGE_TYPES = {"human": HumanMessage, "ai": AIMessage, "system": SystemMessage}
+
+class SessionStore:
+    """
+    Saved chat sessions in one SQLite database: a sessions table, a messages table ordered by
+    position within the session, and an FTS5 index over the message contents for searching.
+    """
+
+    def __init__(self, path: str = None):
+        self.path = path or os.getenv("AIDA_SESSION_DB") or DEFAULT_SESSION_DB
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(self.path, check_same_thread=False)
+        with self.lock, self.conn:
+            self.conn.execute("PRAGMA journal_mode=WAL")
+            self.conn.execute("PRAGMA foreign_keys=ON")
+            self.conn.execute(
+                "CREATE TABLE IF NOT EXISTS sessions ("
+                "id INTEGER PRIMARY KEY, name TEXT NOT NULL UNIQUE, message_count INTEGER NOT NULL DEFAULT 0, "
+                "created_at REAL NOT NULL, updated_at REAL NOT NULL)"
+            )
+            self.conn.execute(
+                "CREATE TABLE IF NOT EXISTS messages ("
+                "id INTEGER PRIMARY KEY, session_id INTEGER NOT NULL REFERENCES sessions (id) ON DELETE CASCADE, "
+                "position INTEGER NOT NULL, role TEXT NOT NULL, content TEXT NOT NULL)"
+            )
+            self.conn.execute("CREATE UNIQUE INDEX IF NOT EXISTS messages_session_position ON messages (session_id, position)")
+            self.fts = self._create_fts()
+
+    def _create_fts(self) -> bool:
+        # The index is kept in sync by triggers, so every write path updates it in the same transaction
+        try:
+            self.conn.execute("CREATE VIRTUAL TABLE IF NOT EXISTS messages_fts USING fts5(content, content='messages', content_rowid='id')")
+        except sqlite3.OperationalError:
+            # SQLite built without FTS5, search falls back to LIKE
+            return False
+        self.conn.execute(
+            "CREATE TRIGGER IF NOT EXISTS messages_ai AFTER INSERT ON messages BEGIN "
+            "INSERT INTO messages_fts (rowid, content) VALUES (new.id, new.content); END"
+        )
+        self.conn.execute(
+            "CREATE TRIGGER IF NOT EXISTS messages_ad AFTER DELETE ON messages BEGIN "
+            "INSERT INTO messages_fts (messages_fts, rowid, content) VALUES ('delete', old.id, old.content); END"
+        )
+        return True
+
+    def save(self, name: str, messages: list, prefix: tuple = None) -> int:
+        """
+        Saves the messages under the session name in one transaction, replacing a session of the same name
+        Args:
+            name (str): Name of the session
+            messages (list): The chat messages, in order
+            prefix (tuple): (session name, count) of the first messages of a saved session that precede the
+                messages, copied within the database instead of being read back
+        Returns:
+            int: Number of messages saved
+        """
+        now = time.time()
+        rows = [
+            (message.type, message.content if isinstance(message.content, str) else json.dumps(message.content))
+            for message in messages if message.type in MESSAGE_TYPES
+        ]
+        source, count = prefix or (None, 0)
+        with self.lock, self.conn:
+            source_id = self.conn.execute("SELECT id FROM sessions WHERE name = ?", (source,)).fetchone() if source else None
+            if source_id is None:
+                count = 0
+            self.conn.execute(
+                "INSERT INTO sessions (name, message_count, created_at, updated_at) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT (name) DO UPDATE SET message_count = excluded.message_count, updated_at = excluded.updated_at",
+                (name, count + len(rows), now, now)
+            )
+            session_id = self.conn.execute("SELECT id FROM sessions WHERE name = ?", (name,)).fetchone()[0]
+            if source_id is not None and source_id[0] == session_id:
+                # Saved over the loaded session, its first messages stay in place
+                self.conn.execute("DELETE FROM messages WHERE session_id = ? AND position >= ?", (session_id, count))
+            else:
+                self.conn.execute("DELETE FROM messages WHERE session_id = ?", (session_id,))
+                if source_id is not None:
+                    self.conn.execute(
+                        "INSERT INTO messages (session_id, position, role, content) "
+                        "SELECT ?, position, role, content FROM messages WHERE session_id = ? AND position < ? ORDER BY position",
+                        (session_id, source_id[0], count)
+                    )
+            self.conn.executemany(
+                "INSERT INTO messages (session_id, position, role, content) VALUES (?, ?, ?, ?)",
+                [(session_id, count + position, role, content) for position, (role, content) in enumerate(rows)]
+            )
+        return count + len(rows)
+
+    def delete(self, name: str) -> None:
+        with self.lock, self.conn:
+            self.conn.execute("DELETE FROM sessions WHERE name = ?", (name,))
+
+    def list_sessions(self, limit: int = 50, offset: int = 0) -> list:
+        """
+        Returns (name, message count, updated at) of the saved sessions, most recently saved first
+        """
+        with self.lock:
+            return self.conn.execute(
+                "SELECT name, message_count, updated_at FROM sessions ORDER BY updated_at DESC LIMIT ? OFFSET ?",
+                (limit, offset)
+            ).fetchall()
+
+    def iter_messages(self, name: str, page_size: int = 200):
+        """
+        Yields the messages of a session page by page, so a long session is never read at once
+        Args:
+            name (str): Name of the session
+            page_size (int): Number of messages per page
+        Yields:
+            list: The next page of messages
+        """
+        position = -1
+        while True:
+            with self.lock:
+                rows = self.conn.execute(
+                    "SELECT m.position, m.role, m.content FROM messages m JOIN sessions s ON s.id = m.session_id "
+                    "WHERE s.name = ? AND m.position > ? ORDER BY m.position LIMIT ?",
+                    (name, position, page_size)
+                ).fetchall()
+            if not rows:
+                return
+            yield [MESSAGE_TYPES[role](content=content) for _, role, content in rows]
+            position = rows[-1][0]
+
+    def page(self, name: str, before: int = None, page_size: int = 200) -> tuple:
+        """
+        Returns the last page of a session's messages, or the page before a position for loading older messages on demand
+        Args:
+            name (str): Name of the session
+            before (int): Position of the first message already loaded, None for the end of the session
+            page_size (int): Number of messages per page
+        Returns:
+            tuple: (messages in order, position of the first message), the position is 0 once the session start is reached
+        """
+        condition = "" if before is None else "AND m.position < ? "
+        with self.lock:
+            rows = self.conn.execute(
+                "SELECT m.position, m.role, m.content FROM messages m JOIN sessions s ON s.id = m.session_id "
+                f"WHERE s.name = ? {condition}ORDER BY m.position DESC LIMIT ?",
+                [name] + ([] if before is None else [before]) + [page_size]
+            ).fetchall()
+        rows.reverse()
+        return [MESSAGE_TYPES[role](content=content) for _, role, content in rows], rows[0][0] if rows else 0
+
+    def search(self, query: str, limit: int = 10) -> list:
+        """
+        Finds the saved sessions whose messages match the query
+        Args:
+            query (str): Words to search for
+            limit (int): Maximum number of results
+        Returns:
+            list: (session name, role, snippet) of the best matching message of each session, best first
+        """
+        words = re.findall(r"\w+", query)
+        if not words:
+            return []
+        with self.lock:
+            if self.fts:
+                # Each word is quoted so user input is never parsed as FTS5 query syntax
+                match = " ".join(f'"{word}"' for word in words)
+                rows = self.conn.execute(
+                    "SELECT s.name, m.role, snippet(messages_fts, 0, '[', ']', '...', 12), bm25(messages_fts) AS rank "
+                    "FROM messages_fts JOIN messages m ON m.id = messages_fts.rowid JOIN sessions s ON s.id = m.session_id "
+                    "WHERE messages_fts MATCH ? ORDER BY rank LIMIT ?",
+                    (match, limit * 10)
+                ).fetchall()
+            else:
+                conditions = " AND ".join("m.content LIKE ?" for _ in words)
+                rows = self.conn.execute(
+                    "SELECT s.name, m.role, substr(m.content, 1, 120), 0 FROM messages m JOIN sessions s ON s.id = m.session_id "
+                    f"WHERE {conditions} ORDER BY s.updated_at DESC LIMIT ?",
+                    [f"%{word}%" for word in words] + [limit * 10]
+                ).fetchall()
+        results, seen = [], set()
+        for name, role, snippet, _ in rows:
+            if name not in seen:
+                seen.add(name)
+                results.append((name, role, snippet))
+        return results[:limit]
+
+    def import_legacy(self, chats_dir: str = "chats") -> int:
+        """
+        Imports chats saved by older versions (one chats/chat_<name>.db file per chat) that are not in the store yet
+        Args:
+            chats_dir (str): Directory of the old chat files
+        Returns:
+            int: Number of imported sessions
+        """
+        imported = 0
+        for path in sorted(glob.glob(os.path.join(chats_dir, "chat_*.db"))):
+            name = os.path.splitext(os.path.basename(path))[0][len("chat_"):]
+            with self.lock:
+                exists = self.conn.execute("SELECT 1 FROM sessions WHERE name = ?", (name,)).fetchone()
+            if exists:
+                continue
+            try:
+                legacy = sqlite3.connect(path)
+                try:
+                    rows = legacy.execute("SELECT message FROM message_store ORDER BY id").fetchall()
+                finally:
+                    legacy.close()
+                messages = messages_from_dict([json.loads(row[0]) for row in rows])
+            except (sqlite3.Error, ValueError, KeyError):
+                continue
+            self.save(name, messages)
+            imported += 1
+        return imported
+
+_session_store = None
+_session_store_lock = threading.Lock()
+
+def get_session_store() -> SessionStore:
+    """
+    Returns the process wide session store, opening it on first use
+    """
+    global _session_store
+    with _session_store_lock:
+        if _session_store is None:
+            _session_store = SessionStore()
+        return _session_store
@@ -0,0 +1,28 @@
+import threading
+import os
+
+_client = None
+_client_lock = threading.Lock()
+
+def get_tavily_client():
+    """
+    Returns the process wide Tavily client, importing and creating it on first use
+    Returns:
+        TavilyClient: Client shared by the WebSearch and WebsiteScraper tools
+    """
+    global _client
+    with _client_lock:
+        if _client is None:
+            from tavily import TavilyClient
+            _client = TavilyClient(api_key=os.getenv("TAVILY_API_KEY"))
+        return _client
+
+def set_tavily_client(client) -> None:
+    """
+    Replaces the shared Tavily client, e.g. with a local fake for tests and benchmarks
+    Args:
+        client: Object providing get_search_context and extract
+    """
+    global _client
+    with _client_lock:
+        _client = client
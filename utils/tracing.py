@@ -0,0 +1,239 @@
+from collections import deque
+from contextlib import contextmanager
+import contextvars
+import threading
+import json
+import math
+import time
+import uuid
+import os
+
+# The JSONL sink is off unless AIDA_TRACE_FILE is set, e.g. to traces/aida_trace.jsonl
+DEFAULT_TRACE_FILE: str = ""
+# Spans of a model call: the agent's LLM node and the rolling summary of the context manager
+LLM_SPANS: tuple = ("llm", "llm.summary")
+
+class Span:
+    """
+    One timed stage. Spans nest through a context variable, so a span opened inside another one
+    (in the same thread, or in a thread started with the copied context) becomes its child.
+    """
+
+    def __init__(self, name: str, parent=None, attributes: dict = None):
+        self.name = name
+        self.trace_id = parent.trace_id if parent else uuid.uuid4().hex
+        self.span_id = uuid.uuid4().hex[:16]
+        self.parent_id = parent.span_id if parent else None
+        self.attributes = dict(attributes or {})
+        self.start = time.time()
+        self.duration = None
+        self.error = None
+
+    def set(self, key: str, value) -> None:
+        self.attributes[key] = value
+
+    def add(self, key: str, value: float = 1) -> None:
+        self.attributes[key] = self.attributes.get(key, 0) + value
+
+    def to_dict(self) -> dict:
+        return {
+            "name": self.name,
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "start": self.start,
+            "duration": self.duration,
+            "attributes": self.attributes,
+            "error": self.error
+        }
+
+class _NoSpan:
+    """Stands in for the current span when there is none, so instrumented code never checks"""
+
+    def set(self, key: str, value) -> None:
+        pass
+
+    def add(self, key: str, value: float = 1) -> None:
+        pass
+
+_NO_SPAN = _NoSpan()
+_current: contextvars.ContextVar = contextvars.ContextVar("aida_span", default=None)
+_collector: contextvars.ContextVar = contextvars.ContextVar("aida_span_collector", default=None)
+
+class Metrics:
+    """
+    Rolling window of the last `window` spans of each stage, for latency percentiles and attribute totals
+    """
+
+    def __init__(self, window: int = None):
+        self.window = window or int(os.getenv("AIDA_STATS_WINDOW", "500"))
+        self.lock = threading.Lock()
+        self.stages: dict = {}
+
+    def record(self, span: Span) -> None:
+        with self.lock:
+            if span.name not in self.stages:
+                self.stages[span.name] = deque(maxlen=self.window)
+            self.stages[span.name].append((span.duration, span.attributes))
+
+    def summary(self) -> dict:
+        """
+        Returns {stage: {"count", "p50", "p95", "p99", "max", "totals"}} over the window, durations in seconds.
+        Numeric attributes are summed, boolean ones counted as true/total (e.g. cache hits).
+        """
+        with self.lock:
+            stages = {name: list(entries) for name, entries in self.stages.items()}
+        result = {}
+        for name, entries in stages.items():
+            durations = sorted(duration for duration, _ in entries)
+            totals: dict = {}
+            for _, attributes in entries:
+                for key, value in attributes.items():
+                    if isinstance(value, bool):
+                        hits, seen = totals.get(key, (0, 0))
+                        totals[key] = (hits + value, seen + 1)
+                    elif isinstance(value, (int, float)):
+                        totals[key] = totals.get(key, 0) + value
+            result[name] = {
+                "count": len(durations),
+                "p50": percentile(durations, 50),
+                "p95": percentile(durations, 95),
+                "p99": percentile(durations, 99),
+                "max": durations[-1],
+                "totals": totals
+            }
+        return result
+
+def percentile(ordered: list, p: float) -> float:
+    """Nearest rank percentile of an already sorted list"""
+    if not ordered:
+        return 0.0
+    return ordered[min(len(ordered) - 1, max(0, math.ceil(p / 100 * len(ordered)) - 1))]
+
+class Tracer:
+    """
+    Records finished spans into the rolling metrics, appends them to a JSONL file and, when enabled,
+    mirrors them to OpenTelemetry. The file is rotated to <path>.1 when it reaches max_mb.
+    """
+
+    def __init__(self, path: str = None, otel: str = None, max_mb: float = None):
+        self.path = path if path is not None else os.getenv("AIDA_TRACE_FILE", DEFAULT_TRACE_FILE)
+        # 0 never rotates the file
+        self.max_bytes = int((max_mb if max_mb is not None else float(os.getenv("AIDA_TRACE_MAX_MB", "50"))) * 1024 * 1024)
+        self.metrics = Metrics()
+        self.lock = threading.Lock()
+        self.file = None
+        self.size = 0
+        self.otel_tracer = self._otel_tracer(otel if otel is not None else os.getenv("AIDA_OTEL_EXPORTER", ""))
+
+    def _otel_tracer(self, exporter: str):
+        # OpenTelemetry is optional, it is only imported when an exporter is configured
+        if not exporter:
+            return None
+        try:
+            from opentelemetry.sdk.trace import TracerProvider
+            from opentelemetry.sdk.trace.export import BatchSpanProcessor, ConsoleSpanExporter
+            if exporter == "otlp":
+                from opentelemetry.exporter.otlp.proto.http.trace_exporter import OTLPSpanExporter
+                span_exporter = OTLPSpanExporter()
+            else:
+                span_exporter = ConsoleSpanExporter()
+        except ImportError:
+            return None
+        provider = TracerProvider()
+        provider.add_span_processor(BatchSpanProcessor(span_exporter))
+        return provider.get_tracer("aida")
+
+    def export(self, span: Span) -> None:
+        self.metrics.record(span)
+        if not self.path:
+            return
+        line = json.dumps(span.to_dict(), default=str)
+        with self.lock:
+            if self.file is None:
+                os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+                self.file = open(self.path, "a", encoding="utf-8")
+                self.size = self.file.tell()
+            self.file.write(line + "\n")
+            self.file.flush()
+            self.size += len(line) + 1
+            if self.max_bytes and self.size >= self.max_bytes:
+                # Only the previous file is kept, so the traces never take more than twice max_mb
+                self.file.close()
+                self.file = None
+                os.replace(self.path, self.path + ".1")
+
+_tracer = None
+_tracer_lock = threading.Lock()
+
+def get_tracer() -> Tracer:
+    """
+    Returns the process wide tracer, created on first use so the settings are read after the .env file is loaded
+    """
+    global _tracer
+    with _tracer_lock:
+        if _tracer is None:
+            _tracer = Tracer()
+        return _tracer
+
+def current_span():
+    """
+    Returns the innermost open span of the current context, or a no-op stand-in
+    """
+    return _current.get() or _NO_SPAN
+
+@contextmanager
+def span(name: str, **attributes):
+    """
+    Times the enclosed block as a stage of the current trace
+    Args:
+        name (str): Name of the stage, e.g. "llm" or "rag.search"
+        **attributes: Initial attributes, more can be set on the yielded span
+    Yields:
+        Span: The open span
+    """
+    tracer = get_tracer()
+    current = Span(name, _current.get(), attributes)
+    token = _current.set(current)
+    otel_span = tracer.otel_tracer.start_as_current_span(name) if tracer.otel_tracer else None
+    otel = otel_span.__enter__() if otel_span else None
+    st = time.perf_counter()
+    try:
+        yield current
+    except BaseException as e:
+        current.error = f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        current.duration = time.perf_counter() - st
+        _current.reset(token)
+        if otel_span:
+            for key, value in current.attributes.items():
+                if isinstance(value, (str, bool, int, float)):
+                    otel.set_attribute(key, value)
+            otel_span.__exit__(None, None, None)
+        tracer.export(current)
+        collector = _collector.get()
+        if collector is not None:
+            collector.append(current)
+
+@contextmanager
+def collect_spans():
+    """
+    Collects the spans finished inside the block, including those of threads started with a copy
+    of the context (e.g. the tools of a turn), so one run can report its own stage timings
+    Yields:
+        list: The finished spans, in the order they finished
+    """
+    spans: list = []
+    token = _collector.set(spans)
+    try:
+        yield spans
+    finally:
+        _collector.reset(token)
+
+def traced_thread(target, **kwargs) -> threading.Thread:
+    """
+    Creates a thread that runs in a copy of the current context, so its spans join the current trace
+    """
+    context = contextvars.copy_context()
+    return threading.Thread(target=context.run, args=(target,), **kwargs)
@@ -0,0 +1,178 @@
+import sqlite3
+import threading
+import hashlib
+import json
+import time
+import re
+import os
+from urllib.parse import urlsplit, urlunsplit
+
+DEFAULT_CACHE_PATH: str = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "cache", "web_cache.db")
+
+def normalize_query(query: str) -> str:
+    """
+    Normalizes a search query so trivially different spellings share a cache entry
+    Args:
+        query (str): The search query
+    Returns:
+        str: Lower-cased query with collapsed whitespace
+    """
+    return re.sub(r"\s+", " ", query).strip().lower()
+
+def normalize_url(url: str) -> str:
+    """
+    Normalizes a URL for use as a cache key
+    Args:
+        url (str): The web URL
+    Returns:
+        str: URL with lower-cased scheme and host, without fragment and trailing slash
+    """
+    parts = urlsplit(url.strip())
+    path = parts.path.rstrip("/") or "/"
+    return urlunsplit((parts.scheme.lower(), parts.netloc.lower(), path, parts.query, ""))
+
+class WebCache:
+    """
+    SQLite backed cache for web tool results, shared across sessions.
+    Entries are fresh for `ttl` seconds, then served stale for another `stale_ttl` seconds while
+    they are refreshed in the background. Least recently used entries are evicted beyond
+    `max_entries` rows or `max_bytes` of stored values, 0 keeps no entries.
+    """
+
+    def __init__(self, path: str = None, max_entries: int = None, max_bytes: int = None):
+        self.path = path or os.getenv("WEB_CACHE_PATH") or DEFAULT_CACHE_PATH
+        self.max_entries = max_entries if max_entries is not None else int(os.getenv("WEB_CACHE_MAX_ENTRIES", "5000"))
+        self.max_bytes = max_bytes if max_bytes is not None else int(float(os.getenv("WEB_CACHE_MAX_MB", "200")) * 1024 * 1024)
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        self.lock = threading.Lock()
+        self.refreshing: set = set()
+        self.conn = sqlite3.connect(self.path, check_same_thread=False)
+        with self.lock, self.conn:
+            self.conn.execute("PRAGMA journal_mode=WAL")
+            self.conn.execute(
+                "CREATE TABLE IF NOT EXISTS entries ("
+                "key TEXT PRIMARY KEY, tool TEXT NOT NULL, value TEXT NOT NULL, size INTEGER NOT NULL, "
+                "created_at REAL NOT NULL, accessed_at REAL NOT NULL)"
+            )
+            self.conn.execute("CREATE INDEX IF NOT EXISTS entries_accessed_at ON entries (accessed_at)")
+
+    @staticmethod
+    def make_key(tool: str, params: dict) -> str:
+        payload = json.dumps({"tool": tool, "params": params}, sort_keys=True)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def get(self, key: str):
+        """
+        Returns (value, age in seconds) of a cached entry or None
+        """
+        now = time.time()
+        with self.lock, self.conn:
+            row = self.conn.execute("SELECT value, created_at FROM entries WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            self.conn.execute("UPDATE entries SET accessed_at = ? WHERE key = ?", (now, key))
+        return json.loads(row[0]), now - row[1]
+
+    def set(self, tool: str, key: str, value) -> None:
+        data = json.dumps(value)
+        now = time.time()
+        with self.lock, self.conn:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO entries (key, tool, value, size, created_at, accessed_at) VALUES (?, ?, ?, ?, ?, ?)",
+                (key, tool, data, len(data), now, now)
+            )
+            self._evict()
+
+    def _evict(self) -> None:
+        count, total = self.conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM entries").fetchone()
+        if count <= self.max_entries and total <= self.max_bytes:
+            return
+        # Walk from the least recently used entry until both bounds hold again
+        to_delete = []
+        for key, size in self.conn.execute("SELECT key, size FROM entries ORDER BY accessed_at"):
+            if count <= self.max_entries and total <= self.max_bytes:
+                break
+            to_delete.append((key,))
+            count -= 1
+            total -= size
+        self.conn.executemany("DELETE FROM entries WHERE key = ?", to_delete)
+
+    def _refresh(self, tool: str, key: str, fetch) -> None:
+        with self.lock:
+            if key in self.refreshing:
+                return
+            self.refreshing.add(key)
+
+        def run():
+            try:
+                self.set(tool, key, fetch())
+            except Exception:
+                # The stale entry keeps being served and the next lookup tries again
+                pass
+            finally:
+                with self.lock:
+                    self.refreshing.discard(key)
+
+        threading.Thread(target=run, name="web-cache-refresh", daemon=True).start()
+
+    def lookup(self, tool: str, params: dict, ttl: float, stale_ttl: float = 0, refresh=None):
+        """
+        Returns a fresh or stale cached entry without fetching on a miss, so misses can be fetched together
+        Args:
+            tool (str): Name of the tool, part of the key
+            params (dict): Normalized parameters of the call, part of the key
+            ttl (float): Seconds an entry is fresh
+            stale_ttl (float): Extra seconds a stale entry is served while it is refreshed in the background
+            refresh (callable): Produces a fresh value for a stale entry, in a background thread
+        Returns:
+            tuple | None: (value, status) where status is "hit" or "stale", None on a miss
+        """
+        key = self.make_key(tool, params)
+        cached = self.get(key)
+        if cached is not None:
+            value, age = cached
+            if age <= ttl:
+                return value, "hit"
+            if age <= ttl + stale_ttl:
+                if refresh is not None:
+                    self._refresh(tool, key, refresh)
+                return value, "stale"
+        return None
+
+    def store(self, tool: str, params: dict, value) -> None:
+        self.set(tool, self.make_key(tool, params), value)
+
+    def cached(self, tool: str, params: dict, fetch, ttl: float, stale_ttl: float = 0):
+        """
+        Returns the cached result of `fetch` for the given tool and parameters, calling it on a miss
+        Args:
+            tool (str): Name of the tool, part of the key
+            params (dict): Normalized parameters of the call, part of the key
+            fetch (callable): Produces a fresh, JSON serializable value
+            ttl (float): Seconds an entry is fresh
+            stale_ttl (float): Extra seconds a stale entry is served while it is refreshed in the background
+        Returns:
+            tuple: (value, status) where status is "hit", "stale" or "miss"
+        """
+        found = self.lookup(tool, params, ttl, stale_ttl, refresh=fetch)
+        if found is not None:
+            return found
+        value = fetch()
+        self.store(tool, params, value)
+        return value, "miss"
+
+_web_cache = None
+_web_cache_lock = threading.Lock()
+
+def get_web_cache() -> WebCache:
+    """
+    Returns the process wide web cache, opening it on first use
+    """
+    global _web_cache
+    with _web_cache_lock:
+        if _web_cache is None:
+            _web_cache = WebCache()
+        return _web_cache
+
+def get_ttl(name: str, default: float) -> float:
+    return float(os.getenv(name, str(default)))